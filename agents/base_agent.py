@@ -1,39 +1,94 @@
 """Base agent class for LLM interactions."""
 
-import os
-from typing import Optional
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 import openai
 from dotenv import load_dotenv
+from utils.cassette import RecordingBackend
+from utils.client_pool import default_pool
+from utils.deadline import Deadline, DeadlineExceeded
+from utils.hooks import HookRegistry
+from utils.model_router import RoutingRecorder, estimate_cost
+from utils.resilience import CircuitOpenError, HedgingPolicy, get_circuit_breaker, hedged_call
+from utils.speculation import SpeculationCancelled
 
 # Load environment variables
 load_dotenv()
 
+# Errors that indicate an unhealthy upstream rather than a bad request
+UPSTREAM_ERRORS = (
+    openai.error.APIError,
+    openai.error.Timeout,
+    openai.error.RateLimitError,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+)
+
+# Sent after a response cut off at max_tokens, with the partial answer as the assistant turn
+CONTINUATION_PROMPT = (
+    "Your previous answer was cut off by the length limit. Continue exactly where "
+    "it stopped, without repeating anything or adding any commentary."
+)
+
+
+class StreamAbortedError(Exception):
+    """Reported as the error of a stream whose consumer stopped reading before it finished."""
+
 
 class BaseAgent:
     """Base class for all agents that interact with the LLM."""
     
-    def __init__(self, model: str = "gpt-3.5-turbo"):
+    AGENT_NAME = "agent"
+    
+    def __init__(self, model: str = "gpt-3.5-turbo", backend=None):
         """
         Initialize the base agent.
         
         Args:
             model: The OpenAI model to use (default: gpt-3.5-turbo)
+            backend: Object with an ``openai.ChatCompletion``-compatible
+                ``create`` method (default: the process-wide client pool over
+                the keys in OPENAI_API_KEYS or OPENAI_API_KEY)
+        
+        Raises:
+            ValueError: If no backend is given and no API key is configured
         """
         self.model = model
-        self.api_key = os.getenv("OPENAI_API_KEY")
-        if not self.api_key:
-            raise ValueError(
-                "OPENAI_API_KEY not found in environment variables. "
-                "Please set it in your .env file."
-            )
-        openai.api_key = self.api_key
+        # Keys are sent per call by the pool, never written to openai.api_key
+        self.backend = backend or default_pool()
+        self.hedging: Optional[HedgingPolicy] = None
+        self.fallback_models: List[str] = []
+        self.cascade: List[str] = [model]
+        self.router: Optional[RoutingRecorder] = None
+        self.hooks: Optional[HookRegistry] = None
+        # Follow-up requests allowed when a response is cut off at max_tokens
+        self.max_continuations = 2
+    
+    def enable_recording(self, recorder) -> RecordingBackend:
+        """
+        Record every call this agent makes to a cassette.
+        
+        Args:
+            recorder: Cassette path, or an existing RecordingBackend to share
+                one cassette between agents
+            
+        Returns:
+            The RecordingBackend now used as this agent's backend
+        """
+        if not isinstance(recorder, RecordingBackend):
+            recorder = RecordingBackend(self.backend, recorder)
+        self.backend = recorder
+        return recorder
     
     def call_model(
         self,
         prompt: str,
         max_tokens: int = 3000,
         temperature: float = 0.1,
-        system_message: Optional[str] = None
+        system_message: Optional[str] = None,
+        model: Optional[str] = None,
+        deadline: Optional[Deadline] = None
     ) -> str:
         """
         Call the OpenAI model with a prompt.
@@ -43,10 +98,161 @@ class BaseAgent:
             max_tokens: Maximum tokens to generate
             temperature: Sampling temperature (0.0-2.0)
             system_message: Optional system message for context
+            model: Model to use for this call (default: self.model)
+            deadline: End-to-end deadline; the call times out when it passes
+        
+        Returns:
+            The model's response text (continued if it was cut off at max_tokens)
+        """
+        messages = self._build_messages(prompt, system_message)
+        
+        text, _ = self._complete(
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            model=model,
+            deadline=deadline,
+        )
+        
+        return text
+    
+    def call_cascade(
+        self,
+        prompt: str,
+        accept: Callable[[str], Tuple[bool, str]],
+        max_tokens: int = 3000,
+        temperature: float = 0.1,
+        system_message: Optional[str] = None,
+        deadline: Optional[Deadline] = None
+    ) -> str:
+        """
+        Call the models in ``self.cascade`` in order until a response is accepted.
+        
+        The first (cheapest) model answers most calls; the next model is only
+        tried when ``accept`` rejects the response. The decision, latency and
+        estimated cost are recorded on ``self.router`` if one is set.
+        
+        Args:
+            prompt: The user prompt/message
+            accept: Function returning (accepted, reason) for a response text
+            max_tokens: Maximum tokens to generate
+            temperature: Sampling temperature (0.0-2.0)
+            system_message: Optional system message for context
+            deadline: End-to-end deadline; no escalation is attempted once it passes
+        
+        Returns:
+            The accepted response text (or the last model's response)
+        """
+        messages = self._build_messages(prompt, system_message)
+        decision = {
+            "agent": self.AGENT_NAME,
+            "models": [],
+            "escalated": False,
+            "reason": "",
+            "latency": 0.0,
+            "cost": 0.0,
+            "baseline_cost": None
+        }
+        
+        text = ""
+        for index, model in enumerate(self.cascade):
+            started = time.perf_counter()
+            text, usage = self._complete(
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                model=model,
+                deadline=deadline,
+            )
+            decision["latency"] += time.perf_counter() - started
+            decision["models"].append(model)
+            
+            prompt_tokens = usage["prompt_tokens"]
+            completion_tokens = usage["completion_tokens"]
+            cost = estimate_cost(model, prompt_tokens, completion_tokens)
+            decision["cost"] = None if cost is None or decision["cost"] is None else decision["cost"] + cost
+            if index == 0:
+                decision["baseline_cost"] = estimate_cost(self.cascade[-1], prompt_tokens, completion_tokens)
             
+            if index == len(self.cascade) - 1 or (deadline and deadline.expired()):
+                break
+            accepted, reason = accept(text)
+            if accepted:
+                break
+            decision["escalated"] = True
+            decision["reason"] = reason
+        
+        if self.router:
+            self.router.record(decision)
+        
+        return text
+    
+    def _complete(
+        self,
+        messages: List[dict],
+        max_tokens: int,
+        temperature: float,
+        model: Optional[str] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Tuple[str, Dict[str, int]]:
+        """
+        Send a chat request, continuing the answer while it is cut off at max_tokens.
+        
+        Each continuation resends the conversation with the text so far as the
+        assistant's turn and asks the model to carry on, so a story or judge
+        output that hits the limit is completed instead of regenerated.
+        
+        Args:
+            messages: Chat messages to send
+            max_tokens: Maximum tokens to generate per request
+            temperature: Sampling temperature (0.0-2.0)
+            model: Primary model for this request (default: self.model)
+            deadline: End-to-end deadline, passed on as the request timeout
+        
         Returns:
-            The model's response text
+            Tuple of (response text, token usage summed over all requests)
         """
+        text = ""
+        usage = {"prompt_tokens": 0, "completion_tokens": 0}
+        request_messages = messages
+        
+        for _ in range(self.max_continuations + 1):
+            resp = self._request(
+                messages=request_messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                model=model,
+                deadline=deadline,
+            )
+            choice = resp.choices[0]  # type: ignore
+            text += choice.message["content"] or ""
+            resp_usage = resp.get("usage") or {}
+            for key in usage:
+                usage[key] += resp_usage.get(key, 0)
+            
+            if choice.get("finish_reason") != "length":
+                break
+            request_messages = messages + [
+                {"role": "assistant", "content": text},
+                {"role": "user", "content": CONTINUATION_PROMPT}
+            ]
+        
+        return text, usage
+    
+    @staticmethod
+    def _estimate_stream_usage(messages: List[Dict], completion_chars: int) -> Dict:
+        """Estimate the usage of a stream (the API reports none) at about 4 characters per token."""
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        completion_tokens = completion_chars // 4
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "estimated": True
+        }
+    
+    def _build_messages(self, prompt: str, system_message: Optional[str]) -> List[dict]:
+        """Build the chat message list for a prompt."""
         messages = []
         
         if system_message:
@@ -54,13 +260,228 @@ class BaseAgent:
         
         messages.append({"role": "user", "content": prompt})
         
-        resp = openai.ChatCompletion.create(
-            model=self.model,
-            messages=messages,
-            stream=False,
-            max_tokens=max_tokens,
-            temperature=temperature,
-        )
+        return messages
+    
+    def _request(
+        self,
+        messages: List[dict],
+        max_tokens: int,
+        temperature: float,
+        model: Optional[str] = None,
+        deadline: Optional[Deadline] = None
+    ):
+        """
+        Send a chat request through the circuit breakers and hedging policy.
         
-        return resp.choices[0].message["content"]  # type: ignore
-
+        Models are tried in order (``model`` or ``self.model``, then ``fallback_models``).
+        A model whose circuit is open is skipped without a network call, and
+        an upstream error fails over to the next model.
+        
+        Args:
+            messages: Chat messages to send
+            max_tokens: Maximum tokens to generate
+            temperature: Sampling temperature (0.0-2.0)
+            model: Primary model for this request (default: self.model)
+            deadline: End-to-end deadline, passed on as the request timeout
+        
+        Returns:
+            The raw chat completion response
+        
+        Raises:
+            CircuitOpenError: If every model's circuit is open
+            DeadlineExceeded: If the deadline passes before a model answers
+        """
+        primary = model or self.model
+        last_error: Exception = CircuitOpenError(f"Circuit open for {primary}")
+        
+        for model in [primary] + [m for m in self.fallback_models if m != primary]:
+            # Checked before taking a half-open trial slot, which would otherwise never be released
+            timeout = {}
+            if deadline:
+                deadline.check(f"calling {model}")
+                timeout["request_timeout"] = deadline.remaining()
+            
+            breaker = get_circuit_breaker(model)
+            if not breaker.allow():
+                last_error = CircuitOpenError(f"Circuit open for {model}")
+                continue
+            
+            def send():
+                if self.hooks:
+                    self.hooks.emit("pre_call", agent=self.AGENT_NAME, model=model, messages=messages,
+                                    max_tokens=max_tokens, stream=False)
+                started = time.perf_counter()
+                try:
+                    resp = self.backend.create(
+                        model=model,
+                        messages=messages,
+                        stream=False,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        **timeout,
+                    )
+                except Exception as e:
+                    if self.hooks:
+                        self.hooks.emit("post_call", agent=self.AGENT_NAME, model=model, stream=False,
+                                        seconds=time.perf_counter() - started, response=None, error=e,
+                                        usage={}, truncated=False)
+                    raise
+                elapsed = time.perf_counter() - started
+                if self.hedging:
+                    self.hedging.tracker(model).record(elapsed)
+                if self.hooks:
+                    self.hooks.emit("post_call", agent=self.AGENT_NAME, model=model, stream=False,
+                                    seconds=elapsed, response=resp, error=None, usage=resp.get("usage") or {},
+                                    truncated=resp.choices[0].get("finish_reason") == "length")  # type: ignore
+                return resp
+            
+            try:
+                if self.hedging:
+                    self.hedging.count("calls")
+                    resp = hedged_call(send, self.hedging.hedge_delay(model), self.hedging)
+                else:
+                    resp = send()
+            except UPSTREAM_ERRORS as e:
+                breaker.record_failure()
+                last_error = e
+                continue
+            except Exception:
+                # The upstream answered (e.g. an invalid request), so it is healthy
+                breaker.record_success()
+                raise
+            
+            breaker.record_success()
+            return resp
+        
+        if deadline and deadline.expired():
+            raise DeadlineExceeded(f"Deadline exceeded calling {primary}") from last_error
+        raise last_error
+    
+    def call_model_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 3000,
+        temperature: float = 0.1,
+        system_message: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+        cancel: Optional[threading.Event] = None
+    ) -> Iterator[str]:
+        """
+        Call the OpenAI model and yield the response text as it streams in.
+        
+        Closing the returned generator early (e.g. breaking out of the loop)
+        stops reading the stream, which cancels the rest of the generation.
+        A response cut off at max_tokens is continued with follow-up streams
+        (up to ``max_continuations``).
+        
+        Args:
+            prompt: The user prompt/message
+            max_tokens: Maximum tokens to generate per stream
+            temperature: Sampling temperature (0.0-2.0)
+            system_message: Optional system message for context
+            deadline: End-to-end deadline; the stream stops when it passes
+            cancel: Event that stops the stream when set (e.g. by another thread)
+        
+        Yields:
+            Chunks of the model's response text
+            
+        Raises:
+            SpeculationCancelled: If the cancel event is set before the stream ends
+        """
+        messages = self._build_messages(prompt, system_message)
+        text = ""
+        
+        for _ in range(self.max_continuations + 1):
+            request_messages = messages
+            if text:
+                request_messages = messages + [
+                    {"role": "assistant", "content": text},
+                    {"role": "user", "content": CONTINUATION_PROMPT}
+                ]
+            finish: Dict[str, Optional[str]] = {}
+            for content in self._stream_once(request_messages, max_tokens, temperature, deadline, cancel, finish):
+                text += content
+                yield content
+            if finish.get("reason") != "length":
+                return
+    
+    def _stream_once(
+        self,
+        messages: List[dict],
+        max_tokens: int,
+        temperature: float,
+        deadline: Optional[Deadline],
+        cancel: Optional[threading.Event],
+        finish: Dict[str, Optional[str]]
+    ) -> Iterator[str]:
+        """Stream one response, storing its finish reason in ``finish["reason"]``."""
+        timeout = {}
+        if deadline:
+            deadline.check("streaming")
+            timeout["request_timeout"] = deadline.remaining()
+        
+        breaker = get_circuit_breaker(self.model)
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {self.model}")
+        verdict = False
+        
+        if self.hooks:
+            self.hooks.emit("pre_call", agent=self.AGENT_NAME, model=self.model, messages=messages,
+                            max_tokens=max_tokens, stream=True)
+        started = time.perf_counter()
+        error: Optional[BaseException] = None
+        stream = None
+        streamed_chars = 0
+        
+        try:
+            stream = self.backend.create(
+                model=self.model,
+                messages=messages,
+                stream=True,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                **timeout,
+            )
+            for chunk in stream:
+                if deadline:
+                    deadline.check("the stream finished")
+                if cancel is not None and cancel.is_set():
+                    raise SpeculationCancelled(f"Stream from {self.model} cancelled")
+                choice = chunk.choices[0]  # type: ignore
+                if choice.get("finish_reason"):
+                    finish["reason"] = choice["finish_reason"]
+                content = choice.delta.get("content")
+                if content:
+                    streamed_chars += len(content)
+                    yield content
+            breaker.record_success()
+            verdict = True
+        except UPSTREAM_ERRORS as e:
+            error = e
+            breaker.record_failure()
+            verdict = True
+            raise
+        except (DeadlineExceeded, SpeculationCancelled) as e:
+            # Stopped on our side: says nothing about the model's health
+            error = e
+            raise
+        except GeneratorExit:
+            # The consumer closed the generator early (e.g. a safety abort)
+            error = StreamAbortedError(f"Stream from {self.model} closed before it finished")
+            raise
+        except Exception as e:
+            # The upstream answered (e.g. an invalid request), so it is healthy
+            error = e
+            breaker.record_success()
+            verdict = True
+            raise
+        finally:
+            if not verdict:
+                breaker.release()
+            if stream is not None:
+                stream.close()  # type: ignore
+            if self.hooks:
+                self.hooks.emit("post_call", agent=self.AGENT_NAME, model=self.model, stream=True,
+                                seconds=time.perf_counter() - started, response=None, error=error,
+                                usage=self._estimate_stream_usage(messages, streamed_chars),
+                                truncated=finish.get("reason") == "length")
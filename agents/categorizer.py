@@ -1,13 +1,20 @@
 """Story categorizer agent that classifies story requests into types."""
 
-from typing import Dict, Tuple
+import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 from agents.base_agent import BaseAgent
 from prompts.prompt_templates import PromptTemplate
+from utils.deadline import Deadline
 
 
 class CategorizerAgent(BaseAgent):
     """Agent that categorizes story requests into specific types."""
     
+    AGENT_NAME = "categorizer"
+    
     CATEGORIES = {
         "ADVENTURE": {
             "description": "Stories about journeys, quests, exploration, discovery",
@@ -39,17 +46,22 @@ class CategorizerAgent(BaseAgent):
         }
     }
     
-    def __init__(self, model: str = "gpt-3.5-turbo"):
+    _NUMBERED_LINE = re.compile(r"^\W*(\d+)\s*[\].):-]\s*(.+)$")
+    
+    def __init__(self, model: str = "gpt-3.5-turbo", backend=None):
         """Initialize the categorizer agent."""
-        super().__init__(model)
+        super().__init__(model, backend)
         self.temperature = 0.3  # Lower temperature for more consistent categorization
+        self.batch_stats = {"requests": 0, "classified": 0, "fallbacks": 0}
+        self._batch_stats_lock = threading.Lock()
     
-    def categorize(self, user_request: str) -> Tuple[str, str]:
+    def categorize(self, user_request: str, deadline: Optional[Deadline] = None) -> Tuple[str, str]:
         """
         Categorize a story request.
         
         Args:
             user_request: The user's story request text
+            deadline: End-to-end deadline for the LLM call
             
         Returns:
             Tuple of (category_name, explanation)
@@ -60,10 +72,17 @@ class CategorizerAgent(BaseAgent):
             variables={"user_request": user_request}
         )
         
-        response = self.call_model(
+        # Escalate to the next model in the cascade only when the response
+        # names no category and parsing would fall back to MIXED
+        response = self.call_cascade(
             prompt=prompt,
+            accept=lambda text: (
+                self._match_category(text.strip()) is not None,
+                "no category in response"
+            ),
             max_tokens=200,
-            temperature=self.temperature
+            temperature=self.temperature,
+            deadline=deadline
         )
         
         # Parse the response to extract category and explanation
@@ -71,6 +90,161 @@ class CategorizerAgent(BaseAgent):
         
         return category, explanation
     
+    def categorize_many(
+        self,
+        user_requests: List[str],
+        batch_size: int = 25,
+        max_workers: int = 4,
+        deadline: Optional[Deadline] = None
+    ) -> List[Tuple[str, str]]:
+        """
+        Categorize many story requests with a few batched LLM calls.
+        
+        Requests are deduplicated, numbered and sent ``batch_size`` at a time,
+        with batches running concurrently. Answers are mapped back by number
+        (or by position when the model drops the numbers); any request whose
+        answer is missing or names no category is categorized on its own.
+        
+        Args:
+            user_requests: The users' story request texts
+            batch_size: Requests per LLM call
+            max_workers: Batches to run concurrently
+            deadline: End-to-end deadline for the LLM calls
+            
+        Returns:
+            List of (category_name, explanation) tuples, in input order
+        """
+        unique = list(dict.fromkeys(user_requests))
+        batches = [unique[i:i + batch_size] for i in range(0, len(unique), batch_size)]
+        
+        results: Dict[str, Tuple[str, str]] = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches) or 1))) as executor:
+            for batch_results in executor.map(lambda batch: self._categorize_batch(batch, deadline), batches):
+                results.update(batch_results)
+        
+        return [results[request] for request in user_requests]
+    
+    def _categorize_batch(self, batch: List[str], deadline: Optional[Deadline] = None) -> Dict[str, Tuple[str, str]]:
+        """
+        Categorize one batch of requests, falling back to single calls for unmapped answers.
+        
+        Args:
+            batch: Unique request texts
+            deadline: End-to-end deadline for the LLM calls
+            
+        Returns:
+            Dictionary mapping each request text to (category_name, explanation)
+        """
+        if len(batch) == 1:
+            return {batch[0]: self.categorize(batch[0], deadline=deadline)}
+        
+        numbered = "\n".join(f"{n}. {' '.join(request.split())}" for n, request in enumerate(batch, 1))
+        prompt = PromptTemplate.format_prompt(
+            PromptTemplate.create_batch_categorization_prompt_base(),
+            variables={"requests": numbered}
+        )
+        response = self.call_model(
+            prompt=prompt,
+            max_tokens=60 * len(batch),
+            temperature=self.temperature,
+            model=self.cascade[0],
+            deadline=deadline
+        )
+        self._count("requests")
+        
+        answers = self._parse_batch_response(response, len(batch))
+        results = {}
+        for n, request in enumerate(batch, 1):
+            match = self._match_category(answers[n]) if n in answers else None
+            if match:
+                self._count("classified")
+                category, explanation = match
+                if not explanation or len(explanation) < 10:
+                    explanation = f"This story request fits the {category} category."
+                results[request] = (category, explanation)
+            else:
+                self._count("fallbacks")
+                results[request] = self.categorize(request, deadline=deadline)
+        return results
+    
+    def _count(self, stat: str, amount: int = 1):
+        """Add to a batch_stats counter; batches run on several threads."""
+        with self._batch_stats_lock:
+            self.batch_stats[stat] += amount
+    
+    def _parse_batch_response(self, response: str, count: int) -> Dict[int, str]:
+        """
+        Map a batch categorization response back to request numbers.
+        
+        Accepts numbered lines ("3. ANIMALS - ..."), a JSON list of objects
+        with "id"/"number" and "category"/"explanation" keys, or exactly
+        ``count`` unnumbered lines in request order.
+        
+        Args:
+            response: Raw response from the LLM
+            count: Number of requests in the batch
+            
+        Returns:
+            Dictionary mapping request number (1-based) to its answer text
+        """
+        response = response.strip()
+        answers: Dict[int, str] = {}
+        
+        if response.startswith("[") or response.startswith("```"):
+            try:
+                items = json.loads(re.sub(r"^json", "", response.strip("`")).strip())
+                for position, item in enumerate(items, 1):
+                    number = int(item.get("id", item.get("number", position)))
+                    if 1 <= number <= count and number not in answers:
+                        answers[number] = f"{item.get('category', '')} - {item.get('explanation', '')}"
+                return answers
+            except (ValueError, TypeError, AttributeError):
+                pass
+        
+        lines = [line.strip() for line in response.split("\n") if line.strip()]
+        for line in lines:
+            match = self._NUMBERED_LINE.match(line)
+            if match:
+                number = int(match.group(1))
+                if 1 <= number <= count and number not in answers:
+                    answers[number] = match.group(2).strip()
+        
+        if not answers and len(lines) == count:
+            answers = {n: line for n, line in enumerate(lines, 1)}
+        
+        return answers
+    
+    def categorize_locally(self, user_request: str) -> Tuple[str, str]:
+        """
+        Categorize a request from category keywords, without an LLM call.
+        
+        Used when there is no time (or no need) for the LLM categorizer.
+        
+        Args:
+            user_request: The user's story request text
+            
+        Returns:
+            Tuple of (category_name, explanation)
+        """
+        words = re.findall(r"[a-z]+", user_request.lower())
+        hits = {}
+        for cat, info in self.CATEGORIES.items():
+            count = sum(
+                1 for word in words
+                if any(word.startswith(keyword) for keyword in info["keywords"])
+            )
+            if count:
+                hits[cat] = count
+        
+        if not hits:
+            return "MIXED", "No category keywords found. Defaulting to MIXED."
+        
+        best = max(hits.values())
+        top = [cat for cat, count in hits.items() if count == best]
+        if len(top) > 1:
+            return "MIXED", f"Keywords match several categories: {', '.join(top)}."
+        return top[0], f"Matched {top[0]} keywords in the request."
+    
     def _parse_response(self, response: str) -> Tuple[str, str]:
         """
         Parse the LLM response to extract category and explanation.
@@ -84,30 +258,12 @@ class CategorizerAgent(BaseAgent):
         # Clean up the response
         response = response.strip()
         
-        # Try to find a category name (uppercase, matches one of our categories)
-        category = None
-        explanation = response
-        
-        # Check if response starts with a category name
-        for cat in self.CATEGORIES.keys():
-            if response.upper().startswith(cat):
-                category = cat
-                # Extract explanation (everything after the category)
-                explanation = response[len(cat):].strip()
-                # Remove common prefixes/suffixes
-                explanation = explanation.lstrip(":-").strip()
-                break
-        
-        # If no category found, try to extract it from the response
-        if not category:
-            # Look for category mentioned in the response
-            for cat in self.CATEGORIES.keys():
-                if cat in response.upper():
-                    category = cat
-                    break
+        match = self._match_category(response)
         
         # Default to MIXED if we can't determine
-        if not category:
+        if match:
+            category, explanation = match
+        else:
             category = "MIXED"
             explanation = "Could not determine specific category. Defaulting to MIXED."
         
@@ -117,6 +273,32 @@ class CategorizerAgent(BaseAgent):
         
         return category, explanation
     
+    def _match_category(self, response: str) -> Optional[Tuple[str, str]]:
+        """
+        Find the category named in a response.
+        
+        Args:
+            response: Stripped response from the LLM
+            
+        Returns:
+            Tuple of (category_name, explanation), or None if no category is named
+        """
+        # Check if response starts with a category name
+        for cat in self.CATEGORIES.keys():
+            if response.upper().startswith(cat):
+                # Extract explanation (everything after the category)
+                explanation = response[len(cat):].strip()
+                # Remove common prefixes/suffixes
+                explanation = explanation.lstrip(":-").strip()
+                return cat, explanation
+        
+        # Look for category mentioned in the response
+        for cat in self.CATEGORIES.keys():
+            if cat in response.upper():
+                return cat, response
+        
+        return None
+    
     def get_category_info(self, category: str) -> Dict:
         """
         Get information about a specific category.
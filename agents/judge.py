@@ -1,14 +1,21 @@
 """Judge agent that evaluates story quality and provides feedback."""
 
-from typing import Dict, List, Optional
+import contextvars
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 from agents.base_agent import BaseAgent
 from prompts.prompt_templates import PromptTemplate
+from utils.deadline import Deadline
 from utils.story_arcs import get_age_guidelines
 
 
 class JudgeAgent(BaseAgent):
     """Agent that evaluates stories on multiple dimensions and provides feedback."""
     
+    AGENT_NAME = "judge"
+    
     EVALUATION_DIMENSIONS = [
         "Age-appropriateness",
         "Narrative coherence",
@@ -17,21 +24,81 @@ class JudgeAgent(BaseAgent):
         "Educational/moral value"
     ]
     
-    def __init__(self, model: str = "gpt-3.5-turbo"):
+    # Focused rubric per dimension, used when dimensions are judged on their own
+    DIMENSION_RUBRICS = {
+        "Age-appropriateness": (
+            "Vocabulary, sentence length and themes suit ages 5-10; nothing scary, "
+            "violent or confusing; gentle and calming enough for bedtime."
+        ),
+        "Narrative coherence": (
+            "Clear beginning, middle and end; events follow logically; the problem "
+            "set up in the story is resolved."
+        ),
+        "Character development": (
+            "Characters are distinct and relatable, have clear feelings and motives, "
+            "and change or learn something."
+        ),
+        "Engagement level": (
+            "Holds a young listener's attention with vivid images, gentle suspense, "
+            "dialogue or humor, and a pleasing rhythm when read aloud."
+        ),
+        "Educational/moral value": (
+            "Carries a positive lesson or value that arises naturally from the story "
+            "rather than being lectured."
+        )
+    }
+    
+    # Words in a requested change that point at the dimensions it can affect;
+    # Age-appropriateness is always re-checked
+    CHANGE_KEYWORDS = {
+        "Character development": [
+            "character", "name", "friend", "brave", "kind", "shy", "personality",
+            "hero", "sister", "brother", "mom", "dad", "grandma", "grandpa", "pet"
+        ],
+        "Narrative coherence": [
+            "ending", "end", "begin", "start", "plot", "happen", "instead", "twist",
+            "scene", "order", "middle"
+        ],
+        "Engagement level": [
+            "funny", "funnier", "silly", "exciting", "excitement", "action", "dialogue",
+            "suspense", "shorter", "longer", "boring"
+        ],
+        "Educational/moral value": [
+            "lesson", "moral", "learn", "teach", "sharing", "kindness", "honest", "value"
+        ]
+    }
+    
+    # Rough completion length of one story's evaluation, used to pack batches
+    EVALUATION_TOKENS = 400
+    _SECTION_PATTERN = re.compile(r"^\W*=+\s*STORY\s+(\d+)\s*=+\W*$", re.IGNORECASE | re.MULTILINE)
+    
+    def __init__(self, model: str = "gpt-3.5-turbo", backend=None):
         """Initialize the judge agent."""
-        super().__init__(model)
+        super().__init__(model, backend)
         self.temperature = 0.2  # Low temperature for consistent, reasoned evaluations
+        # With a model cascade, escalate when the score is this close to the threshold
+        self.escalation_threshold = 7.0
+        self.escalation_margin = 0.75
+        self.batch_stats = {"requests": 0, "stories": 0, "fallbacks": 0}
+        self._batch_stats_lock = threading.Lock()
+        # Judge dimension groups in concurrent short calls instead of one long one
+        self.parallel_dimensions = False
+        self.dimension_groups: List[List[str]] = [[name] for name in self.EVALUATION_DIMENSIONS]
     
-    def evaluate_story(self, story: str) -> Dict:
+    def evaluate_story(self, story: str, deadline: Optional[Deadline] = None) -> Dict:
         """
         Evaluate a story on multiple dimensions.
         
         Args:
             story: The story text to evaluate
+            deadline: End-to-end deadline for the LLM call
             
         Returns:
             Dictionary containing scores, reasoning, and suggestions for each dimension
         """
+        if self.parallel_dimensions:
+            return self.evaluate_parallel(story, deadline=deadline)
+        
         prompt_base = PromptTemplate.create_evaluation_prompt_base()
         prompt = PromptTemplate.format_prompt(
             prompt_base,
@@ -41,17 +108,345 @@ class JudgeAgent(BaseAgent):
             }
         )
         
-        response = self.call_model(
+        parsed = {}
+        
+        def accept(text: str):
+            parsed[text] = self._parse_evaluation(text, story)
+            return self._is_decisive(parsed[text])
+        
+        response = self.call_cascade(
             prompt=prompt,
+            accept=accept,
             max_tokens=1500,
-            temperature=self.temperature
+            temperature=self.temperature,
+            deadline=deadline
         )
         
         # Parse the structured response
-        evaluation = self._parse_evaluation(response, story)
+        evaluation = parsed.get(response) or self._parse_evaluation(response, story)
         
         return evaluation
     
+    def evaluate_scores_only(self, story: str, deadline: Optional[Deadline] = None) -> Dict:
+        """
+        Evaluate a story with a short prompt that asks for scores only.
+        
+        Skips the age guidelines, reasoning and suggestions, so the call
+        costs a fraction of evaluate_story's tokens. Used when the token
+        budget runs low and no refinement will follow.
+        
+        Args:
+            story: The story text to evaluate
+            deadline: End-to-end deadline for the LLM call
+            
+        Returns:
+            Evaluation dictionary in the same shape as evaluate_story, with
+            empty reasoning and suggestions
+        """
+        prompt = PromptTemplate.format_prompt(
+            PromptTemplate.create_scores_only_evaluation_prompt_base(),
+            variables={"story": story}
+        )
+        response = self.call_model(
+            prompt=prompt,
+            max_tokens=20 * len(self.EVALUATION_DIMENSIONS),
+            temperature=self.temperature,
+            deadline=deadline
+        )
+        return self._parse_evaluation(response, story)
+    
+    def dimensions_for_change(self, modification: str) -> List[str]:
+        """
+        Pick the evaluation dimensions a requested change can affect.
+        
+        Args:
+            modification: The change the user asked for
+            
+        Returns:
+            Dimension names, always including Age-appropriateness (and
+            Narrative coherence when nothing more specific matches)
+        """
+        words = re.findall(r"[a-z]+", modification.lower())
+        affected = [
+            dimension for dimension, keywords in self.CHANGE_KEYWORDS.items()
+            if any(word.startswith(keyword) for word in words for keyword in keywords)
+        ]
+        if not affected:
+            affected = ["Narrative coherence"]
+        return ["Age-appropriateness"] + [d for d in self.EVALUATION_DIMENSIONS if d in affected]
+    
+    def evaluate_dimensions(
+        self,
+        story: str,
+        dimensions: List[str],
+        previous: Optional[Dict] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Dict:
+        """
+        Re-evaluate only some dimensions of a story.
+        
+        Scores for the other dimensions are carried over from ``previous``
+        (its dimension names are matched to EVALUATION_DIMENSIONS regardless
+        of casing or punctuation). The overall score and key improvements are
+        recomputed from the merged dimensions, and the overall assessment is
+        the new response's, since the old one described another story.
+        
+        Args:
+            story: The story text to evaluate
+            dimensions: Names of the dimensions to evaluate
+            previous: Earlier evaluation of (a version of) the story
+            deadline: End-to-end deadline for the LLM call
+            
+        Returns:
+            Evaluation dictionary in the same shape as evaluate_story
+        """
+        prompt = PromptTemplate.format_prompt(
+            PromptTemplate.create_dimension_evaluation_prompt_base(),
+            variables={
+                "guidelines": get_age_guidelines(),
+                "story": story,
+                "dimensions": "\n".join(
+                    f"{n}. {name} (1-10): {self.DIMENSION_RUBRICS.get(name, '')}".rstrip(": ")
+                    for n, name in enumerate(dimensions, 1)
+                )
+            }
+        )
+        response = self.call_model(
+            prompt=prompt,
+            max_tokens=150 * len(dimensions),
+            temperature=self.temperature,
+            deadline=deadline
+        )
+        parsed = self._parse_evaluation(response, story)
+        by_name = {
+            self.canonical_dimension(name) or name.lower(): data for name, data in parsed["dimensions"].items()
+        }
+        
+        merged = {
+            self.canonical_dimension(name) or name: dict(data)
+            for name, data in (previous or {}).get("dimensions", {}).items()
+        }
+        for name in dimensions:
+            data = by_name.get(self.canonical_dimension(name) or name.lower())
+            if data and data["score"] is not None:
+                merged[self.canonical_dimension(name) or name] = data
+        
+        scores = [d["score"] for d in merged.values() if d["score"] is not None]
+        return {
+            "dimensions": merged,
+            "overall_score": sum(scores) / len(scores) if scores else 0.0,
+            "overall_assessment": parsed["overall_assessment"],
+            "key_improvements": self._weak_dimension_suggestions(merged),
+            "raw_response": response
+        }
+    
+    @classmethod
+    def canonical_dimension(cls, name: str) -> Optional[str]:
+        """
+        Match a dimension name as the model wrote it to EVALUATION_DIMENSIONS.
+        
+        Args:
+            name: Dimension name, e.g. "Age-Appropriateness" or "engagement level"
+            
+        Returns:
+            The EVALUATION_DIMENSIONS entry, or None if the name is not one of them
+        """
+        return _CANONICAL_DIMENSIONS.get(_dimension_key(name))
+    
+    @staticmethod
+    def _weak_dimension_suggestions(dimensions: Dict[str, Dict]) -> List[str]:
+        """Return the suggestions of dimensions scoring below 8, prefixed with the dimension."""
+        return [
+            f"{name}: {suggestion}" for name, d in dimensions.items()
+            if d["score"] is not None and d["score"] < 8
+            for suggestion in d["suggestions"]
+        ]
+    
+    def evaluate_parallel(
+        self,
+        story: str,
+        groups: Optional[List[List[str]]] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Dict:
+        """
+        Evaluate a story with one concurrent short call per dimension group.
+        
+        Each call decodes only its group's scores and reasoning against a
+        focused rubric, so judge latency approaches the slowest group rather
+        than the sum of all dimensions.
+        
+        Args:
+            story: The story text to evaluate
+            groups: Dimension groups, one call each (default: dimension_groups)
+            deadline: End-to-end deadline for the LLM calls
+            
+        Returns:
+            Evaluation dictionary in the same shape as evaluate_story, with
+            dimensions in EVALUATION_DIMENSIONS order and the group responses
+            joined in "raw_response"
+        """
+        groups = groups or self.dimension_groups
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, self.evaluate_dimensions, story, group, deadline=deadline)
+                for group in groups
+            ]
+            results = [future.result() for future in futures]
+        
+        merged = {}
+        for result in results:
+            merged.update(result["dimensions"])
+        order = {name: index for index, name in enumerate(self.EVALUATION_DIMENSIONS)}
+        dimensions = dict(sorted(merged.items(), key=lambda item: order.get(item[0], len(order))))
+        scores = [d["score"] for d in dimensions.values() if d["score"] is not None]
+        
+        # No single call sees the whole story verdict, so lift the weak dimensions' suggestions
+        return {
+            "dimensions": dimensions,
+            "overall_score": sum(scores) / len(scores) if scores else 0.0,
+            "overall_assessment": "",
+            "key_improvements": self._weak_dimension_suggestions(dimensions),
+            "raw_response": "\n\n".join(result["raw_response"] for result in results)
+        }
+    
+    def evaluate_many(
+        self,
+        stories: List[str],
+        token_budget: int = 8000,
+        deadline: Optional[Deadline] = None
+    ) -> List[Dict]:
+        """
+        Evaluate several stories, packing as many as fit into each request.
+        
+        The guidelines and evaluation instructions are sent once per batch
+        instead of once per story. Stories whose section of the response is
+        missing or incomplete (or not decisive, when a model cascade is set)
+        are evaluated again on their own with evaluate_story.
+        
+        Args:
+            stories: The story texts to evaluate
+            token_budget: Estimated prompt plus completion tokens per request
+            deadline: End-to-end deadline for the LLM calls
+            
+        Returns:
+            One evaluation dictionary per story, in input order
+        """
+        evaluations: List[Optional[Dict]] = [None] * len(stories)
+        
+        for batch in self._pack_batches(stories, token_budget):
+            if len(batch) == 1:
+                evaluations[batch[0]] = self.evaluate_story(stories[batch[0]], deadline=deadline)
+                continue
+            
+            sections = "\n\n".join(
+                f"=== STORY {n} ===\n{stories[index]}" for n, index in enumerate(batch, 1)
+            )
+            prompt = PromptTemplate.format_prompt(
+                PromptTemplate.create_batch_evaluation_prompt_base(),
+                variables={
+                    "guidelines": get_age_guidelines(),
+                    "stories": sections
+                }
+            )
+            response = self.call_model(
+                prompt=prompt,
+                max_tokens=self.EVALUATION_TOKENS * len(batch),
+                temperature=self.temperature,
+                model=self.cascade[0],
+                deadline=deadline
+            )
+            self._count("requests")
+            self._count("stories", len(batch))
+            
+            parsed = self._split_sections(response)
+            for n, index in enumerate(batch, 1):
+                evaluation = self._parse_evaluation(parsed[n], stories[index]) if n in parsed else None
+                if evaluation is not None:
+                    decisive, reason = self._is_decisive(evaluation)
+                    if not decisive and (reason == "missing dimension scores" or len(self.cascade) > 1):
+                        evaluation = None
+                if evaluation is None:
+                    self._count("fallbacks")
+                    evaluation = self.evaluate_story(stories[index], deadline=deadline)
+                evaluations[index] = evaluation
+        
+        return evaluations  # type: ignore
+    
+    def _pack_batches(self, stories: List[str], token_budget: int) -> List[List[int]]:
+        """
+        Group story indices so each batch's estimated tokens fit the budget.
+        
+        Args:
+            stories: The story texts to evaluate
+            token_budget: Estimated prompt plus completion tokens per request
+            
+        Returns:
+            List of batches of story indices (a story too large to share a
+            request gets a batch of its own)
+        """
+        overhead = self._estimate_tokens(
+            PromptTemplate.create_batch_evaluation_prompt_base() + get_age_guidelines()
+        )
+        batches: List[List[int]] = []
+        current: List[int] = []
+        used = overhead
+        
+        for index, story in enumerate(stories):
+            cost = self._estimate_tokens(story) + self.EVALUATION_TOKENS
+            if current and used + cost > token_budget:
+                batches.append(current)
+                current, used = [], overhead
+            current.append(index)
+            used += cost
+        
+        if current:
+            batches.append(current)
+        return batches
+    
+    def _count(self, stat: str, amount: int = 1):
+        """Add to a batch_stats counter; batches run on several threads."""
+        with self._batch_stats_lock:
+            self.batch_stats[stat] += amount
+    
+    def _split_sections(self, response: str) -> Dict[int, str]:
+        """
+        Split a batch evaluation response into per-story sections.
+        
+        Args:
+            response: Raw batch evaluation response from the LLM
+            
+        Returns:
+            Dictionary mapping story number (1-based) to its section text
+        """
+        headers = list(self._SECTION_PATTERN.finditer(response))
+        sections = {}
+        for i, header in enumerate(headers):
+            end = headers[i + 1].start() if i + 1 < len(headers) else len(response)
+            sections.setdefault(int(header.group(1)), response[header.end():end].strip())
+        return sections
+    
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        """Estimate the token count of a text (about 4 characters per token)."""
+        return len(text) // 4 + 1
+    
+    def _is_decisive(self, evaluation: Dict) -> Tuple[bool, str]:
+        """
+        Check whether an evaluation is clear enough to skip escalation.
+        
+        Args:
+            evaluation: Parsed evaluation dictionary
+            
+        Returns:
+            Tuple of (decisive, reason)
+        """
+        scored = [d for d in evaluation["dimensions"].values() if d["score"] is not None]
+        if len(scored) < len(self.EVALUATION_DIMENSIONS):
+            return False, "missing dimension scores"
+        if abs(evaluation["overall_score"] - self.escalation_threshold) < self.escalation_margin:
+            return False, "score near threshold"
+        return True, ""
+    
     def _parse_evaluation(self, response: str, story: str) -> Dict:
         """
         Parse the judge's evaluation response into structured data.
@@ -210,3 +605,10 @@ class JudgeAgent(BaseAgent):
         
         return instructions
 
+
+def _dimension_key(name: str) -> str:
+    """Reduce a dimension name to lowercase letters and digits for matching."""
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+
+_CANONICAL_DIMENSIONS = {_dimension_key(name): name for name in JudgeAgent.EVALUATION_DIMENSIONS}
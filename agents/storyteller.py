@@ -1,14 +1,25 @@
 """Storyteller agent that generates age-appropriate bedtime stories."""
 
-from typing import Optional, Dict
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List, Tuple
 from agents.base_agent import BaseAgent
 from prompts.prompt_templates import PromptTemplate
+from utils.content_safety import ContentSafetyFilter, UnsafeContentError
+from utils.deadline import Deadline, DeadlineExceeded
 from utils.story_arcs import StoryArc, get_age_guidelines
+from utils.story_patches import (
+    PatchError, apply_patches, join_paragraphs, number_paragraphs, parse_patch_response, split_paragraphs
+)
 
 
 class StorytellerAgent(BaseAgent):
     """Agent that generates engaging bedtime stories for children ages 5-10."""
     
+    AGENT_NAME = "storyteller"
+    MIN_STORY_WORDS = 300
+    
     # Category-specific story examples (few-shot learning)
     CATEGORY_EXAMPLES = {
         "ADVENTURE": """Example Adventure Story (excerpt):
@@ -61,9 +72,9 @@ Curious, Emma opened the door and found herself in a magical forest where animal
 Emma used her problem-solving skills from school and her kindness to help the forest creatures. She organized a plan to show the magic to other children, proving that everyday life can be full of wonder if you look for it. The forest's magic grew stronger, and Emma learned that adventure and friendship can be found anywhere."""
     }
     
-    def __init__(self, model: str = "gpt-3.5-turbo"):
+    def __init__(self, model: str = "gpt-3.5-turbo", backend=None):
         """Initialize the storyteller agent."""
-        super().__init__(model)
+        super().__init__(model, backend)
         self.temperature = 0.8  # Higher temperature for more creative storytelling
     
     def generate_story(
@@ -71,7 +82,11 @@ Emma used her problem-solving skills from school and her kindness to help the fo
         user_request: str,
         category: str = "MIXED",
         use_story_arc: bool = True,
-        arc_type: str = "three_act"
+        arc_type: str = "three_act",
+        safety_filter: Optional[ContentSafetyFilter] = None,
+        max_safety_retries: int = 2,
+        deadline: Optional[Deadline] = None,
+        cancel: Optional[threading.Event] = None
     ) -> str:
         """
         Generate a bedtime story based on the user request.
@@ -81,9 +96,19 @@ Emma used her problem-solving skills from school and her kindness to help the fo
             category: The story category (from categorizer)
             use_story_arc: Whether to use structured story arc guidance
             arc_type: Type of story arc ("three_act" or "five_part")
+            safety_filter: If given, stream the story through this filter and
+                abort and regenerate as soon as a hard violation appears
+            max_safety_retries: Regenerations allowed after unsafe output
+            deadline: End-to-end deadline for the LLM calls
+            cancel: If given, the story is streamed (without cascade
+                escalation) and generation stops as soon as the event is set
             
         Returns:
             The generated story text
+            
+        Raises:
+            UnsafeContentError: If every attempt produced unsafe content
+            SpeculationCancelled: If the cancel event was set
         """
         # Build the base prompt
         base_prompt = PromptTemplate.create_story_prompt_base()
@@ -115,15 +140,407 @@ Emma used her problem-solving skills from school and her kindness to help the fo
         category_instruction += f"Please create a story that fits this category: {self._get_category_description(category)}\n"
         prompt += category_instruction
         
-        # Generate the story
-        story = self.call_model(
+        if safety_filter:
+            return self._generate_safe_story(prompt, safety_filter, max_safety_retries, deadline, cancel)
+        
+        if cancel is not None:
+            stream = self.call_model_stream(
+                prompt=prompt,
+                max_tokens=2000,
+                temperature=self.temperature,
+                deadline=deadline,
+                cancel=cancel
+            )
+            return "".join(stream).strip()
+        
+        # Generate the story (a model cascade escalates only on a stub story)
+        story = self.call_cascade(
             prompt=prompt,
+            accept=lambda text: (len(text.split()) >= self.MIN_STORY_WORDS, "story too short"),
             max_tokens=2000,
-            temperature=self.temperature
+            temperature=self.temperature,
+            deadline=deadline
         )
         
         return story.strip()
     
+    def _generate_safe_story(
+        self,
+        prompt: str,
+        safety_filter: ContentSafetyFilter,
+        max_retries: int,
+        deadline: Optional[Deadline] = None,
+        cancel: Optional[threading.Event] = None,
+        max_tokens: int = 2000,
+        avoided: Optional[List[str]] = None
+    ) -> str:
+        """
+        Stream a story through the safety filter, regenerating on violations.
+        
+        Args:
+            prompt: The fully formatted story prompt
+            safety_filter: Filter to check streamed text against
+            max_retries: Regenerations allowed after unsafe output
+            deadline: End-to-end deadline for the LLM calls
+            cancel: Event that stops generation when set
+            max_tokens: Maximum tokens per attempt
+            avoided: Terms an earlier check rejected, named in every attempt's prompt
+            
+        Returns:
+            The generated story text
+            
+        Raises:
+            UnsafeContentError: If every attempt produced unsafe content
+        """
+        avoided = list(avoided or [])
+        violation = None
+        
+        for _ in range(max_retries + 1):
+            attempt_prompt = prompt
+            if avoided:
+                attempt_prompt += (
+                    "\nIMPORTANT: A previous attempt was rejected as unsuitable for "
+                    "young children. Do not mention or describe: "
+                    + "; ".join(avoided) + "\n"
+                )
+            
+            scanner = safety_filter.stream()
+            chunks = []
+            stream = self.call_model_stream(
+                prompt=attempt_prompt,
+                max_tokens=max_tokens,
+                temperature=self.temperature,
+                deadline=deadline,
+                cancel=cancel
+            )
+            violation = None
+            try:
+                for chunk in stream:
+                    chunks.append(chunk)
+                    violation = scanner.feed(chunk)
+                    if violation:
+                        break
+            finally:
+                stream.close()
+            
+            if not violation:
+                violation = scanner.finish()
+            if not violation:
+                return "".join(chunks).strip()
+            
+            avoided.append(f"{violation.term} ({violation.theme.lower()})")
+        
+        raise UnsafeContentError(violation)
+    
+    def generate_story_by_acts(
+        self,
+        user_request: str,
+        category: str = "MIXED",
+        arc_type: str = "three_act",
+        target_words: int = 750,
+        continuity_pass: bool = True,
+        deadline: Optional[Deadline] = None,
+        safety_filter: Optional[ContentSafetyFilter] = None,
+        max_safety_retries: int = 2
+    ) -> str:
+        """
+        Generate a story by writing each arc part concurrently from a shared outline.
+        
+        A short outline is generated first so every part knows the characters
+        and plot. The parts are then written in parallel, each with its own arc
+        guidance and word budget, so latency scales with the longest part
+        rather than the whole story. An optional continuity pass rewrites the
+        paragraphs on either side of each seam so the parts read as one story.
+        
+        Args:
+            user_request: The user's story request
+            category: The story category (from categorizer)
+            arc_type: Type of story arc ("three_act" or "five_part")
+            target_words: Target length of the whole story in words
+            continuity_pass: Whether to smooth the transitions between parts
+            deadline: End-to-end deadline for the LLM calls
+            safety_filter: If given, stream each part through this filter and
+                abort and regenerate that part as soon as a hard violation
+                appears; rewritten seams that turn unsafe are not used, and the
+                two parts around a join that forms an unsafe term are regenerated
+            max_safety_retries: Regenerations allowed per part after unsafe
+                output, and for the parts around unsafe joins
+            
+        Returns:
+            The generated story text
+            
+        Raises:
+            UnsafeContentError: If every attempt at a part, or at an unsafe
+                join, produced unsafe content
+        """
+        parts = StoryArc.get_part_budgets(arc_type, target_words)
+        outline = self._generate_outline(user_request, category, parts, deadline)
+        
+        with ThreadPoolExecutor(max_workers=len(parts)) as executor:
+            futures = [
+                executor.submit(
+                    contextvars.copy_context().run,
+                    self._generate_part, user_request, category, outline, parts, index, deadline,
+                    safety_filter, max_safety_retries
+                )
+                for index in range(len(parts))
+            ]
+            acts = [future.result() for future in futures]
+        
+        if continuity_pass and len(acts) > 1:
+            acts = self._smooth_transitions(acts, deadline, safety_filter)
+        
+        story = join_paragraphs(acts)
+        if not safety_filter:
+            return story
+        
+        # Parts and seams are checked on their own, so a violation here spans
+        # a join; rewrite the two parts on either side of it
+        avoided = []
+        violation = safety_filter.first_hard_violation(story)
+        for _ in range(max_safety_retries):
+            if not violation:
+                break
+            avoided.append(f"{violation.term} ({violation.theme.lower()})")
+            index = self._part_at(acts, violation.position)
+            touched = [i for i in (index, index + 1) if i < len(acts)]
+            with ThreadPoolExecutor(max_workers=len(touched)) as executor:
+                futures = {
+                    i: executor.submit(
+                        contextvars.copy_context().run,
+                        self._generate_part, user_request, category, outline, parts, i, deadline,
+                        safety_filter, max_safety_retries, avoided
+                    )
+                    for i in touched
+                }
+                for i, future in futures.items():
+                    acts[i] = future.result()
+            story = join_paragraphs(acts)
+            violation = safety_filter.first_hard_violation(story)
+        
+        if violation:
+            raise UnsafeContentError(violation)
+        return story
+    
+    @staticmethod
+    def _part_at(acts: List[str], position: int) -> int:
+        """Return the index of the part containing a position in the joined story."""
+        end = 0
+        for index, act in enumerate(acts):
+            end += len(act) + 2  # the blank line between parts
+            if position < end:
+                return index
+        return len(acts) - 1
+    
+    def _generate_outline(
+        self,
+        user_request: str,
+        category: str,
+        parts: List[Dict],
+        deadline: Optional[Deadline] = None
+    ) -> str:
+        """Generate a short numbered outline with one line per arc part."""
+        part_names = "\n".join(
+            f"{i}. {part['name']}: {part['description']}" for i, part in enumerate(parts, 1)
+        )
+        prompt = (
+            "You are planning a bedtime story for children ages 5-10.\n\n"
+            f"STORY REQUEST:\n{user_request}\n\n"
+            f"STORY CATEGORY: {category}\n"
+            f"{self._get_category_description(category)}\n\n"
+            "Write a short outline. First list the main characters with their names "
+            "in one line. Then write one or two sentences for each of these parts:\n"
+            f"{part_names}\n\n"
+            "Respond with the outline only."
+        )
+        
+        outline = self.call_model(
+            prompt=prompt,
+            max_tokens=300,
+            temperature=self.temperature,
+            deadline=deadline
+        )
+        
+        return outline.strip()
+    
+    def _generate_part(
+        self,
+        user_request: str,
+        category: str,
+        outline: str,
+        parts: List[Dict],
+        index: int,
+        deadline: Optional[Deadline] = None,
+        safety_filter: Optional[ContentSafetyFilter] = None,
+        max_safety_retries: int = 2,
+        avoided: Optional[List[str]] = None
+    ) -> str:
+        """Write a single arc part of the story following the shared outline."""
+        part = parts[index]
+        position = ""
+        if index == 0:
+            position = "This is the start of the story, so begin by introducing the characters. "
+        if index < len(parts) - 1:
+            position += "Do not finish the story; stop where the next part takes over."
+        else:
+            position += "This is the end of the story, so bring it to a warm, happy ending."
+        
+        prompt = (
+            "You are a talented children's storyteller writing one part of a "
+            "bedtime story for children ages 5-10.\n\n"
+            f"{get_age_guidelines()}\n\n"
+            f"STORY REQUEST:\n{user_request}\n\n"
+            f"STORY CATEGORY: {category}\n\n"
+            f"STORY OUTLINE:\n{outline}\n\n"
+            f"WRITE PART {index + 1} OF {len(parts)}:\n"
+            f"{StoryArc.format_part_guidance(part)}\n"
+            f"{position}\n"
+            "Write only this part as plain story paragraphs, with no title or heading."
+        )
+        
+        max_tokens = part["word_budget"] * 2 + 100
+        if safety_filter:
+            return self._generate_safe_story(
+                prompt, safety_filter, max_safety_retries, deadline, max_tokens=max_tokens, avoided=avoided
+            )
+        
+        text = self.call_model(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=self.temperature,
+            deadline=deadline
+        )
+        
+        return text.strip()
+    
+    def _smooth_transitions(
+        self,
+        acts: List[str],
+        deadline: Optional[Deadline] = None,
+        safety_filter: Optional[ContentSafetyFilter] = None
+    ) -> List[str]:
+        """
+        Rewrite the paragraphs around each seam between parts concurrently.
+        
+        Only the last paragraph of one part and the first paragraph of the next
+        are sent, so each call stays short. Seams touching a single-paragraph
+        part are skipped because two seams would edit the same paragraph.
+        
+        Args:
+            acts: The story parts in order
+            deadline: End-to-end deadline; seams are left as they are once it passes
+            safety_filter: If given, rewritten seams with a hard violation are discarded
+            
+        Returns:
+            The story parts with smoothed seams
+        """
+        paragraphs = [split_paragraphs(act) for act in acts]
+        seams = [
+            i for i in range(len(acts) - 1)
+            if len(paragraphs[i]) > 1 and len(paragraphs[i + 1]) > 1
+        ]
+        
+        def smooth(i: int) -> Optional[List[str]]:
+            prompt = (
+                "These two paragraphs come from a children's bedtime story. The first "
+                "ends one part and the second begins the next part, and they were "
+                "written separately. Rewrite them so the story flows naturally from "
+                "one to the other, keeping the same events, names and simple "
+                "language.\n\n"
+                f"PARAGRAPH 1:\n{paragraphs[i][-1]}\n\n"
+                f"PARAGRAPH 2:\n{paragraphs[i + 1][0]}\n\n"
+                "Respond with exactly two paragraphs separated by a blank line, "
+                "and nothing else."
+            )
+            try:
+                response = self.call_model(prompt=prompt, max_tokens=400, temperature=0.5, deadline=deadline)
+            except DeadlineExceeded:
+                return None
+            rewritten = split_paragraphs(response)
+            # Keep the original seam if the model did not follow the format
+            if len(rewritten) != 2:
+                return None
+            if safety_filter and safety_filter.first_hard_violation(response):
+                return None
+            return rewritten
+        
+        if seams:
+            with ThreadPoolExecutor(max_workers=len(seams)) as executor:
+                futures = [executor.submit(contextvars.copy_context().run, smooth, seam) for seam in seams]
+                results = [future.result() for future in futures]
+            for i, rewritten in zip(seams, results):
+                if rewritten:
+                    paragraphs[i][-1], paragraphs[i + 1][0] = rewritten
+        
+        return [join_paragraphs(p) for p in paragraphs]
+    
+    def edit_story(
+        self,
+        story: str,
+        modification: str,
+        user_request: str,
+        category: str,
+        deadline: Optional[Deadline] = None
+    ) -> Tuple[str, str]:
+        """
+        Apply a user's requested change to an existing story.
+        
+        The model is asked to replace only the paragraphs the change touches;
+        if its answer cannot be applied, the story is rewritten with the
+        change instead.
+        
+        Args:
+            story: The current story text
+            modification: The change the user asked for
+            user_request: The original story request
+            category: Story category
+            deadline: End-to-end deadline for the LLM call
+            
+        Returns:
+            Tuple of (edited story, method used: "patch" or "rewrite")
+        """
+        prompt = (
+            "You are a talented children's storyteller editing a bedtime story "
+            "at the listener's request.\n\n"
+            f"{get_age_guidelines()}\n\n"
+            "ORIGINAL STORY REQUEST:\n"
+            f"{user_request}\n\n"
+            "CURRENT STORY (paragraphs are numbered):\n"
+            f"{number_paragraphs(story)}\n\n"
+            "REQUESTED CHANGE:\n"
+            f"{modification}\n\n"
+            f"STORY CATEGORY: {category}\n\n"
+            "Make the requested change by replacing only the paragraphs it affects, "
+            "keeping names, events and tone consistent with the rest of the story.\n"
+            "Respond with ONLY a JSON object in this format:\n"
+            '{"replacements": [{"paragraph": <number>, "text": "<new paragraph text>"}]}'
+        )
+        response = self.call_model(prompt=prompt, max_tokens=1000, temperature=0.7, deadline=deadline)
+        
+        try:
+            patches = parse_patch_response(response)
+            if patches:
+                return apply_patches(story, patches), "patch"
+        except PatchError:
+            pass
+        
+        prompt = (
+            "You are a talented children's storyteller editing a bedtime story "
+            "at the listener's request.\n\n"
+            f"{get_age_guidelines()}\n\n"
+            "ORIGINAL STORY REQUEST:\n"
+            f"{user_request}\n\n"
+            "CURRENT STORY:\n"
+            f"{story}\n\n"
+            "REQUESTED CHANGE:\n"
+            f"{modification}\n\n"
+            f"STORY CATEGORY: {category}\n\n"
+            "Rewrite the story with the requested change, keeping everything else "
+            "as close to the current story as possible. Respond with only the story."
+        )
+        edited = self.call_model(prompt=prompt, max_tokens=2000, temperature=0.7, deadline=deadline)
+        return edited.strip(), "rewrite"
+    
     def _get_category_description(self, category: str) -> str:
         """Get a description for the category."""
         descriptions = {
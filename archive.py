@@ -0,0 +1,67 @@
+"""
+Inspect and maintain a story archive (see utils/story_archive.py).
+
+Usage:
+    python3 archive.py stats DIR
+    python3 archive.py get DIR RECORD_ID
+    python3 archive.py export DIR [--start 0]      # JSON lines on stdout
+    python3 archive.py compact DIR [--codec lzma] [--level 9] [--max-segment-mb 64]
+
+Compaction merges consecutive segments up to the segment size limit and
+can recompress cold data with a stronger codec. Record ids are preserved.
+Run it while no process is appending to the archive.
+"""
+
+import argparse
+import json
+import sys
+from typing import List, Optional
+
+from utils.story_archive import CODECS, StoryArchive
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Run one archive command.
+
+    Args:
+        argv: Command-line arguments (default: sys.argv)
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats").add_argument("directory")
+    p = sub.add_parser("get")
+    p.add_argument("directory")
+    p.add_argument("record_id", type=int)
+    p = sub.add_parser("export")
+    p.add_argument("directory")
+    p.add_argument("--start", type=int, default=0, help="First record id to export")
+    p = sub.add_parser("compact")
+    p.add_argument("directory")
+    p.add_argument("--codec", choices=list(CODECS), help="Recompress with this codec")
+    p.add_argument("--level", type=int, help="Compression level for recompressed records")
+    p.add_argument("--max-segment-mb", type=float, default=64.0, help="Largest merged segment")
+    args = parser.parse_args(argv)
+
+    archive = StoryArchive(args.directory)
+    try:
+        if args.command == "stats":
+            print(json.dumps(archive.stats(), indent=2))
+        elif args.command == "get":
+            try:
+                print(json.dumps(archive.get(args.record_id), indent=2, ensure_ascii=False))
+            except KeyError:
+                print(f"No record {args.record_id} (archive has {len(archive)})", file=sys.stderr)
+                sys.exit(1)
+        elif args.command == "export":
+            for result in archive.scan(args.start):
+                sys.stdout.write(json.dumps(result, ensure_ascii=False) + "\n")
+        else:
+            archive.max_segment_bytes = int(args.max_segment_mb * 1024 * 1024)
+            print(json.dumps(archive.compact(codec=args.codec, level=args.level), indent=2))
+    finally:
+        archive.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Measure BatchRunner throughput as the number of worker processes grows.
+
+Runs against the offline fake backend with a fixed per-call latency, so
+the numbers show how well sharding scales and where the global rate limit
+caps it, not real API latency.
+
+Usage:
+    python benchmarks/batch_scaling.py [--requests 64] [--workers 1 2 4 8]
+        [--latency 0.2] [--rps 50] [--threads 2]
+"""
+
+import argparse
+import functools
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.batch_runner import BatchRunner
+from utils.fake_backend import FakeChatBackend
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per fake LLM call")
+    parser.add_argument("--rps", type=float, default=None, help="Global requests per second limit")
+    parser.add_argument("--threads", type=int, default=1, help="Stories generated concurrently per process")
+    args = parser.parse_args()
+
+    requests = [f"A story about a bunny who finds lost treasure number {i}" for i in range(args.requests)]
+    report = []
+    for workers in args.workers:
+        runner = BatchRunner(
+            workers=workers,
+            threads_per_worker=args.threads,
+            cache_path=os.path.join(tempfile.mkdtemp(), "cache.sqlite"),
+            requests_per_second=args.rps,
+            backend_factory=functools.partial(FakeChatBackend, latency=args.latency),
+            system_kwargs={"refinement_mode": "patch"}
+        )
+        started = time.perf_counter()
+        results = runner.run(requests)
+        elapsed = time.perf_counter() - started
+        report.append({
+            "workers": workers,
+            "seconds": elapsed,
+            "stories_per_second": len(results) / elapsed,
+            "errors": sum(1 for r in results if "error" in r)
+        })
+
+    base = report[0]["stories_per_second"]
+    for entry in report:
+        entry["speedup"] = entry["stories_per_second"] / base
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
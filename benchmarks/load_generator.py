@@ -0,0 +1,302 @@
+"""
+Drive the storytelling pipeline with closed- or open-loop load.
+
+Closed loop keeps a fixed number of requests in flight (each simulated user
+sends the next request as soon as the previous story arrives). Open loop
+sends requests on a schedule regardless of how fast they are served —
+Poisson arrivals, or bursts of requests arriving together — so queueing
+delay shows up once the pipeline saturates. Requests are sampled from a
+corpus file (one request per line) or a built-in mix.
+
+By default the load runs in-process against the offline fake backend with
+a per-call latency drawn from a log-normal distribution plus a per-token
+decode time, and an optional requests-per-minute limit that fails calls
+like the API's rate limit. With --socket it drives a running daemon.py
+instead (with whatever backend that daemon uses).
+
+Each load level reports throughput, error rate and error types, end-to-end
+latency, service time and queueing delay percentiles, and per-stage latency
+percentiles. The saturation point is the first level where more than 5% of
+requests fail, where the median request waits in the queue longer than it
+takes to serve (open loop), or where throughput grows by less than 10% over
+the previous concurrency (closed loop).
+
+Usage:
+    python benchmarks/load_generator.py closed --concurrency 1 2 4 8 [--duration 10]
+    python benchmarks/load_generator.py open --rates 0.5 1 2 4 [--arrival poisson|bursty]
+        [--workers 16] [--duration 10]
+    Common options: [--corpus FILE] [--socket PATH] [--latency-median 0.4]
+        [--seconds-per-token 0.002] [--rpm 3000] [--no-refinement] [--seed 0]
+"""
+
+import argparse
+import functools
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_CORPUS = [
+    "A story about a brave little bunny who gets lost in the meadow",
+    "A story about a dragon who is afraid of the dark",
+    "A story about two friends who build a treehouse together",
+    "A story about a girl who finds a magic paintbrush",
+    "A story about a puppy learning to share his toys",
+    "A story about a boy who solves the mystery of the missing cookies",
+    "A story about a family trip to the beach",
+    "A story about a kitten who explores the garden at night",
+    "A story about a robot who wants to learn to dance",
+    "A story about an elephant who helps the other animals cross the river",
+    "A story about a fairy who loses her wings",
+    "A story about the first day at a new school"
+]
+
+
+def load_corpus(path: Optional[str]) -> List[str]:
+    """Read one request per non-empty line, or return the built-in mix."""
+    if not path:
+        return list(DEFAULT_CORPUS)
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def poisson_arrivals(rate: float, duration: float, rng: random.Random) -> List[float]:
+    """Arrival offsets (seconds) of a Poisson process with the given mean rate."""
+    arrivals, t = [], rng.expovariate(rate)
+    while t < duration:
+        arrivals.append(t)
+        t += rng.expovariate(rate)
+    return arrivals
+
+
+def bursty_arrivals(rate: float, duration: float, rng: random.Random, mean_burst: float = 4.0) -> List[float]:
+    """
+    Arrival offsets with the given mean rate, arriving in bursts.
+
+    Bursts start as a Poisson process; each holds a geometrically distributed
+    number of requests (mean ``mean_burst``) spread over 50 milliseconds.
+    """
+    arrivals = []
+    for start in poisson_arrivals(rate / mean_burst, duration, rng):
+        size = 1
+        while rng.random() > 1.0 / mean_burst:
+            size += 1
+        arrivals.extend(start + rng.uniform(0.0, 0.05) for _ in range(size))
+    return sorted(t for t in arrivals if t < duration)
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """Nearest-rank p50/p90/p95/p99 and max of a sample."""
+    if not values:
+        return {"p50": None, "p90": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(values)
+    rank = lambda p: ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100.0 * len(ordered)) - 1))]
+    return {"p50": rank(50), "p90": rank(90), "p95": rank(95), "p99": rank(99), "max": ordered[-1]}
+
+
+class InProcessTarget:
+    """Sends requests to a StorytellingSystem in this process."""
+
+    def __init__(self, system, story_kwargs: Dict):
+        self.system = system
+        self.story_kwargs = story_kwargs
+        self.stages: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        system.hooks.subscribe("stage_end", self._on_stage)
+
+    def _on_stage(self, event: Dict):
+        with self._lock:
+            self.stages.setdefault(event["stage"], []).append(event["seconds"])
+
+    def send(self, request: str):
+        """Create one story (raises on failure)."""
+        self.system.create_story(request, **self.story_kwargs)
+
+    def take_stages(self) -> Dict[str, List[float]]:
+        """Return and reset the stage latencies recorded since the last call."""
+        with self._lock:
+            stages, self.stages = self.stages, {}
+        return stages
+
+
+class DaemonTarget:
+    """Sends requests to a running daemon.py over its Unix socket."""
+
+    def __init__(self, socket_path: str, story_kwargs: Dict):
+        self.socket_path = socket_path
+        self.options = {k: v for k, v in story_kwargs.items() if k in ("enable_refinement", "use_pool", "budget_ms")}
+        self.stages: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def send(self, request: str):
+        """Create one story (raises on failure)."""
+        from client import send
+
+        for event in send({"command": "story", "request": request, "options": self.options}, self.socket_path):
+            if event["event"] == "stage":
+                with self._lock:
+                    self.stages.setdefault(event["stage"], []).append(event["seconds"])
+            elif event["event"] == "error":
+                raise RuntimeError(event["error"])
+
+    def take_stages(self) -> Dict[str, List[float]]:
+        """Return and reset the stage latencies recorded since the last call."""
+        with self._lock:
+            stages, self.stages = self.stages, {}
+        return stages
+
+
+def _timed(target, request: str, arrival: float) -> Dict:
+    """Send one request and time it against its scheduled arrival."""
+    started = time.perf_counter()
+    error = None
+    try:
+        target.send(request)
+    except Exception as e:
+        error = type(e).__name__
+    return {"arrival": arrival, "started": started, "finished": time.perf_counter(), "error": error}
+
+
+def run_closed(target, corpus: List[str], concurrency: int, duration: float, rng: random.Random) -> Dict:
+    """Keep ``concurrency`` requests in flight for ``duration`` seconds."""
+    samples: List[Dict] = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def user(seed: int):
+        user_rng = random.Random(seed)
+        while time.perf_counter() < stop_at:
+            sample = _timed(target, user_rng.choice(corpus), time.perf_counter())
+            with lock:
+                samples.append(sample)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(rng.random(),)) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(samples, time.perf_counter() - started, target.take_stages(), {"concurrency": concurrency})
+
+
+def run_open(
+    target,
+    corpus: List[str],
+    rate: float,
+    duration: float,
+    rng: random.Random,
+    arrivals: Callable[[float, float, random.Random], List[float]],
+    workers: int
+) -> Dict:
+    """Send requests at scheduled arrival times for ``duration`` seconds."""
+    schedule = arrivals(rate, duration, rng)
+    started = time.perf_counter()
+    futures = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for offset in schedule:
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(_timed, target, rng.choice(corpus), started + offset))
+        samples = [future.result() for future in futures]
+    level = {"offered_rate": rate, "arrival_rate": len(schedule) / duration}
+    return summarize(samples, time.perf_counter() - started, target.take_stages(), level)
+
+
+def summarize(samples: List[Dict], elapsed: float, stages: Dict[str, List[float]], level: Dict) -> Dict:
+    """Reduce the samples of one load level to a report entry."""
+    ok = [s for s in samples if s["error"] is None]
+    errors: Dict[str, int] = {}
+    for s in samples:
+        if s["error"]:
+            errors[s["error"]] = errors.get(s["error"], 0) + 1
+    return dict(
+        level,
+        requests=len(samples),
+        completed=len(ok),
+        throughput=len(ok) / elapsed if elapsed else 0.0,
+        error_rate=(len(samples) - len(ok)) / len(samples) if samples else 0.0,
+        errors=errors,
+        latency=percentiles([s["finished"] - s["arrival"] for s in ok]),
+        service=percentiles([s["finished"] - s["started"] for s in ok]),
+        queue_delay=percentiles([s["started"] - s["arrival"] for s in samples]),
+        stages={stage: percentiles(values) for stage, values in sorted(stages.items())}
+    )
+
+
+def find_saturation(report: List[Dict]) -> Optional[Dict]:
+    """Return the first load level at which the pipeline stopped keeping up."""
+    for previous, entry in zip([None] + report[:-1], report):
+        if entry["error_rate"] > 0.05:
+            return entry
+        if "arrival_rate" in entry:
+            queued, served = entry["queue_delay"]["p50"], entry["service"]["p50"]
+            if queued is not None and served is not None and queued > served:
+                return entry
+        elif previous and entry["throughput"] < 1.1 * previous["throughput"]:
+            return entry
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["closed", "open"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8], help="Closed loop: requests in flight")
+    parser.add_argument("--rates", type=float, nargs="+", default=[0.5, 1, 2, 4], help="Open loop: requests per second")
+    parser.add_argument("--arrival", choices=["poisson", "bursty"], default="poisson")
+    parser.add_argument("--workers", type=int, default=16, help="Open loop: requests served concurrently")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per load level")
+    parser.add_argument("--corpus", help="File with one story request per line")
+    parser.add_argument("--socket", help="Drive a running daemon.py on this socket instead of an in-process system")
+    parser.add_argument("--latency-median", type=float, default=0.4, help="Median fake time to first token (seconds)")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal shape of the fake latency")
+    parser.add_argument("--seconds-per-token", type=float, default=0.002, help="Fake decode time per completion token")
+    parser.add_argument("--rpm", type=int, default=None, help="Fake requests-per-minute limit")
+    parser.add_argument("--no-refinement", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = load_corpus(args.corpus)
+    story_kwargs = {"enable_refinement": not args.no_refinement}
+    if args.socket:
+        target = DaemonTarget(args.socket, story_kwargs)
+    else:
+        from main import StorytellingSystem
+        from utils.fake_backend import FakeChatBackend
+
+        latency_rng = random.Random(args.seed + 1)
+        backend = FakeChatBackend(
+            latency=functools.partial(latency_rng.lognormvariate, math.log(args.latency_median), args.latency_sigma),
+            seconds_per_token=args.seconds_per_token,
+            requests_per_minute=args.rpm
+        )
+        target = InProcessTarget(StorytellingSystem(backend=backend), story_kwargs)
+
+    report = []
+    if args.mode == "closed":
+        for concurrency in args.concurrency:
+            report.append(run_closed(target, corpus, concurrency, args.duration, rng))
+    else:
+        arrivals = poisson_arrivals if args.arrival == "poisson" else bursty_arrivals
+        for rate in args.rates:
+            report.append(run_open(target, corpus, rate, args.duration, rng, arrivals, args.workers))
+
+    saturation = find_saturation(report)
+    print(json.dumps({
+        "mode": args.mode,
+        "arrival": args.arrival if args.mode == "open" else None,
+        "levels": report,
+        "saturation": {k: saturation[k] for k in ("concurrency", "offered_rate") if k in saturation} if saturation else None
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
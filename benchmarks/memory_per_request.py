@@ -0,0 +1,93 @@
+"""
+Measure memory retained per request for each refinement history mode.
+
+Runs the full pipeline against the offline fake backend (every story scores
+below the threshold, so both refinement iterations run), keeps the results
+alive as an in-flight service would, and reports the traced allocations per
+request along with the size of the serialized refinement history.
+
+Usage:
+    python benchmarks/memory_per_request.py [--requests 50] [--max-history N]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import tracemalloc
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import StorytellingSystem
+from utils.fake_backend import FakeChatBackend, default_responder
+
+
+def make_responder():
+    """Return a responder that produces distinct texts so nothing is shared between requests."""
+    counter = itertools.count()
+
+    def responder(messages: List[Dict], model: str) -> str:
+        text = default_responder(messages, model).replace("SCORE: 8/10", "SCORE: 5/10")
+        return f"{text}\n\nVariant {next(counter)}."
+
+    return responder
+
+
+def measure(history: str, requests: int, max_history: Optional[int]) -> Dict:
+    """
+    Run requests in one history mode and measure retained memory.
+
+    Args:
+        history: Refinement history mode ("full", "texts" or "scores")
+        requests: Number of requests to run
+        max_history: Maximum refinement steps kept per request
+
+    Returns:
+        Dictionary with bytes retained per request and serialized history size
+    """
+    backend = FakeChatBackend(responder=make_responder())
+    system = StorytellingSystem(
+        backend=backend,
+        history=history,
+        max_history=max_history
+    )
+    loop = system.refinement_loop
+
+    # Warm up caches and imports outside the measurement
+    system.create_story("A story about a bunny")
+
+    results = []
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for i in range(requests):
+        result = system.create_story(f"A story about bunny number {i}")
+        refinement = loop.refine_story(result["story"], "A story about a bunny", result["category"])
+        results.append((result, refinement))
+        # The fake backend records every call; that is not per-request state
+        backend.calls.clear()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    serialized = [sum(len(step.to_bytes()) for step in r["history"]) for _, r in results]
+    return {
+        "history": history,
+        "bytes_per_request": (after - before) // requests,
+        "peak_bytes": peak,
+        "serialized_history_bytes": sum(serialized) // requests
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--max-history", type=int, default=None)
+    args = parser.parse_args()
+
+    report = [measure(mode, args.requests, args.max_history) for mode in ("full", "texts", "scores")]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Measure how well the local heuristic pre-judge agrees with the LLM judge.
+
+The corpus is a JSONL file with one story per line:
+    {"story": "...", "evaluation": {...}}
+where "evaluation" is a stored JudgeAgent evaluation. Lines without an
+evaluation are judged live when --judge is passed (requires OPENAI_API_KEY).
+
+Usage:
+    python benchmarks/prejudge_agreement.py corpus.jsonl [--judge] [--threshold 7.0]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.heuristic_judge import HeuristicJudge
+
+
+def llm_needs_refinement(evaluation: Dict, threshold: float) -> bool:
+    """Mirror JudgeAgent.should_refine without constructing an agent."""
+    if evaluation["overall_score"] < threshold:
+        return True
+    return any(
+        dim["score"] is not None and dim["score"] < threshold
+        for dim in evaluation["dimensions"].values()
+    )
+
+
+def agreement_report(local_results: List[Dict], evaluations: List[Dict], threshold: float) -> Dict:
+    """
+    Compare local verdicts with LLM judge decisions.
+
+    Args:
+        local_results: HeuristicJudge.score results
+        evaluations: LLM judge evaluations for the same stories
+        threshold: Refinement threshold used by the pipeline
+
+    Returns:
+        Dictionary with verdict counts, agreement rates and score correlation
+    """
+    counts = {"fail": 0, "pass": 0, "uncertain": 0}
+    agree = {"fail": 0, "pass": 0}
+
+    for local, evaluation in zip(local_results, evaluations):
+        verdict = local["verdict"]
+        counts[verdict] += 1
+        refine = llm_needs_refinement(evaluation, threshold)
+        if verdict == "fail" and refine:
+            agree["fail"] += 1
+        elif verdict == "pass" and not refine:
+            agree["pass"] += 1
+
+    xs = [r["local_score"] for r in local_results]
+    ys = [e["overall_score"] for e in evaluations]
+    correlation = None
+    if len(xs) > 1:
+        mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+        cov = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+        var_x = sum((x - mean_x) ** 2 for x in xs)
+        var_y = sum((y - mean_y) ** 2 for y in ys)
+        if var_x and var_y:
+            correlation = cov / (var_x * var_y) ** 0.5
+
+    decided = counts["fail"] + counts["pass"]
+    return {
+        "stories": len(local_results),
+        "verdicts": counts,
+        "fail_agreement": agree["fail"] / counts["fail"] if counts["fail"] else None,
+        "pass_agreement": agree["pass"] / counts["pass"] if counts["pass"] else None,
+        "decided_share": decided / len(local_results) if local_results else 0.0,
+        "score_correlation": correlation
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="JSONL file of stories with stored evaluations")
+    parser.add_argument("--judge", action="store_true", help="Judge stories without a stored evaluation")
+    parser.add_argument("--threshold", type=float, default=7.0)
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    judge = None
+    if args.judge and any("evaluation" not in r for r in records):
+        from agents.judge import JudgeAgent
+        judge = JudgeAgent()
+
+    stories, evaluations = [], []
+    for record in records:
+        evaluation = record.get("evaluation")
+        if evaluation is None:
+            if judge is None:
+                continue
+            evaluation = judge.evaluate_story(record["story"])
+        stories.append(record["story"])
+        evaluations.append(evaluation)
+
+    prejudge = HeuristicJudge()
+    started = time.perf_counter()
+    local_results = prejudge.score_many(stories)
+    elapsed = time.perf_counter() - started
+
+    report = agreement_report(local_results, evaluations, args.threshold)
+    report["local_ms_per_story"] = 1000 * elapsed / len(stories) if stories else 0.0
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Train the refinement policy on stored histories and measure it on a held-out set.
+
+"collect" runs the pipeline over a request corpus and stores each story's
+category and all_evaluations history as JSON lines. By default it uses the
+offline fake backend with synthetic judge scores: every story has a hidden
+quality that refinements raise with diminishing returns (faster for some
+categories), so the numbers exercise the method, not real model behaviour.
+Use --live to collect real histories from the OpenAI API.
+
+"evaluate" trains RefinementPolicy on part of the histories and replays the
+rest: at every step where the loop refined, the policy either allows the
+refinement or stops there. For each gain threshold it reports the LLM calls
+and refinement time saved and the change in final score, next to the
+policy's error predicting the gain.
+
+Usage:
+    python benchmarks/refinement_policy_eval.py collect histories.jsonl [--stories 200]
+        [--max-iterations 4] [--corpus FILE] [--live]
+    python benchmarks/refinement_policy_eval.py evaluate histories.jsonl [--holdout 0.25]
+        [--thresholds 0 0.25 0.5 1] [--alpha 1.0] [--save policy.json]
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.judge import JudgeAgent
+from utils.fake_backend import FAKE_STORY, default_responder
+from utils.refinement_policy import RefinementPolicy
+
+# Refinement speed per category in the synthetic responder (share of the gap to 9.5 closed)
+SYNTHETIC_GAIN = {"MAGIC/FANTASY": 0.6, "ADVENTURE": 0.5, "ANIMALS": 0.45, "FRIENDSHIP": 0.35}
+_STORY_ID = re.compile(r"Story #(\d+)\.")
+
+
+class SyntheticQuality:
+    """Fake responder whose stories have a hidden quality the judge reports with noise."""
+
+    def __init__(self, seed: int):
+        self.rng = random.Random(seed)
+        self.quality: List[float] = []
+        self._lock = threading.Lock()
+
+    def _new_story(self, quality: float) -> str:
+        with self._lock:
+            self.quality.append(min(9.8, quality))
+            return f"{FAKE_STORY}\n\nStory #{len(self.quality) - 1}."
+
+    def __call__(self, messages: List[Dict], model: str) -> str:
+        prompt = messages[-1]["content"]
+        if "FEEDBACK FOR IMPROVEMENT" in prompt:
+            parent = self.quality[int(_STORY_ID.findall(prompt)[-1])]
+            category = re.search(r"STORY CATEGORY: (\S+)", prompt).group(1)  # type: ignore
+            rate = SYNTHETIC_GAIN.get(category, 0.25)
+            return self._new_story(parent + max(-0.5, self.rng.gauss(rate * (9.5 - parent), 0.4)))
+        if "expert evaluator" in prompt and _STORY_ID.search(prompt):
+            quality = self.quality[int(_STORY_ID.findall(prompt)[-1])]
+            weak = self.rng.randrange(len(JudgeAgent.EVALUATION_DIMENSIONS))
+            lines = []
+            for index, name in enumerate(JudgeAgent.EVALUATION_DIMENSIONS):
+                score = quality - (1.0 if index == weak else 0.0) + self.rng.gauss(0, 0.3)
+                lines += [f"DIMENSION: {name}", f"SCORE: {max(1, min(10, round(score)))}/10",
+                          "REASONING: Synthetic.", "SUGGESTIONS: Make it better.", ""]
+            return "\n".join(lines + ["OVERALL_ASSESSMENT", "Synthetic evaluation."])
+        if "STORY CATEGORY:" in prompt:
+            return self._new_story(self.rng.gauss(6.3, 1.0))
+        return default_responder(messages, model)
+
+
+def collect(args):
+    """Generate stories and store their refinement histories."""
+    from main import StorytellingSystem
+    from utils.fake_backend import FakeChatBackend
+
+    if args.corpus:
+        with open(args.corpus) as f:
+            corpus = [line.strip() for line in f if line.strip()]
+    else:
+        from benchmarks.load_generator import DEFAULT_CORPUS
+        corpus = DEFAULT_CORPUS
+    if args.live:
+        system = StorytellingSystem()
+    else:
+        system = StorytellingSystem(backend=FakeChatBackend(responder=SyntheticQuality(args.seed)))
+    system.refinement_loop.max_iterations = args.max_iterations
+
+    rng = random.Random(args.seed)
+    with open(args.histories, "w") as f:
+        for _ in range(args.stories):
+            request = rng.choice(corpus)
+            if args.live:
+                category, _ = system.categorizer.categorize(request)
+            else:
+                # The fake categorizer always answers ANIMALS
+                category, _ = system.categorizer.categorize_locally(request)
+            story = system.storyteller.generate_story(request, category=category)
+            result = system.refinement_loop.refine_story(story, request, category)
+            f.write(json.dumps({"request": request, "category": category, "all_evaluations": [step.to_dict() for step in result["history"]]}) + "\n")
+    print(json.dumps({"histories": args.stories, "path": args.histories}))
+
+
+def simulate(policy: RefinementPolicy, category: str, history: List[Dict], threshold: float) -> Dict:
+    """Replay one history, stopping where the policy predicts too small a gain."""
+    stop = len(history) - 1
+    for index, step in enumerate(history):
+        if step.get("refinement") and policy.expected_gain(
+            step["evaluation"], step.get("story"), category, step["iteration"]
+        ) < threshold:
+            stop = index
+            break
+    skipped = history[stop:]
+    refinements = [s for s in skipped if s.get("refinement")]
+    return {
+        "calls_saved": len(refinements) + len(skipped) - 1,
+        "seconds_saved": sum(s["refinement"]["seconds"] for s in refinements),
+        "final_score": history[stop]["evaluation"]["overall_score"],
+        "baseline_score": history[-1]["evaluation"]["overall_score"],
+        "baseline_calls": len(history) + sum(1 for s in history if s.get("refinement"))
+    }
+
+
+def evaluate(args):
+    """Train on part of the histories and replay the held-out rest."""
+    with open(args.histories) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    records = [r for r in records if r["all_evaluations"]]
+    random.Random(args.seed).shuffle(records)
+    cut = int(len(records) * (1 - args.holdout))
+    train, held_out = records[:cut], records[cut:]
+
+    policy = RefinementPolicy(alpha=args.alpha).fit((r["category"], r["all_evaluations"]) for r in train)
+    if args.save:
+        policy.save(args.save)
+
+    examples = [e for r in held_out for e in policy.examples(r["category"], r["all_evaluations"])]
+    train_gains = [gain for r in train for _, gain in policy.examples(r["category"], r["all_evaluations"])]
+    mean_gain = sum(train_gains) / len(train_gains)
+    fit = {
+        "train_examples": policy.trained_examples,
+        "held_out_examples": len(examples),
+        "mae": sum(abs(policy.predict(x) - y) for x, y in examples) / max(1, len(examples)),
+        "mae_predicting_mean": sum(abs(mean_gain - y) for _, y in examples) / max(1, len(examples))
+    }
+
+    thresholds = []
+    for threshold in args.thresholds:
+        runs = [simulate(policy, r["category"], r["all_evaluations"], threshold) for r in held_out]
+        baseline_calls = sum(run["baseline_calls"] for run in runs)
+        thresholds.append({
+            "min_expected_gain": threshold,
+            "calls_saved": sum(run["calls_saved"] for run in runs),
+            "calls_saved_share": sum(run["calls_saved"] for run in runs) / max(1, baseline_calls),
+            "refinement_seconds_saved": sum(run["seconds_saved"] for run in runs),
+            "mean_final_score": sum(run["final_score"] for run in runs) / max(1, len(runs)),
+            "baseline_mean_final_score": sum(run["baseline_score"] for run in runs) / max(1, len(runs))
+        })
+    print(json.dumps({"train": len(train), "held_out": len(held_out), "fit": fit, "thresholds": thresholds}, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("collect")
+    p.add_argument("histories")
+    p.add_argument("--stories", type=int, default=200)
+    p.add_argument("--max-iterations", type=int, default=4)
+    p.add_argument("--corpus")
+    p.add_argument("--live", action="store_true", help="Use the OpenAI API instead of synthetic scores")
+    p.add_argument("--seed", type=int, default=0)
+    p = sub.add_parser("evaluate")
+    p.add_argument("histories")
+    p.add_argument("--holdout", type=float, default=0.25)
+    p.add_argument("--thresholds", type=float, nargs="+", default=[0.0, 0.25, 0.5, 1.0])
+    p.add_argument("--alpha", type=float, default=1.0)
+    p.add_argument("--save", help="Write the trained policy to this file")
+    p.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.command == "collect":
+        collect(args)
+    else:
+        evaluate(args)
+
+
+if __name__ == "__main__":
+    main()
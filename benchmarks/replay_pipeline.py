@@ -0,0 +1,127 @@
+"""
+Record pipeline traffic to a cassette and benchmark against it offline.
+
+The requests file has one story request per line.
+
+Usage:
+    # Record (live API, or --fake for the offline fake backend)
+    python benchmarks/replay_pipeline.py record requests.txt traffic.jsonl.gz [--fake]
+
+    # Re-run the pipeline against the recording (speed 0 = no recorded delays)
+    python benchmarks/replay_pipeline.py replay requests.txt traffic.jsonl.gz [--speed 1.0]
+
+    # Time JudgeAgent._parse_evaluation on every recorded judge response
+    python benchmarks/replay_pipeline.py parse traffic.jsonl.gz [--repeat 20]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.judge import JudgeAgent
+from main import StorytellingSystem
+from utils.cassette import CassetteMissError, ReplayBackend, read_cassette
+from utils.fake_backend import FakeChatBackend
+
+
+def load_requests(path: str) -> List[str]:
+    """Read one story request per non-empty line."""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Return the pct-th percentile of values (nearest rank)."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def record(requests: List[str], cassette: str, fake: bool) -> Dict:
+    """Run the pipeline for every request and record all LLM traffic."""
+    system = StorytellingSystem(backend=FakeChatBackend(latency=0.05) if fake else None)
+    with system.enable_recording(cassette) as recorder:
+        for request in requests:
+            system.create_story(request)
+        return {"requests": len(requests), "recorded_calls": recorder.recorded}
+
+
+def replay(requests: List[str], cassette: str, speed: float) -> Dict:
+    """Re-run the pipeline against a cassette and report per-request latency."""
+    backend = ReplayBackend(cassette, speed=speed)
+    system = StorytellingSystem(backend=backend)
+    latencies, misses = [], 0
+    for request in requests:
+        started = time.perf_counter()
+        try:
+            system.create_story(request)
+        except CassetteMissError:
+            misses += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+
+    report = {"requests": len(requests), "misses": misses, "replayed_calls": len(backend.calls)}
+    if latencies:
+        report.update({
+            "p50_seconds": percentile(latencies, 50),
+            "p95_seconds": percentile(latencies, 95),
+            "mean_seconds": sum(latencies) / len(latencies)
+        })
+    return report
+
+
+def parse(cassette: str, repeat: int) -> Dict:
+    """Time the judge's response parser on every recorded evaluation."""
+    responses = [
+        r["response"]["choices"][0]["message"]["content"]
+        for r in read_cassette(cassette)
+        if "response" in r and "expert evaluator" in r["request"]["messages"][-1]["content"]
+    ]
+    judge = JudgeAgent(backend=FakeChatBackend())
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for response in responses:
+            judge._parse_evaluation(response, "")
+    elapsed = time.perf_counter() - started
+    total = len(responses) * repeat
+    return {
+        "responses": len(responses),
+        "parses": total,
+        "microseconds_per_parse": 1e6 * elapsed / total if total else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record")
+    record_parser.add_argument("requests")
+    record_parser.add_argument("cassette")
+    record_parser.add_argument("--fake", action="store_true", help="Record the offline fake backend")
+
+    replay_parser = commands.add_parser("replay")
+    replay_parser.add_argument("requests")
+    replay_parser.add_argument("cassette")
+    replay_parser.add_argument("--speed", type=float, default=1.0)
+
+    parse_parser = commands.add_parser("parse")
+    parse_parser.add_argument("cassette")
+    parse_parser.add_argument("--repeat", type=int, default=20)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        report = record(load_requests(args.requests), args.cassette, args.fake)
+    elif args.command == "replay":
+        report = replay(load_requests(args.requests), args.cassette, args.speed)
+    else:
+        report = parse(args.cassette, args.repeat)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
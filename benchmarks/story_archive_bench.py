@@ -0,0 +1,112 @@
+"""
+Benchmark the story archive: write throughput, read latency and compression ratio.
+
+Builds distinct create_story results (full refinement history, texts
+varied per record) from one pipeline run against the offline fake backend,
+then for each codec appends them to a fresh archive, reads random records
+by id, streams the whole archive, and compacts it. JSON lines of the same
+results are the size baseline.
+
+Usage:
+    python benchmarks/story_archive_bench.py [--records 5000] [--reads 2000]
+        [--codecs zlib lzma] [--segment-mb 4] [--seed 0]
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.load_generator import percentiles
+from main import StorytellingSystem
+from utils.fake_backend import FakeChatBackend, default_responder
+from utils.story_archive import StoryArchive
+
+
+def make_results(count: int, rng: random.Random) -> List[Dict]:
+    """Return ``count`` results shaped like create_story output with varied texts."""
+    def responder(messages, model):
+        return default_responder(messages, model).replace("SCORE: 8/10", "SCORE: 6/10")
+
+    template = StorytellingSystem(backend=FakeChatBackend(responder=responder)).create_story("A bunny story")
+    sentences = [s for s in json.dumps(template).split(". ") if len(s) > 20]
+    results = []
+    for n in range(count):
+        result = json.loads(json.dumps(template))
+        # Shuffle sentences into every story text so records do not repeat each other
+        extra = ". ".join(rng.sample(sentences, min(6, len(sentences))))
+        result["story"] = f"{result['story']}\n\n{extra} (record {n})"
+        result["user_request"] = f"A story about bunny number {n}"
+        results.append(result)
+    return results
+
+
+def bench(codec: str, results: List[Dict], reads: int, segment_bytes: int, rng: random.Random) -> Dict:
+    """Write, read, scan and compact one archive."""
+    directory = tempfile.mkdtemp(prefix=f"archive-{codec}-")
+    try:
+        archive = StoryArchive(directory, codec=codec, max_segment_bytes=segment_bytes)
+        started = time.perf_counter()
+        for result in results:
+            archive.append(result)
+        write_seconds = time.perf_counter() - started
+        stats = archive.stats()
+
+        latencies = []
+        for _ in range(reads):
+            record_id = rng.randrange(len(results))
+            started = time.perf_counter()
+            archive.get(record_id)
+            latencies.append((time.perf_counter() - started) * 1000.0)
+
+        started = time.perf_counter()
+        scanned = sum(1 for _ in archive.scan())
+        scan_seconds = time.perf_counter() - started
+
+        archive.max_segment_bytes = segment_bytes * 4
+        started = time.perf_counter()
+        compaction = archive.compact()
+        compaction["seconds"] = time.perf_counter() - started
+        archive.close()
+
+        return {
+            "codec": codec,
+            "records": stats["records"],
+            "segments": stats["segments"],
+            "write_records_per_second": len(results) / write_seconds,
+            "write_raw_mb_per_second": stats["raw_bytes"] / write_seconds / 1e6,
+            "read_ms": percentiles(latencies),
+            "scan_records_per_second": scanned / scan_seconds,
+            "compression_ratio": stats["compression_ratio"],
+            "file_bytes": stats["file_bytes"],
+            "compaction": compaction
+        }
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--reads", type=int, default=2000, help="Random reads by record id")
+    parser.add_argument("--codecs", nargs="+", default=["zlib", "lzma"], choices=["zlib", "lzma"])
+    parser.add_argument("--segment-mb", type=float, default=4.0, help="Segment size before rolling over")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = make_results(args.records, rng)
+    jsonl_bytes = sum(len(json.dumps(r, ensure_ascii=False).encode("utf-8")) + 1 for r in results)
+    report = [bench(codec, results, args.reads, int(args.segment_mb * 1024 * 1024), rng) for codec in args.codecs]
+    print(json.dumps({"records": args.records, "jsonl_bytes": jsonl_bytes, "codecs": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Thin command-line client for the storytelling daemon.
+
+Sends one request to a running ``daemon.py`` over its Unix socket and
+streams the response back. Only the standard library is imported, so the
+client starts in milliseconds; agents, the OpenAI client and connections
+stay warm in the daemon.
+
+Usage:
+    python3 client.py "A story about a brave bunny"
+    python3 client.py --no-refinement --budget-ms 20000 "A story about a dragon"
+    python3 client.py --metrics
+    python3 client.py --ping
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+from typing import Dict, Iterator, List, Optional
+
+DEFAULT_SOCKET = os.environ.get(
+    "STORY_DAEMON_SOCKET",
+    os.path.join(tempfile.gettempdir(), f"storyteller-{os.getuid()}.sock")
+)
+
+# Events that end the daemon's response to one command
+TERMINAL_EVENTS = ("result", "error", "metrics", "pong")
+
+
+def send(command: Dict, socket_path: str = DEFAULT_SOCKET, timeout: Optional[float] = None) -> Iterator[Dict]:
+    """
+    Send one command to the daemon and yield its response events.
+
+    Args:
+        command: Command object, e.g. {"command": "story", "request": "..."}
+        socket_path: The daemon's Unix socket
+        timeout: Socket timeout in seconds (None waits indefinitely)
+
+    Yields:
+        Event dictionaries; the last one has an event in TERMINAL_EVENTS
+
+    Raises:
+        ConnectionError: If the daemon is not running or closes the connection early
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path)
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        sock.close()
+        raise ConnectionError(f"No storytelling daemon listening on {socket_path}") from e
+
+    with sock, sock.makefile("rwb") as stream:
+        stream.write(json.dumps(command).encode("utf-8") + b"\n")
+        stream.flush()
+        for line in stream:
+            event = json.loads(line)
+            yield event
+            if event.get("event") in TERMINAL_EVENTS:
+                return
+    raise ConnectionError("The daemon closed the connection before answering")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Submit a request to the daemon and print the result.
+
+    Args:
+        argv: Command-line arguments (default: sys.argv)
+
+    Returns:
+        Exit status: 0 on success, 1 if the daemon reported an error,
+        2 if no daemon is running
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("request", nargs="?", help="Story request")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Daemon socket path")
+    parser.add_argument("--no-refinement", action="store_true", help="Skip the judge/refine loop")
+    parser.add_argument("--budget-ms", type=float, help="End-to-end time budget in milliseconds")
+    parser.add_argument("--use-pool", action="store_true", help="Allow serving from the warm story pool")
+    parser.add_argument("--json", action="store_true", help="Print the full result as JSON")
+    parser.add_argument("--metrics", action="store_true", help="Print the daemon's Prometheus metrics")
+    parser.add_argument("--ping", action="store_true", help="Check that the daemon is running")
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        command = {"command": "metrics"}
+    elif args.ping:
+        command = {"command": "ping"}
+    elif args.request:
+        options = {"enable_refinement": not args.no_refinement, "use_pool": args.use_pool}
+        if args.budget_ms is not None:
+            options["budget_ms"] = args.budget_ms
+        command = {"command": "story", "request": args.request, "options": options}
+    else:
+        parser.error("a story request, --metrics or --ping is required")
+
+    try:
+        for event in send(command, args.socket):
+            kind = event["event"]
+            if kind == "stage":
+                print(f"[{event['stage']}] {event['seconds']:.2f}s", file=sys.stderr)
+            elif kind == "error":
+                print(f"Error: {event['error']}", file=sys.stderr)
+                return 1
+            elif kind == "pong":
+                print(f"Daemon {event['pid']} up for {event['uptime_seconds']:.0f}s")
+            elif kind == "metrics":
+                sys.stdout.write(event["text"])
+            elif kind == "result":
+                result = event["result"]
+                if args.json:
+                    print(json.dumps(result, indent=2, ensure_ascii=False))
+                else:
+                    print(result["story"])
+    except ConnectionError as e:
+        print(f"Error: {e}. Start it with: python3 daemon.py", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
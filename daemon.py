@@ -0,0 +1,269 @@
+"""
+Long-lived storytelling daemon on a Unix socket.
+
+Keeps one StorytellingSystem warm (agents, caches, the story pool, metrics)
+and one keep-alive HTTP connection pool to the OpenAI API, so requests
+sent with client.py skip interpreter start-up, imports and TLS set-up.
+
+Usage:
+    python3 daemon.py [--socket PATH] [--workers 4] [--pool-size 0]
+        [--refinement-mode patch] [--speculative]
+        [--budget-db budget.db --daily-tokens 2000000 [--tenant-daily-tokens 100000]]
+
+Protocol: one JSON object per line in each direction.
+
+    {"command": "story", "request": "...", "options": {"enable_refinement": true, "tenant": "acme"}}
+        -> {"event": "stage", "stage": "categorize", "seconds": 0.41}  (one per stage)
+        -> {"event": "result", "result": {...create_story result...}}
+    {"command": "metrics"} -> {"event": "metrics", "text": "<Prometheus exposition>"}
+    {"command": "ping"}    -> {"event": "pong", "pid": 1234, "uptime_seconds": 12.5}
+
+Failures are answered with {"event": "error", "error": "..."}. A connection
+may send several commands one after another.
+"""
+
+import argparse
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+from client import DEFAULT_SOCKET
+from main import StorytellingSystem
+from utils.budget_governor import BudgetGovernor, BudgetLimit
+
+# create_story options a client may set
+STORY_OPTIONS = ("enable_refinement", "use_pool", "parallel_acts", "budget_ms", "tenant")
+
+
+def _share_http_session(pool_size: int):
+    """Make every thread's OpenAI calls reuse one keep-alive connection pool."""
+    import openai
+    import requests
+
+    session = requests.Session()
+    session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=pool_size, max_retries=2))
+    openai.requestssession = session
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Reads commands from one connection and writes back their events."""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                command = json.loads(line)
+            except json.JSONDecodeError as e:
+                self._send({"event": "error", "error": f"Invalid JSON: {e}"})
+                continue
+            for event in self.server.story_daemon.dispatch(command):  # type: ignore
+                self._send(event)
+
+    def _send(self, event: Dict):
+        self.wfile.write(json.dumps(event, ensure_ascii=False, default=str).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class StoryDaemon:
+    """
+    Serves story requests from a warm StorytellingSystem over a Unix socket.
+
+    Each connection gets its own thread, but stories are created on a fixed
+    pool of worker threads, so per-thread state such as HTTP sessions is
+    reused across requests instead of rebuilt per connection.
+    """
+
+    def __init__(
+        self,
+        socket_path: str = DEFAULT_SOCKET,
+        system: Optional[StorytellingSystem] = None,
+        workers: int = 4,
+        **system_kwargs
+    ):
+        """
+        Initialize the daemon.
+
+        Args:
+            socket_path: Unix socket to listen on
+            system: System to serve (default: a new one with metrics enabled)
+            workers: Stories created concurrently
+            **system_kwargs: Passed to StorytellingSystem when no system is given
+        """
+        if system is None:
+            if system_kwargs.get("backend") is None:
+                # Parallel acts and hedging fan out a few calls per story
+                _share_http_session(pool_size=workers * 4)
+            system = StorytellingSystem(collect_metrics=True, **system_kwargs)
+        self.system = system
+        self.socket_path = socket_path
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="story")
+        self.ready = threading.Event()
+        self.started = time.time()
+        self._server: Optional[_Server] = None
+
+    def serve_forever(self):
+        """
+        Listen on the socket until shutdown is called.
+
+        Raises:
+            RuntimeError: If another daemon is already listening on the socket
+        """
+        self._remove_stale_socket()
+        umask = os.umask(0o177)  # Socket readable and writable by this user only
+        try:
+            self._server = _Server(self.socket_path, _Handler)
+        finally:
+            os.umask(umask)
+        self._server.story_daemon = self  # type: ignore
+        self.ready.set()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            self.executor.shutdown(wait=False)
+            self.system.close()
+
+    def shutdown(self):
+        """Stop serving (call from another thread than serve_forever)."""
+        if self._server:
+            self._server.shutdown()
+
+    def dispatch(self, command: Dict) -> Iterator[Dict]:
+        """
+        Run one command.
+
+        Args:
+            command: Decoded command object
+
+        Yields:
+            Events to send back, ending with a terminal event
+        """
+        name = command.get("command") if isinstance(command, dict) else None
+        if name == "ping":
+            yield {"event": "pong", "pid": os.getpid(), "uptime_seconds": time.time() - self.started}
+        elif name == "metrics":
+            if self.system.metrics is None:
+                yield {"event": "error", "error": "Metrics are not enabled on this daemon"}
+            else:
+                yield {"event": "metrics", "text": self.system.metrics.render()}
+        elif name == "story":
+            yield from self._story(command)
+        else:
+            yield {"event": "error", "error": f"Unknown command: {name!r}"}
+
+    def _story(self, command: Dict) -> Iterator[Dict]:
+        """Create a story, streaming stage timings as they finish."""
+        request = command.get("request")
+        if not isinstance(request, str) or not request.strip():
+            yield {"event": "error", "error": "A non-empty 'request' string is required"}
+            return
+        options = command.get("options") or {}
+        unknown = sorted(set(options) - set(STORY_OPTIONS))
+        if unknown:
+            yield {"event": "error", "error": f"Unknown options: {', '.join(unknown)}. Use {', '.join(STORY_OPTIONS)}."}
+            return
+
+        # Stage events are matched by request text; identical concurrent requests share them
+        events: "queue.Queue[Optional[Dict]]" = queue.Queue()
+
+        def on_stage(event: Dict):
+            if event["user_request"] == request:
+                events.put({"event": "stage", "stage": event["stage"], "seconds": event["seconds"]})
+
+        hook = self.system.hooks.subscribe("stage_end", on_stage)
+        try:
+            future = self.executor.submit(self.system.create_story, request, **options)
+            future.add_done_callback(lambda _: events.put(None))
+            while True:
+                event = events.get()
+                if event is None:
+                    break
+                yield event
+        finally:
+            self.system.hooks.unsubscribe("stage_end", hook)
+
+        try:
+            result = future.result()
+        except Exception as e:
+            yield {"event": "error", "error": f"{type(e).__name__}: {e}"}
+            return
+        yield {"event": "result", "result": result}
+
+    def _remove_stale_socket(self):
+        """Remove a socket file left behind by a daemon that is no longer running."""
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(self.socket_path)
+            return
+        finally:
+            probe.close()
+        raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Run the daemon until interrupted.
+
+    Args:
+        argv: Command-line arguments (default: sys.argv)
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket to listen on")
+    parser.add_argument("--workers", type=int, default=4, help="Stories created concurrently")
+    parser.add_argument("--pool-size", type=int, default=0, help="Warm story pool size per category")
+    parser.add_argument("--refinement-mode", choices=["rewrite", "patch"], default="rewrite")
+    parser.add_argument("--speculative", action="store_true",
+                        help="Start generating with a locally predicted category while the LLM categorizes")
+    parser.add_argument("--budget-db", help="SQLite file holding the token budget shared by all daemons")
+    parser.add_argument("--daily-tokens", type=int, help="Tokens all requests may spend per 24 hours")
+    parser.add_argument("--tenant-daily-tokens", type=int, help="Tokens each tenant may spend per 24 hours")
+    args = parser.parse_args(argv)
+
+    governor = None
+    if args.budget_db:
+        limits = []
+        if args.daily_tokens:
+            limits.append(BudgetLimit("global", args.daily_tokens))
+        if args.tenant_daily_tokens:
+            limits.append(BudgetLimit("tenant:*", args.tenant_daily_tokens))
+        governor = BudgetGovernor(args.budget_db, limits)
+
+    daemon = StoryDaemon(
+        socket_path=args.socket,
+        workers=args.workers,
+        story_pool_size=args.pool_size,
+        refinement_mode=args.refinement_mode,
+        speculative=args.speculative,
+        budget_governor=governor
+    )
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever, which runs on this thread
+        threading.Thread(target=daemon.shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"Storytelling daemon {os.getpid()} listening on {args.socket}")
+    daemon.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,31 @@ This system uses multiple agents (categorizer, storyteller, judge) to create
 high-quality, age-appropriate bedtime stories for children ages 5-10.
 """
 
-from typing import Dict
+import argparse
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional, Tuple
 from agents.categorizer import CategorizerAgent
 from agents.storyteller import StorytellerAgent
 from agents.judge import JudgeAgent
+from utils.budget_governor import BudgetExceededError, BudgetGovernor, current_tenant
+from utils.cassette import RecordingBackend
+from utils.content_safety import ContentSafetyFilter
+from utils.deadline import Deadline, DeadlineExceeded
+from utils.heuristic_judge import HeuristicJudge
+from utils.hooks import HookRegistry
+from utils.metrics import PipelineMetrics
+from utils.model_router import RoutingRecorder
+from utils.profiling import PipelineProfiler
 from utils.refinement_loop import RefinementLoop
+from utils.refinement_policy import RefinementPolicy
+from utils.resilience import HedgingPolicy
+from utils.speculation import SpeculationStats
+from utils.story_archive import StoryArchive
+from utils.story_pool import StoryPool
 
 """
 Before submitting the assignment, describe here in a few sentences what you would have built next if you spent 2 more hours on this project:
@@ -26,22 +46,146 @@ If I had 2 more hours, I would focus on:
 class StorytellingSystem:
     """Main orchestration class for the storytelling system."""
     
-    def __init__(self):
-        """Initialize all agents."""
-        self.categorizer = CategorizerAgent()
-        self.storyteller = StorytellerAgent()
-        self.judge = JudgeAgent()
+    def __init__(
+        self,
+        story_pool_size: int = 0,
+        refinement_mode: str = "rewrite",
+        use_prejudge: bool = False,
+        skip_judge_on_pass: bool = False,
+        use_safety_filter: bool = False,
+        backend=None,
+        hedging: bool = False,
+        fallback_model: Optional[str] = None,
+        model_routes: Optional[Dict[str, List[str]]] = None,
+        history: str = "full",
+        max_history: Optional[int] = None,
+        collect_metrics: bool = False,
+        speculative: bool = False,
+        refinement_policy: Optional[RefinementPolicy] = None,
+        min_expected_gain: float = 0.5,
+        parallel_judging: bool = False,
+        budget_governor: Optional[BudgetGovernor] = None
+    ):
+        """
+        Initialize all agents.
+        
+        Args:
+            story_pool_size: Stories to keep pre-generated per category for
+                instant serving, refilled in the background while idle (0
+                disables the warm pool; call close() to stop the filler)
+            refinement_mode: "rewrite" for full-story refinement, or "patch" for
+                paragraph-level edits
+            use_prejudge: Run the local heuristic judge before the LLM judge
+            skip_judge_on_pass: Skip the LLM judge for stories the local
+                judge clearly passes (requires use_prejudge). Such stories are
+                never judged for content safety; combine with use_safety_filter
+            use_safety_filter: Stream story generation through the unsafe-term
+                filter and regenerate as soon as a hard violation appears
+            backend: ChatCompletion-compatible backend shared by all agents
+                (default: the OpenAI API)
+            hedging: Send a duplicate request when a call is slower than the
+                95th percentile of recent calls to the same model
+            fallback_model: Model to fail over to while the primary model's
+                circuit breaker is open or it returns upstream errors
+            model_routes: Model cascade per agent ("categorizer", "storyteller",
+                "judge"), cheapest first, e.g. {"categorizer": ["gpt-4o-mini",
+                "gpt-3.5-turbo"]}; later models are only used on escalation
+            history: Refinement history kept per request: "full", "texts" or
+                "scores" ("scores" also drops the initial story from results)
+            max_history: Keep only the most recent refinement steps
+            collect_metrics: Record latency, token, refinement, score and
+                category metrics in ``self.metrics`` (Prometheus format)
+            speculative: Start generating with the locally predicted category
+                while the LLM categorizer runs, restarting only if they
+                disagree (hit rate and latency saved are in ``self.speculation``)
+            refinement_policy: Trained policy that skips refinements predicted
+                to gain less than ``min_expected_gain`` points
+            min_expected_gain: Smallest predicted score gain worth a refinement
+            parallel_judging: Judge each dimension in its own concurrent short
+                call instead of one long evaluation call
+            budget_governor: Shared token budget; as it runs out, stories skip
+                refinement, then use the scores-only judge, then come from
+                the warm pool only
+        """
+        self.categorizer = CategorizerAgent(backend=backend)
+        self.storyteller = StorytellerAgent(backend=backend)
+        self.judge = JudgeAgent(backend=backend)
+        self.judge.parallel_dimensions = parallel_judging
+        self.routing = RoutingRecorder()
+        self.hooks = HookRegistry()
+        self.metrics = PipelineMetrics(self.hooks) if collect_metrics else None
+        for agent in (self.categorizer, self.storyteller, self.judge):
+            agent.router = self.routing
+            agent.hooks = self.hooks
+            if model_routes and model_routes.get(agent.AGENT_NAME):
+                agent.cascade = list(model_routes[agent.AGENT_NAME])
+                agent.model = agent.cascade[0]
+            if hedging:
+                # Per-agent policies: story and judge latencies differ widely
+                agent.hedging = HedgingPolicy()
+            if fallback_model:
+                agent.fallback_models = [fallback_model]
         self.refinement_loop = RefinementLoop(
             storyteller=self.storyteller,
             judge=self.judge,
-            max_iterations=2
+            max_iterations=2,
+            refinement_mode=refinement_mode,
+            prejudge=HeuristicJudge() if use_prejudge else None,
+            skip_judge_on_pass=skip_judge_on_pass,
+            history=history,
+            max_history=max_history,
+            policy=refinement_policy,
+            min_expected_gain=min_expected_gain
         )
+        self.safety_filter = ContentSafetyFilter() if use_safety_filter else None
+        self.speculative = speculative
+        self.speculation = SpeculationStats()
+        self.budget = budget_governor
+        if budget_governor:
+            budget_governor.attach(self.hooks)
+        self.story_pool = None
+        if story_pool_size > 0:
+            self.story_pool = StoryPool(
+                storyteller=self.storyteller,
+                judge=self.judge,
+                stories_per_slot=story_pool_size,
+                # Restocking is optional spend: stop it once the budget starts degrading judging
+                can_fill=(lambda: budget_governor.level() in ("normal", "skip_refinement")) if budget_governor else None
+            )
+            self.story_pool.start()
+    
+    def close(self):
+        """Stop background work (the warm pool filler)."""
+        if self.story_pool:
+            self.story_pool.stop()
+    
+    def enable_recording(self, path: str) -> RecordingBackend:
+        """
+        Record all LLM traffic of every agent to one cassette file.
+        
+        Args:
+            path: Cassette file to append to (replay it with
+                ``utils.cassette.ReplayBackend``)
+            
+        Returns:
+            The shared RecordingBackend (close it when done)
+        """
+        recorder = RecordingBackend(self.categorizer.backend, path)
+        for agent in (self.categorizer, self.storyteller, self.judge):
+            agent.enable_recording(recorder)
+        return recorder
     
     def create_story(
         self,
         user_request: str,
         enable_refinement: bool = True,
-        show_details: bool = False
+        show_details: bool = False,
+        use_pool: bool = False,
+        parallel_acts: bool = False,
+        budget_ms: Optional[float] = None,
+        deadline: Optional[Deadline] = None,
+        category: Optional[Tuple[str, str]] = None,
+        tenant: Optional[str] = None
     ) -> Dict:
         """
         Create a story from user request through the full pipeline.
@@ -50,19 +194,225 @@ class StorytellingSystem:
             user_request: The user's story request
             enable_refinement: Whether to use judge refinement loop
             show_details: Whether to show intermediate steps
+            use_pool: Serve category-generic requests from the warm story pool
+                when a fresh story is stocked (falls through to live generation)
+            parallel_acts: Generate the story act by act concurrently from an
+                outline instead of in one long decode
+            budget_ms: End-to-end time budget in milliseconds
+            deadline: End-to-end deadline (overrides budget_ms)
+            category: Precomputed (category, explanation), e.g. from
+                categorize_many; skips the categorization step
+            tenant: Tenant whose token budget the request is charged to
             
         Returns:
-            Dictionary with story, category, and evaluation info
+            Dictionary with story, category, and evaluation info. "partial" is
+            True when a stage was cut short to meet the deadline; "iterations"
+            counts judge passes and "refinements" the refinements they triggered.
+            "budget_level" is the degradation level the token budget imposed.
+            
+        Raises:
+            DeadlineExceeded: If the deadline passes before any story exists
+            BudgetExceededError: If the token budget is spent and no pooled
+                story can serve the request
         """
+        if deadline is None and budget_ms is not None:
+            deadline = Deadline.from_budget_ms(budget_ms)
+        
         if show_details:
             print("\n" + "=" * 60)
             print("Storytelling System Pipeline")
             print("=" * 60)
         
+        budget_level = self.budget.level(tenant) if self.budget else "normal"
+        if budget_level in ("pool_only", "exhausted"):
+            use_pool = True
+        
+        tenant_token = current_tenant.set(tenant)
+        try:
+            result = None
+            if use_pool and self.story_pool:
+                with self._stage("pool", user_request):
+                    result = self._serve_from_pool(user_request)
+                if result and show_details:
+                    print(f"\nServed pre-generated {result['category'].lower()} story from the warm pool")
+            if result is None:
+                if budget_level == "exhausted":
+                    raise BudgetExceededError(f"Token budget spent for tenant {tenant!r}")
+                with self.story_pool.busy() if self.story_pool else nullcontext():
+                    if budget_level == "pool_only":
+                        result = self._run_minimal(user_request, show_details, deadline, category)
+                    else:
+                        result = self._run_pipeline(user_request, enable_refinement, show_details, parallel_acts,
+                                                    deadline, category, budget_level)
+        finally:
+            current_tenant.reset(tenant_token)
+        result["budget_level"] = budget_level
+        
+        self.hooks.emit(
+            "story_end",
+            user_request=user_request,
+            category=result["category"],
+            evaluation=result["evaluation"],
+            iterations=result["iterations"],
+            refinements=result["refinements"],
+            refined=result["refined"],
+            from_pool=result["from_pool"],
+            partial=result["partial"]
+        )
+        return result
+    
+    def create_stories(self, user_requests: List[str], max_workers: int = 4, **kwargs) -> List[Dict]:
+        """
+        Create stories for many requests, categorizing them in batched LLM calls.
+        
+        Args:
+            user_requests: The users' story requests
+            max_workers: Stories to generate concurrently
+            **kwargs: Passed on to create_story for every request
+            
+        Returns:
+            List of create_story results, in input order
+        """
+        categories = self.categorizer.categorize_many(user_requests)
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            return list(executor.map(
+                lambda args: self.create_story(args[0], category=args[1], **kwargs),
+                zip(user_requests, categories)
+            ))
+    
+    def modify_story(
+        self,
+        previous_result: Dict,
+        modification: str,
+        user_request: str,
+        rejudge: bool = True,
+        deadline: Optional[Deadline] = None
+    ) -> Dict:
+        """
+        Apply a requested change to an existing story without re-running the pipeline.
+        
+        The category is reused, the storyteller edits only the paragraphs the
+        change touches (rewriting the story if the edit cannot be applied),
+        and the judge re-scores only the dimensions the change can affect.
+        
+        Args:
+            previous_result: A create_story (or modify_story) result
+            modification: The change the user asked for
+            user_request: The original story request
+            rejudge: Whether to re-evaluate the affected dimensions
+            deadline: End-to-end deadline
+            
+        Returns:
+            Dictionary in the same shape as create_story, plus "edit" with the
+            edit method ("patch" or "rewrite") and the re-judged dimensions
+        """
+        with self._stage("modify", user_request):
+            story, method = self.storyteller.edit_story(
+                story=previous_result["story"],
+                modification=modification,
+                user_request=user_request,
+                category=previous_result["category"],
+                deadline=deadline
+            )
+            
+            evaluation = previous_result["evaluation"]
+            rejudged: List[str] = []
+            if rejudge:
+                if evaluation:
+                    rejudged = self.judge.dimensions_for_change(modification)
+                    evaluation = self.judge.evaluate_dimensions(story, rejudged, previous=evaluation, deadline=deadline)
+                else:
+                    rejudged = list(self.judge.EVALUATION_DIMENSIONS)
+                    evaluation = self.judge.evaluate_story(story, deadline=deadline)
+        
+        return {
+            "story": story,
+            "category": previous_result["category"],
+            "category_explanation": previous_result["category_explanation"],
+            "evaluation": evaluation,
+            "refined": story != previous_result["story"],
+            "iterations": 0,
+            "refinements": 0,
+            "initial_story": previous_result["story"] if self.refinement_loop.history != "scores" else None,
+            "from_pool": False,
+            "partial": False,
+            "edit": {"method": method, "rejudged": rejudged}
+        }
+    
+    @contextmanager
+    def _stage(self, stage: str, user_request: str):
+        """Emit stage_start and stage_end hook events around a pipeline stage."""
+        self.hooks.emit("stage_start", stage=stage, user_request=user_request)
+        started = time.perf_counter()
+        error: Optional[Exception] = None
+        try:
+            yield
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.hooks.emit("stage_end", stage=stage, user_request=user_request,
+                            seconds=time.perf_counter() - started, error=error)
+    
+    def _serve_from_pool(self, user_request: str) -> Optional[Dict]:
+        """
+        Try to serve a category-generic request from the warm story pool.
+        
+        Args:
+            user_request: The user's story request
+            
+        Returns:
+            Result dictionary in the same shape as create_story, or None
+        """
+        match = self.story_pool.match_request(user_request)
+        if not match:
+            return None
+        
+        category, subject = match
+        entry = self.story_pool.take(category, arc_type="three_act", subject=subject)
+        if not entry:
+            return None
+        
+        return {
+            "story": entry["story"],
+            "category": category,
+            "category_explanation": f"Generic {subject} request served from the warm story pool.",
+            "evaluation": entry["evaluation"],
+            "refined": False,
+            "iterations": 0,
+            "refinements": 0,
+            "initial_story": None,
+            "from_pool": True,
+            "partial": False
+        }
+    
+    def _categorize_and_generate(
+        self,
+        user_request: str,
+        show_details: bool,
+        parallel_acts: bool,
+        deadline: Optional[Deadline],
+        precomputed_category: Optional[Tuple[str, str]]
+    ) -> Tuple[str, str, str, bool]:
+        """Categorize the request, then generate the initial story."""
+        partial = False
+        
         # Step 1: Categorize the request
         if show_details:
             print("\n[Step 1] Categorizing story request...")
-        category, explanation = self.categorizer.categorize(user_request)
+        with self._stage("categorize", user_request):
+            if precomputed_category:
+                category, explanation = precomputed_category
+            else:
+                try:
+                    # Categorization is cheap; never let it eat the generation budget
+                    category, explanation = self.categorizer.categorize(
+                        user_request,
+                        deadline=deadline.portion(0.15) if deadline else None
+                    )
+                except DeadlineExceeded:
+                    category, explanation = self.categorizer.categorize_locally(user_request)
+                    partial = True
         if show_details:
             print(f"Category: {category}")
             print(f"Explanation: {explanation}")
@@ -70,37 +420,191 @@ class StorytellingSystem:
         # Step 2: Generate initial story
         if show_details:
             print(f"\n[Step 2] Generating {category.lower()} story...")
-        initial_story = self.storyteller.generate_story(
-            user_request=user_request,
-            category=category,
-            use_story_arc=True,
-            arc_type="three_act"
-        )
+        with self._stage("generate", user_request):
+            if parallel_acts:
+                initial_story = self.storyteller.generate_story_by_acts(
+                    user_request=user_request,
+                    category=category,
+                    arc_type="three_act",
+                    deadline=deadline,
+                    safety_filter=self.safety_filter
+                )
+            else:
+                initial_story = self.storyteller.generate_story(
+                    user_request=user_request,
+                    category=category,
+                    use_story_arc=True,
+                    arc_type="three_act",
+                    safety_filter=self.safety_filter,
+                    deadline=deadline
+                )
         if show_details:
             print(f"Initial story generated ({len(initial_story)} characters)")
         
+        return category, explanation, initial_story, partial
+    
+    def _categorize_and_generate_speculatively(
+        self,
+        user_request: str,
+        deadline: Optional[Deadline]
+    ) -> Tuple[str, str, str, bool]:
+        """
+        Generate the initial story with the locally predicted category while the LLM categorizes.
+        
+        The speculative story is kept if the LLM agrees with the prediction;
+        otherwise its stream is cancelled and the story is generated again
+        with the LLM's category.
+        """
+        predicted, _ = self.categorizer.categorize_locally(user_request)
+        cancel = threading.Event()
+        started = time.perf_counter()
+        
+        def categorize() -> Tuple[str, str, bool]:
+            with self._stage("categorize", user_request):
+                try:
+                    category, explanation = self.categorizer.categorize(
+                        user_request,
+                        deadline=deadline.portion(0.15) if deadline else None
+                    )
+                    return category, explanation, False
+                except DeadlineExceeded:
+                    category, explanation = self.categorizer.categorize_locally(user_request)
+                    return category, explanation, True
+        
+        def generate(category: str, cancel_event: Optional[threading.Event]) -> str:
+            with self._stage("generate", user_request):
+                return self.storyteller.generate_story(
+                    user_request=user_request,
+                    category=category,
+                    use_story_arc=True,
+                    arc_type="three_act",
+                    safety_filter=self.safety_filter,
+                    deadline=deadline,
+                    cancel=cancel_event
+                )
+        
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            speculative = executor.submit(contextvars.copy_context().run, generate, predicted, cancel)
+            try:
+                category, explanation, partial = executor.submit(contextvars.copy_context().run, categorize).result()
+            except BaseException:
+                cancel.set()
+                raise
+            categorized_seconds = time.perf_counter() - started
+            
+            if category == predicted:
+                self.speculation.record(hit=True, seconds=categorized_seconds)
+                return category, explanation, speculative.result(), partial
+            
+            cancel.set()
+            self.speculation.record(hit=False, seconds=categorized_seconds)
+            # The cancelled story's outcome (usually SpeculationCancelled) is discarded
+            initial_story = generate(category, None)
+        
+        return category, explanation, initial_story, partial
+    
+    def _run_minimal(
+        self,
+        user_request: str,
+        show_details: bool,
+        deadline: Optional[Deadline],
+        precomputed_category: Optional[Tuple[str, str]] = None
+    ) -> Dict:
+        """Generate a story with the fewest tokens: local categorization, no judge, no refinement."""
+        if show_details:
+            print("\n[Steps 1-2] Token budget nearly spent: generating without judging...")
+        category, explanation = precomputed_category or self.categorizer.categorize_locally(user_request)
+        with self._stage("generate", user_request):
+            story = self.storyteller.generate_story(
+                user_request=user_request,
+                category=category,
+                use_story_arc=True,
+                arc_type="three_act",
+                safety_filter=self.safety_filter,
+                deadline=deadline
+            )
+        return {
+            "story": story,
+            "category": category,
+            "category_explanation": explanation,
+            "evaluation": None,
+            "refined": False,
+            "iterations": 0,
+            "refinements": 0,
+            "initial_story": None,
+            "from_pool": False,
+            "partial": False
+        }
+    
+    def _run_pipeline(
+        self,
+        user_request: str,
+        enable_refinement: bool,
+        show_details: bool,
+        parallel_acts: bool = False,
+        deadline: Optional[Deadline] = None,
+        precomputed_category: Optional[Tuple[str, str]] = None,
+        budget_level: str = "normal"
+    ) -> Dict:
+        """Run categorization, generation and refinement for a request."""
+        partial = False
+        
+        if self.speculative and not precomputed_category and not parallel_acts:
+            if show_details:
+                print("\n[Steps 1-2] Categorizing while generating a story speculatively...")
+            category, explanation, initial_story, partial = self._categorize_and_generate_speculatively(
+                user_request, deadline
+            )
+            if show_details:
+                print(f"Category: {category}")
+                print(f"Explanation: {explanation}")
+                print(f"Initial story generated ({len(initial_story)} characters)")
+        else:
+            category, explanation, initial_story, partial = self._categorize_and_generate(
+                user_request, show_details, parallel_acts, deadline, precomputed_category
+            )
+        
         # Step 3: Evaluate and refine (if enabled)
         final_story = initial_story
         evaluation = None
         refined = False
+        iterations = 0
+        refinements = 0
         
-        if enable_refinement:
+        if enable_refinement and budget_level != "normal":
+            # Budget running low: judge once and keep the story as it is
+            if show_details:
+                print(f"\n[Step 3] Evaluating story without refinement (token budget: {budget_level})...")
+            with self._stage("judge", user_request):
+                if budget_level == "skip_refinement":
+                    evaluation = self.judge.evaluate_story(initial_story, deadline=deadline)
+                else:
+                    evaluation = self.judge.evaluate_scores_only(initial_story, deadline=deadline)
+            iterations = 1
+        elif enable_refinement:
             if show_details:
                 print("\n[Step 3] Evaluating and refining story...")
             
-            result = self.refinement_loop.refine_story(
-                original_story=initial_story,
-                user_request=user_request,
-                category=category,
-                threshold=7.0
-            )
+            with self._stage("refine", user_request):
+                result = self.refinement_loop.refine_story(
+                    original_story=initial_story,
+                    user_request=user_request,
+                    category=category,
+                    threshold=7.0,
+                    deadline=deadline
+                )
             
             final_story = result["final_story"]
             evaluation = result["final_evaluation"]
             refined = result["improved"]
+            iterations = result["iterations"]
+            refinements = result["refinements"]
+            partial = partial or result["partial"]
             
             if show_details:
                 print(f"Refinement iterations: {result['iterations']}")
+                if result["partial"]:
+                    print("Deadline reached; returning the best story so far")
                 if refined:
                     print("Story was refined based on judge feedback")
                 else:
@@ -112,21 +616,47 @@ class StorytellingSystem:
             "category_explanation": explanation,
             "evaluation": evaluation,
             "refined": refined,
-            "initial_story": initial_story if enable_refinement else None
+            "iterations": iterations,
+            "refinements": refinements,
+            "initial_story": initial_story if enable_refinement and self.refinement_loop.history != "scores" else None,
+            "from_pool": False,
+            "partial": partial
         }
 
 
-def main():
+def main(argv: Optional[List[str]] = None):
     """
     Main entry point for the storytelling application.
+    
+    Args:
+        argv: Command-line arguments (default: sys.argv)
     """
+    parser = argparse.ArgumentParser(description="Create age-appropriate bedtime stories.")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile story creation: CPU hot spots, allocation sites and LLM wait time")
+    parser.add_argument("--profile-top", type=int, default=15,
+                        help="Number of hot spots and allocation sites to show")
+    parser.add_argument("--metrics-file",
+                        help="Write Prometheus-format metrics to this file after each story")
+    parser.add_argument("--speculative", action="store_true",
+                        help="Start generating with a locally predicted category while the LLM categorizes")
+    parser.add_argument("--parallel-judging", action="store_true",
+                        help="Judge each evaluation dimension in its own concurrent call")
+    parser.add_argument("--archive",
+                        help="Append each finished story result to the story archive in this directory")
+    args = parser.parse_args(argv)
+    
     print("=" * 60)
     print("Welcome to the Storytelling System!")
     print("Creating age-appropriate bedtime stories for children ages 5-10")
     print("=" * 60)
     
     try:
-        system = StorytellingSystem()
+        system = StorytellingSystem(
+            collect_metrics=bool(args.metrics_file),
+            speculative=args.speculative,
+            parallel_judging=args.parallel_judging
+        )
         
         # Get user input
         user_request = input("\nWhat kind of story do you want to hear? ")
@@ -140,11 +670,13 @@ def main():
         print("=" * 60)
         
         # Create the story
-        result = system.create_story(
-            user_request=user_request,
-            enable_refinement=True,
-            show_details=True
-        )
+        profiler = PipelineProfiler(system.hooks, top=args.profile_top) if args.profile else None
+        with profiler or nullcontext():
+            result = system.create_story(
+                user_request=user_request,
+                enable_refinement=True,
+                show_details=True
+            )
         
         # Display results
         print("\n" + "=" * 60)
@@ -173,23 +705,40 @@ def main():
                 score = dim_data['score'] if dim_data['score'] is not None else "N/A"
                 print(f"  - {dim_name}: {score}/10")
         
-        # Ask for user feedback
-        print("\n" + "=" * 60)
-        feedback = input("Would you like to request any changes to the story? (yes/no): ").strip().lower()
-        
-        if feedback in ['yes', 'y']:
-            modification = input("What would you like to change? ")
-            if modification.strip():
-                print("\nGenerating modified story...")
-                modified_result = system.create_story(
-                    user_request=f"{user_request} {modification}",
-                    enable_refinement=True,
-                    show_details=False
-                )
-                print("\n" + "=" * 60)
-                print("Modified Story")
-                print("=" * 60)
-                print(modified_result['story'])
+        if args.speculative:
+            speculation = system.speculation.summary()
+            print(f"\nSpeculation: {speculation['hits']} hit(s), {speculation['misses']} miss(es), "
+                  f"{speculation['saved_seconds']:.2f}s saved")
+        if profiler:
+            print("\n" + "=" * 60)
+            print(profiler.report())
+        if system.metrics:
+            system.metrics.write(args.metrics_file)
+        archive = StoryArchive(args.archive) if args.archive else None
+        try:
+            if archive:
+                archive.append(result)
+            
+            # Ask for user feedback
+            print("\n" + "=" * 60)
+            feedback = input("Would you like to request any changes to the story? (yes/no): ").strip().lower()
+            
+            if feedback in ['yes', 'y']:
+                modification = input("What would you like to change? ")
+                if modification.strip():
+                    print("\nGenerating modified story...")
+                    modified_result = system.modify_story(result, modification, user_request)
+                    print("\n" + "=" * 60)
+                    print("Modified Story")
+                    print("=" * 60)
+                    print(modified_result['story'])
+                    if system.metrics:
+                        system.metrics.write(args.metrics_file)
+                    if archive:
+                        archive.append(modified_result)
+        finally:
+            if archive:
+                archive.close()
         
         print("\n" + "=" * 60)
         print("Thank you for using the Storytelling System!")
@@ -85,6 +85,74 @@ class PromptTemplate:
             "SUMMARY_OF_KEY_IMPROVEMENTS (if any)."
         )
     
+    @staticmethod
+    def create_dimension_evaluation_prompt_base() -> str:
+        """Create the base prompt structure for re-evaluating selected dimensions of a story."""
+        return (
+            "You are an expert evaluator of children's stories (ages 5-10). "
+            "Evaluate the following story on the listed dimensions only.\n\n"
+            "{guidelines}"
+            "\n\nSTORY TO EVALUATE:\n{story}\n\n"
+            "Please evaluate this story on the following dimensions:\n"
+            "{dimensions}\n\n"
+            "For each dimension, provide:\n"
+            "- A numerical score (1-10)\n"
+            "- Brief reasoning for your score\n"
+            "- Specific, actionable suggestions for improvement (if score < 8)\n\n"
+            "Format your response as follows:\n"
+            "DIMENSION: [Name]\n"
+            "SCORE: [X/10]\n"
+            "REASONING: [Brief explanation]\n"
+            "SUGGESTIONS: [Specific improvements, or 'No major improvements needed' if score >= 8]"
+        )
+    
+    @staticmethod
+    def create_scores_only_evaluation_prompt_base() -> str:
+        """Create the base prompt structure for a short scores-only story evaluation."""
+        return (
+            "You are an expert evaluator of children's stories (ages 5-10). "
+            "Score the following story. SCORES ONLY: give no reasoning or suggestions.\n\n"
+            "STORY TO EVALUATE:\n{story}\n\n"
+            "Please evaluate this story on the following dimensions:\n"
+            "1. Age-appropriateness (1-10)\n"
+            "2. Narrative coherence (1-10)\n"
+            "3. Character development (1-10)\n"
+            "4. Engagement level (1-10)\n"
+            "5. Educational/moral value (1-10)\n\n"
+            "Format your response as follows, one pair of lines per dimension:\n"
+            "DIMENSION: [Name]\n"
+            "SCORE: [X/10]"
+        )
+    
+    @staticmethod
+    def create_batch_evaluation_prompt_base() -> str:
+        """Create the base prompt structure for evaluating several stories in one request."""
+        return (
+            "You are an expert evaluator of children's stories (ages 5-10). "
+            "Evaluate each of the following stories independently and provide "
+            "detailed feedback.\n\n"
+            "{guidelines}"
+            "\n\nSTORIES TO EVALUATE:\n{stories}\n\n"
+            "Please evaluate every story on the following dimensions:\n"
+            "1. Age-appropriateness (1-10)\n"
+            "2. Narrative coherence (1-10)\n"
+            "3. Character development (1-10)\n"
+            "4. Engagement level (1-10)\n"
+            "5. Educational/moral value (1-10)\n\n"
+            "For each dimension, provide:\n"
+            "- A numerical score (1-10)\n"
+            "- Brief reasoning for your score\n"
+            "- Specific, actionable suggestions for improvement (if score < 8)\n\n"
+            "Start the evaluation of each story with a line '=== STORY [n] ===' "
+            "using the story's number, then format it as follows:\n"
+            "DIMENSION: [Name]\n"
+            "SCORE: [X/10]\n"
+            "REASONING: [Brief explanation]\n"
+            "SUGGESTIONS: [Specific improvements, or 'No major improvements needed' if score >= 8]\n\n"
+            "After all dimensions of a story, provide its OVERALL_ASSESSMENT and "
+            "SUMMARY_OF_KEY_IMPROVEMENTS (if any)."
+        )
+    
     @staticmethod
     def create_categorization_prompt_base() -> str:
         """Create the base prompt structure for story categorization."""
@@ -103,4 +171,23 @@ class PromptTemplate:
             "Respond with ONLY the category name (e.g., 'ADVENTURE' or 'FRIENDSHIP') "
             "followed by a brief explanation (1-2 sentences) of why you chose this category."
         )
-
+    
+    @staticmethod
+    def create_batch_categorization_prompt_base() -> str:
+        """Create the base prompt structure for categorizing several requests in one call."""
+        return (
+            "You are a story classifier. Analyze each of the following numbered story "
+            "requests and categorize it into one of these types:\n\n"
+            "CATEGORIES:\n"
+            "1. ADVENTURE - Stories about journeys, quests, exploration, discovery\n"
+            "2. FRIENDSHIP - Stories about relationships, helping friends, teamwork\n"
+            "3. MAGIC/FANTASY - Stories with magical elements, fantasy creatures, wonder\n"
+            "4. ANIMALS - Stories featuring animals as main characters\n"
+            "5. PROBLEM-SOLVING - Stories about overcoming challenges, puzzles, creativity\n"
+            "6. EVERYDAY - Stories about normal life situations, school, family\n"
+            "7. MIXED - Stories that combine multiple categories\n\n"
+            "STORY REQUESTS:\n{requests}\n\n"
+            "Respond with ONLY one line per request, in the same order, formatted as "
+            "'[number]. [CATEGORY] - [brief explanation]' (e.g., '1. ADVENTURE - A quest "
+            "to find a lost treasure.')."
+        )
@@ -132,6 +132,1259 @@ def test_story_arc_retrieval():
         print(f"✗ Error: {e}")
 
 
+class _StubStoryteller:
+    """Offline stand-in for StorytellerAgent used by infrastructure tests."""
+    
+    def generate_story(self, user_request, category="MIXED", use_story_arc=True, arc_type="three_act"):
+        return f"Once upon a time... ({user_request}, {category}, {arc_type})"
+
+
+class _StubJudge:
+    """Offline stand-in for JudgeAgent that always passes stories."""
+    
+    def evaluate_story(self, story):
+        return {"dimensions": {}, "overall_score": 8.5, "overall_assessment": "", "key_improvements": []}
+    
+    def should_refine(self, evaluation, threshold=7.0):
+        return evaluation["overall_score"] < threshold
+
+
+def test_story_pool():
+    """Test the warm story pool without API calls."""
+    print("\n" + "=" * 60)
+    print("Testing Warm Story Pool")
+    print("=" * 60)
+    
+    import time
+    
+    from utils.story_pool import StoryPool
+    
+    pool = StoryPool(_StubStoryteller(), _StubJudge(), stories_per_slot=1, arc_types=["three_act"])
+    
+    assert pool.match_request("A story about a dragon") == ("MAGIC/FANTASY", "dragon")
+    assert pool.match_request("tell me an adventure story!") == ("ADVENTURE", "adventure")
+    assert pool.match_request("A story about a girl named Alice and her cat Bob") is None
+    print("✓ Generic request matching works")
+    
+    assert pool.take("MAGIC/FANTASY", "three_act", "dragon") is None
+    generated = pool.refill()
+    assert generated == len(pool.freshness())
+    entry = pool.take("MAGIC/FANTASY", "three_act", "dragon")
+    assert entry and "dragon" in entry["story"]
+    assert pool.take("MAGIC/FANTASY", "three_act", "dragon") is None
+    print(f"✓ Pool refilled {generated} slots and served a pre-judged story")
+    
+    pool.refill()
+    pool.max_age_seconds = 0
+    assert pool.take("ANIMALS", "three_act") is None
+    assert pool.stats["expired"] > 0
+    print("✓ Stale stories are evicted")
+    
+    pool.max_age_seconds = 3600
+    assert pool.take("ANIMALS", "three_act", "puppy") is None
+    pool.refill()
+    assert pool.take("ANIMALS", "three_act", "puppy")
+    print("✓ Requested subjects are stocked next")
+    
+    pool.idle_seconds = 0
+    pool.start(poll_interval=0.01)
+    deadline = time.time() + 5
+    while pool.freshness()["ANIMALS/three_act"]["count"] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    pool.stop(timeout=5)
+    assert pool.freshness()["ANIMALS/three_act"]["count"] == 1 and not pool._filler.is_alive()
+    
+    paused = StoryPool(_StubStoryteller(), _StubJudge(), stories_per_slot=1, idle_seconds=0, can_fill=lambda: False)
+    paused.start(poll_interval=0.01)
+    time.sleep(0.1)
+    paused.stop(timeout=5)
+    assert paused.stats["generated"] == 0
+    print("✓ Background filler restocks while idle, pauses when told to, and stops cleanly")
+    
+    assert StoryPool.seed_request("dragon") == "A story about a dragon"
+    assert StoryPool.seed_request("adventure") == "A story about an adventure"
+    assert StoryPool.seed_request("friends") == "A story about friends"
+    
+    class RejectingJudge(_StubJudge):
+        def evaluate_story(self, story):
+            return {"dimensions": {}, "overall_score": 3.0, "overall_assessment": "", "key_improvements": []}
+    
+    picky = StoryPool(_StubStoryteller(), RejectingJudge(), stories_per_slot=5, max_rejections=3)
+    picky.refill()
+    slots = len(picky.freshness())
+    assert picky.stats["generated"] == 3 * slots and picky.stats["parked"] == slots
+    assert picky.refill() == 0
+    print("✓ Seed requests read naturally and slots that keep failing are parked")
+
+
+def test_story_patches():
+    """Test paragraph-level patch parsing and application."""
+    print("\n" + "=" * 60)
+    print("Testing Story Patches")
+    print("=" * 60)
+    
+    from utils.story_patches import PatchError, apply_patches, number_paragraphs, parse_patch_response
+    
+    story = "Once upon a time.\n\nA problem appeared.\n\nThey lived happily."
+    assert number_paragraphs(story).startswith("[P1] Once upon a time.")
+    
+    response = '```json\n{"replacements": [{"paragraph": 2, "text": "A gentle problem appeared."}]}\n```'
+    patched = apply_patches(story, parse_patch_response(response))
+    assert patched == "Once upon a time.\n\nA gentle problem appeared.\n\nThey lived happily."
+    print("✓ Patches parsed and applied")
+    
+    for bad in ["I rewrote the story!", '{"replacements": [{"paragraph": 9, "text": "x"}]}']:
+        try:
+            apply_patches(story, parse_patch_response(bad))
+            raise AssertionError("Expected PatchError")
+        except PatchError:
+            pass
+    print("✓ Invalid patches are rejected")
+
+
+def test_parallel_acts():
+    """Test act-by-act story generation with a scripted model."""
+    print("\n" + "=" * 60)
+    print("Testing Parallel Act Generation")
+    print("=" * 60)
+    
+    from agents.storyteller import StorytellerAgent
+    
+    budgets = StoryArc.get_part_budgets("five_part", target_words=1000)
+    assert [part["word_budget"] for part in budgets] == [200, 250, 200, 200, 150]
+    print("✓ Part word budgets follow arc percentages")
+    
+    class ScriptedStoryteller(StorytellerAgent):
+        def __init__(self):
+            self.model = "scripted"
+            self.temperature = 0.8
+            self.prompts = []
+        
+        def call_model(self, prompt, max_tokens=3000, temperature=0.1, **kwargs):
+            self.prompts.append(prompt)
+            if "Write a short outline" in prompt:
+                return "Characters: Pip the bunny.\n1. Pip at home\n2. Pip gets lost\n3. Pip finds home"
+            if "PARAGRAPH 1:" in prompt:
+                return "Smooth end.\n\nSmooth start."
+            part = prompt.split("WRITE PART ")[1].split(" ")[0]
+            return f"Part {part} opening.\n\nPart {part} closing."
+    
+    storyteller = ScriptedStoryteller()
+    story = storyteller.generate_story_by_acts("A story about Pip", category="ANIMALS")
+    assert story.startswith("Part 1 opening.")
+    assert story.count("Smooth end.") == 2 and story.endswith("Part 3 closing.")
+    assert len(storyteller.prompts) == 1 + 3 + 2
+    print("✓ Outline, parts and continuity pass stitched together")
+    
+    from utils.content_safety import ContentSafetyFilter, UnsafeContentError
+    
+    class UnsafePartStoryteller(ScriptedStoryteller):
+        def call_model(self, prompt, max_tokens=3000, temperature=0.1, **kwargs):
+            text = super().call_model(prompt, max_tokens, temperature, **kwargs)
+            if "WRITE PART 2" in prompt and "Do not mention" not in prompt:
+                return text.replace("closing.", "closing with a gun.")
+            if "PARAGRAPH 1:" in prompt:
+                return "Smooth end.\n\nSmooth blood start."
+            return text
+        
+        def call_model_stream(self, prompt, max_tokens=3000, temperature=0.1, **kwargs):
+            text = self.call_model(prompt, max_tokens, temperature, **kwargs)
+            for start in range(0, len(text), 7):
+                yield text[start:start + 7]
+    
+    storyteller = UnsafePartStoryteller()
+    story = storyteller.generate_story_by_acts("A story about Pip", category="ANIMALS",
+                                               safety_filter=ContentSafetyFilter())
+    assert ContentSafetyFilter().first_hard_violation(story) is None
+    assert story.count("Part 2 closing.") == 1 and "Smooth" not in story
+    assert len(storyteller.prompts) == 1 + 4 + 2
+    
+    class AlwaysUnsafeStoryteller(UnsafePartStoryteller):
+        def call_model(self, prompt, max_tokens=3000, temperature=0.1, **kwargs):
+            return super().call_model(prompt.replace("Do not mention", ""), max_tokens, temperature, **kwargs)
+    
+    try:
+        AlwaysUnsafeStoryteller().generate_story_by_acts("A story about Pip", safety_filter=ContentSafetyFilter())
+        raise AssertionError("expected UnsafeContentError")
+    except UnsafeContentError as e:
+        assert e.violation.term == "gun"
+    
+    class UnsafeJoinStoryteller(UnsafePartStoryteller):
+        def call_model(self, prompt, max_tokens=3000, temperature=0.1, **kwargs):
+            text = ScriptedStoryteller.call_model(self, prompt, max_tokens, temperature, **kwargs)
+            if "Do not mention" in prompt:
+                return text
+            if "WRITE PART 1" in prompt:
+                return text.replace("closing.", "closing, and the old tree looked dead")
+            if "WRITE PART 2" in prompt:
+                return text.replace("Part 2 opening.", "Body of the tree creaked.")
+            return text
+    
+    storyteller = UnsafeJoinStoryteller()
+    story = storyteller.generate_story_by_acts("A story about Pip", safety_filter=ContentSafetyFilter(),
+                                               continuity_pass=False)
+    assert ContentSafetyFilter().first_hard_violation(story) is None
+    assert story.startswith("Part 1 opening.") and "Part 2 opening." in story
+    assert sum("dead body" in prompt for prompt in storyteller.prompts) == 2
+    print("✓ Unsafe parts are regenerated, unsafe seams dropped, unsafe joins rewritten, "
+          "and persistent violations raise")
+
+
+def test_heuristic_judge():
+    """Test the local heuristic pre-judge."""
+    print("\n" + "=" * 60)
+    print("Testing Heuristic Pre-Judge")
+    print("=" * 60)
+    
+    from agents.judge import JudgeAgent
+    from utils.fake_backend import FakeChatBackend
+    from utils.heuristic_judge import HeuristicJudge
+    
+    prejudge = HeuristicJudge()
+    beginning = "Once upon a time there was a little bunny named Pip. Pip loved the meadow. " * 12
+    middle = "But one day Pip got lost in the tall grass. Pip tried to find the way home. " * 20
+    ending = "Finally Pip saw the old oak tree. Pip smiled and hopped home happily. " * 12
+    good_story = "\n\n".join([beginning, middle, ending])
+    
+    result = prejudge.score(good_story)
+    assert result["verdict"] == "pass", result
+    print(f"✓ Well-formed story passes locally (score {result['local_score']:.1f})")
+    
+    result = prejudge.score("Pip extraordinarily contemplated philosophical uncertainties.")
+    assert result["verdict"] == "fail"
+    evaluation = prejudge.to_evaluation(result)
+    assert evaluation["source"] == "heuristic"
+    assert list(evaluation["dimensions"]) == JudgeAgent.EVALUATION_DIMENSIONS
+    assert all(d["source"] == "heuristic" for d in evaluation["dimensions"].values())
+    assert evaluation["dimensions"]["Engagement level"]["score"] is None
+    assert not JudgeAgent(backend=FakeChatBackend()).should_refine(prejudge.to_evaluation(prejudge.score(good_story)))
+    assert any("words; the target is 500-1000" in f for f in result["feedback"])
+    print("✓ Short, hard story fails locally with precise feedback")
+
+
+def test_content_safety():
+    """Test the streaming content-safety filter."""
+    print("\n" + "=" * 60)
+    print("Testing Content-Safety Filter")
+    print("=" * 60)
+    
+    from agents.storyteller import StorytellerAgent
+    from utils.content_safety import ContentSafetyFilter
+    
+    safety_filter = ContentSafetyFilter()
+    assert safety_filter.first_hard_violation("The bunny had a picnic.") is None
+    assert safety_filter.first_hard_violation("There was blood everywhere.").term == "blood"
+    print("✓ Full-text scan finds hard violations")
+    
+    scanner = safety_filter.stream()
+    violation = None
+    for chunk in ["The bird was a kill", "deer. Then the dead ", "body appeared"]:
+        violation = violation or scanner.feed(chunk)
+    violation = violation or scanner.finish()
+    assert violation and violation.term == "dead body", violation
+    print("✓ Terms split across chunks are caught, and 'killdeer' is not 'kill'")
+    
+    text = "The hero had begun to learn new skills. Nobody was ever hurt."
+    whole = [(v.term, v.position) for v in safety_filter.scan(text)]
+    for size in range(1, 12):
+        scanner = safety_filter.stream()
+        for start in range(0, len(text), size):
+            assert scanner.feed(text[start:start + size]) is None, (size, start)
+        assert scanner.finish() is None
+        assert [(v.term, v.position) for v in scanner.soft_violations] == whole, size
+    assert whole == [("hurt", text.index("hurt"))]
+    print("✓ Chunked and whole-text scans agree ('begun' is not 'gun', 'skills' is not 'kills')")
+    
+    class StreamingStoryteller(StorytellerAgent):
+        def __init__(self):
+            self.model = "scripted"
+            self.temperature = 0.8
+            self.attempts = 0
+            self.chunks_read = 0
+        
+        def call_model_stream(self, prompt, max_tokens=3000, temperature=0.1, **kwargs):
+            self.attempts += 1
+            if self.attempts == 1:
+                chunks = ["Once upon a time ", "a knight took his gun ", "and went on ", "and on ", "and on."]
+            else:
+                assert "gun" in prompt
+                chunks = ["Once upon a time ", "a knight planted flowers."]
+            for chunk in chunks:
+                self.chunks_read += 1
+                yield chunk
+    
+    storyteller = StreamingStoryteller()
+    story = storyteller.generate_story("A knight story", safety_filter=safety_filter)
+    assert story == "Once upon a time a knight planted flowers."
+    assert storyteller.attempts == 2 and storyteller.chunks_read == 4
+    print("✓ Unsafe generation aborted early and regenerated")
+
+
+def test_resilience():
+    """Test hedged requests and circuit breakers against the fake backend."""
+    print("\n" + "=" * 60)
+    print("Testing Hedging and Circuit Breakers")
+    print("=" * 60)
+    
+    import threading
+    import time
+    from agents.categorizer import CategorizerAgent
+    from utils.fake_backend import FakeChatBackend
+    from utils.resilience import CircuitOpenError, HedgingPolicy, get_circuit_breaker, reset_circuit_breakers
+    
+    reset_circuit_breakers()
+    backend = FakeChatBackend(latency=0.01)
+    agent = CategorizerAgent(backend=backend)
+    agent.hedging = HedgingPolicy(percentile=95, min_samples=5)
+    for _ in range(5):
+        agent.categorize("A story about a bunny")
+    
+    backend._delays = [2.0]
+    started = time.perf_counter()
+    category, _ = agent.categorize("A story about a bunny")
+    elapsed = time.perf_counter() - started
+    assert category == "ANIMALS" and elapsed < 1.0, elapsed
+    assert agent.hedging.stats["hedge_wins"] == 1
+    print(f"✓ Slow call hedged and answered in {elapsed * 1000:.0f} ms")
+    
+    policy = HedgingPolicy()
+    threads = [threading.Thread(target=lambda: [policy.count("calls") for _ in range(5000)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert policy.stats["calls"] == 40000
+    print("✓ Hedging stats count correctly from concurrent calls")
+    
+    backend = FakeChatBackend(unhealthy_models={"gpt-3.5-turbo"})
+    agent = CategorizerAgent(backend=backend)
+    for _ in range(5):
+        try:
+            agent.categorize("A story about a bunny")
+        except Exception:
+            pass
+    assert get_circuit_breaker("gpt-3.5-turbo").state == "open"
+    calls = len(backend.calls)
+    try:
+        agent.categorize("A story about a bunny")
+        raise AssertionError("Expected CircuitOpenError")
+    except CircuitOpenError:
+        pass
+    assert len(backend.calls) == calls
+    print("✓ Circuit opens after repeated failures and fails fast")
+    
+    agent.fallback_models = ["gpt-4"]
+    category, _ = agent.categorize("A story about a bunny")
+    assert category == "ANIMALS" and backend.calls[-1]["model"] == "gpt-4"
+    print("✓ Open circuit fails over to the fallback model")
+    
+    from agents.storyteller import StorytellerAgent
+    from utils.deadline import Deadline, DeadlineExceeded
+    
+    breaker = get_circuit_breaker("gpt-3.5-turbo")
+    breaker.reset_timeout = 0.0
+    storyteller = StorytellerAgent(backend=FakeChatBackend())
+    assert "".join(storyteller.call_model_stream("Tell a story"))
+    assert breaker.state == "closed"
+    assert storyteller.call_model("Tell a story")
+    print("✓ Successful stream closes a half-open circuit")
+    
+    for _ in range(5):
+        breaker.record_failure()
+    stream = storyteller.call_model_stream("Tell a story")
+    next(stream)
+    stream.close()
+    assert breaker.state == "half_open" and breaker.allow()
+    breaker.release()
+    try:
+        storyteller.call_model("Tell a story", deadline=Deadline(0.0))
+    except DeadlineExceeded:
+        pass
+    assert "".join(storyteller.call_model_stream("Tell a story"))
+    assert breaker.state == "closed"
+    print("✓ Abandoned streams and expired deadlines release the trial slot")
+    reset_circuit_breakers()
+
+
+def test_model_cascade():
+    """Test per-agent model cascades against the fake backend."""
+    print("\n" + "=" * 60)
+    print("Testing Model Cascade Routing")
+    print("=" * 60)
+    
+    from agents.categorizer import CategorizerAgent
+    from utils.fake_backend import FakeChatBackend, default_responder
+    from utils.model_router import RoutingRecorder
+    
+    def responder(messages, model):
+        if model == "gpt-4o-mini" and "dragon" in messages[-1]["content"]:
+            return "I am not sure what this story is about."
+        return default_responder(messages, model)
+    
+    backend = FakeChatBackend(responder=responder)
+    agent = CategorizerAgent(backend=backend)
+    agent.cascade = ["gpt-4o-mini", "gpt-3.5-turbo"]
+    agent.router = RoutingRecorder()
+    
+    assert agent.categorize("A story about a bunny")[0] == "ANIMALS"
+    assert agent.categorize("A story about a dragon")[0] == "ANIMALS"
+    assert [call["model"] for call in backend.calls] == ["gpt-4o-mini", "gpt-4o-mini", "gpt-3.5-turbo"]
+    
+    summary = agent.router.summary()["categorizer"]
+    assert summary["calls"] == 2 and summary["escalations"] == 1
+    assert summary["reasons"] == {"no category in response": 1}
+    assert summary["cost"] < summary["baseline_cost"] * 2
+    print(f"✓ Low-confidence parse escalated ({summary['escalation_rate']:.0%} escalation rate)")
+    
+    recorder = RoutingRecorder(recent=3)
+    for n in range(10):
+        recorder.record({"agent": "judge", "latency": 0.1, "cost": 0.01, "baseline_cost": 0.02,
+                         "escalated": n % 2 == 0, "reason": "score near threshold"})
+    summary = recorder.summary()["judge"]
+    assert len(recorder.decisions) == 3 and summary["calls"] == 10 and summary["escalations"] == 5
+    print("✓ Routing totals stay exact while only recent decisions are kept")
+
+
+def test_deadline():
+    """Test deadline-aware story creation against the fake backend."""
+    print("\n" + "=" * 60)
+    print("Testing Deadline-Aware Pipeline")
+    print("=" * 60)
+    
+    import time
+    from main import StorytellingSystem
+    from utils.fake_backend import FakeChatBackend, default_responder
+    from utils.resilience import reset_circuit_breakers
+    
+    def responder(messages, model):
+        return default_responder(messages, model).replace("SCORE: 8/10", "SCORE: 5/10")
+    
+    # Slow categorizer, fast story and judge, then a refinement that never returns in time
+    backend = FakeChatBackend(responder=responder, latency=0.02, delays=[5.0, 0.0, 0.0, 5.0])
+    system = StorytellingSystem(backend=backend)
+    
+    started = time.perf_counter()
+    result = system.create_story("A story about a bunny", budget_ms=1000)
+    elapsed = time.perf_counter() - started
+    
+    assert elapsed < 1.5, elapsed
+    assert result["partial"] and result["category"] == "ANIMALS"
+    assert result["story"] == result["initial_story"]
+    assert result["evaluation"]["overall_score"] == 5.0
+    print(f"✓ Partial result with best story so far returned in {elapsed * 1000:.0f} ms")
+    reset_circuit_breakers()
+
+
+def test_evaluation_model():
+    """Test the slotted evaluation model and bounded refinement history."""
+    print("\n" + "=" * 60)
+    print("Testing Evaluation Model")
+    print("=" * 60)
+    
+    from main import StorytellingSystem
+    from utils.evaluation_model import Evaluation, RefinementStep
+    from utils.fake_backend import FakeChatBackend, default_responder
+    from utils.resilience import reset_circuit_breakers
+    
+    def responder(messages, model):
+        return default_responder(messages, model).replace("SCORE: 8/10", "SCORE: 5/10")
+    
+    system = StorytellingSystem(backend=FakeChatBackend(responder=responder), history="scores", max_history=1)
+    result = system.create_story("A story about a bunny")
+    assert result["initial_story"] is None
+    assert result["evaluation"]["overall_score"] == 5.0 and result["evaluation"]["raw_response"] == ""
+    
+    loop = system.refinement_loop.refine_story(result["story"], "A story about a bunny", "ANIMALS")
+    assert loop["iterations"] == 2 and len(loop["history"]) == 1
+    step = loop["history"][0]
+    assert step.iteration == 2 and step.story is None and not hasattr(step, "__dict__")
+    print("✓ Scores-only history keeps the last step without story texts")
+    
+    evaluation = system.judge.evaluate_story("Once upon a time.")
+    compact = Evaluation.from_dict(evaluation)
+    data = compact.to_bytes()
+    assert Evaluation.from_bytes(data) == compact
+    assert Evaluation.from_bytes(compact.to_bytes(compress=True)) == compact
+    assert compact.to_dict()["dimensions"] == evaluation["dimensions"]
+    
+    full = RefinementStep.from_evaluation(1, evaluation, "Once upon a time.", "full")
+    full.refinement_method, full.refinement_seconds = "patch", 0.5
+    assert RefinementStep.from_bytes(full.to_bytes()) == full
+    print(f"✓ Binary round trip ({len(data)} bytes vs {len(str(evaluation))} characters as a dict)")
+    reset_circuit_breakers()
+
+
+def test_batch_evaluation():
+    """Test packing several stories into one judge request."""
+    print("\n" + "=" * 60)
+    print("Testing Batched Evaluation")
+    print("=" * 60)
+    
+    from agents.judge import JudgeAgent
+    from utils.fake_backend import FakeChatBackend, default_responder
+    from utils.resilience import reset_circuit_breakers
+    
+    def responder(messages, model):
+        # Drop the second story's section to force a single-story fallback
+        response = default_responder(messages, model)
+        if "=== STORY 2 ===" in response:
+            head, tail = response.split("=== STORY 2 ===")
+            response = head + tail[tail.index("=== STORY 3 ==="):] if "=== STORY 3 ===" in tail else head
+        return response
+    
+    backend = FakeChatBackend(responder=responder)
+    judge = JudgeAgent(backend=backend)
+    stories = [f"Story number {i}. " + "The bunny hopped home. " * 40 for i in range(6)]
+    evaluations = judge.evaluate_many(stories, token_budget=2500)
+    
+    assert len(evaluations) == 6
+    assert all(e["overall_score"] == 8.0 for e in evaluations)
+    assert judge.batch_stats["fallbacks"] >= 1
+    assert len(backend.calls) < len(stories), len(backend.calls)
+    print(f"✓ 6 stories judged in {len(backend.calls)} requests ({judge.batch_stats['fallbacks']} fallback)")
+    reset_circuit_breakers()
+
+
+def test_batch_categorization():
+    """Test classifying many requests per categorizer call."""
+    print("\n" + "=" * 60)
+    print("Testing Batched Categorization")
+    print("=" * 60)
+    
+    from agents.categorizer import CategorizerAgent
+    from main import StorytellingSystem
+    from utils.fake_backend import FakeChatBackend, default_responder
+    from utils.resilience import reset_circuit_breakers
+    
+    def responder(messages, model):
+        # Answer out of order and skip request 2 to exercise mapping and fallback
+        lines = default_responder(messages, model).split("\n")
+        if "STORY REQUESTS:" in messages[-1]["content"]:
+            lines = [line for line in reversed(lines) if not line.startswith("2. ")]
+        return "\n".join(lines)
+    
+    agent = CategorizerAgent(backend=FakeChatBackend(responder=responder))
+    parsed = agent._parse_batch_response('[{"id": 2, "category": "FRIENDSHIP"}, {"id": 1, "category": "ANIMALS"}]', 2)
+    assert parsed[1].startswith("ANIMALS") and parsed[2].startswith("FRIENDSHIP")
+    parsed = agent._parse_batch_response('```json\n[{"id": 1, "category": "MAGIC/FANTASY"}]\n```', 1)
+    assert parsed[1].startswith("MAGIC/FANTASY")
+    
+    requests = [f"A story about puppy number {i}" for i in range(30)] + ["A story about puppy number 0"]
+    results = agent.categorize_many(requests, batch_size=10)
+    assert len(results) == 31 and all(category == "ANIMALS" for category, _ in results)
+    assert agent.batch_stats == {"requests": 3, "classified": 27, "fallbacks": 3}, agent.batch_stats
+    print(f"✓ 31 requests categorized in {len(agent.backend.calls)} calls (3 batches + 3 fallbacks)")
+    
+    backend = FakeChatBackend()
+    system = StorytellingSystem(backend=backend)
+    stories = system.create_stories(["A bunny story", "A kitten story", "A puppy story"], enable_refinement=False)
+    assert [s["category"] for s in stories] == ["ANIMALS"] * 3
+    assert sum("STORY REQUESTS:" in call["messages"][-1]["content"] for call in backend.calls) == 1
+    assert len(backend.calls) == 4
+    print("✓ create_stories categorizes the whole batch in one call")
+    reset_circuit_breakers()
+
+
+def test_cassette():
+    """Test recording LLM traffic and replaying it offline."""
+    print("\n" + "=" * 60)
+    print("Testing Record/Replay Cassettes")
+    print("=" * 60)
+    
+    import os
+    import tempfile
+    import openai
+    from main import StorytellingSystem
+    from utils.cassette import CassetteMissError, ReplayBackend
+    from utils.fake_backend import FakeChatBackend
+    from utils.resilience import reset_circuit_breakers
+    
+    path = os.path.join(tempfile.mkdtemp(), "traffic.jsonl.gz")
+    system = StorytellingSystem(backend=FakeChatBackend(latency=0.01), use_safety_filter=True)
+    with system.enable_recording(path) as recorder:
+        recorded = system.create_story("A story about a bunny")
+        try:
+            system.judge.backend.create(model="missing", messages=[], max_tokens=1, request_timeout=0.0)
+        except openai.error.Timeout:
+            pass
+    
+    backend = ReplayBackend(path, speed=0)
+    assert len(backend) == recorder.recorded
+    replayed = StorytellingSystem(backend=backend, use_safety_filter=True).create_story("A story about a bunny")
+    assert replayed["story"] == recorded["story"]
+    assert replayed["evaluation"]["overall_score"] == recorded["evaluation"]["overall_score"]
+    
+    try:
+        backend.create(model="missing", messages=[], max_tokens=1)
+        assert False, "recorded error should be raised again"
+    except openai.error.Timeout:
+        pass
+    try:
+        backend.create(model="gpt-3.5-turbo", messages=[{"role": "user", "content": "new"}])
+        assert False, "unrecorded request should miss"
+    except CassetteMissError:
+        pass
+    print(f"✓ {recorder.recorded} calls (including a stream and an error) replayed identically")
+    reset_circuit_breakers()
+
+
+def test_hooks_and_profiler():
+    """Test call and stage hooks and the pipeline profiler."""
+    print("\n" + "=" * 60)
+    print("Testing Hooks and Profiler")
+    print("=" * 60)
+    
+    from main import StorytellingSystem
+    from utils.fake_backend import FakeChatBackend
+    from utils.profiling import PipelineProfiler
+    from utils.resilience import reset_circuit_breakers
+    
+    system = StorytellingSystem(backend=FakeChatBackend(latency=0.01), use_safety_filter=True)
+    events = []
+    system.hooks.subscribe("pre_call", lambda e: events.append((e["event"], e["agent"])))
+    system.hooks.subscribe("post_call", lambda e: events.append((e["event"], e["agent"])))
+    system.hooks.subscribe("stage_start", lambda e: events.append((e["event"], e["stage"])))
+    
+    with PipelineProfiler(system.hooks, top=5) as profiler:
+        system.create_story("A story about a bunny")
+    
+    assert events == [
+        ("stage_start", "categorize"), ("pre_call", "categorizer"), ("post_call", "categorizer"),
+        ("stage_start", "generate"), ("pre_call", "storyteller"), ("post_call", "storyteller"),
+        ("stage_start", "refine"), ("pre_call", "judge"), ("post_call", "judge")
+    ], events
+    summary = profiler.summary()
+    assert set(summary["stages"]) == {"categorize", "generate", "refine"}
+    assert summary["network_seconds"] >= 0.03 and summary["hot_spots"] and summary["allocations"]
+    assert "Local hot spots" in profiler.report()
+    print(f"✓ {len(events)} hook events; {summary['network_seconds'] * 1000:.0f} ms waiting on LLM calls, "
+          f"{summary['cpu_seconds'] * 1000:.0f} ms local CPU")
+    
+    from utils.profiling import _WAIT_FUNCTIONS, _qualified_builtin
+    
+    assert _qualified_builtin("<method 'recv_into' of '_socket.socket' objects>") in _WAIT_FUNCTIONS
+    assert _qualified_builtin("<built-in method time.sleep>") in _WAIT_FUNCTIONS
+    for busy in ("<built-in method _thread.start_new_thread>", "<method 'read' of '_io.TextIOWrapper' objects>",
+                 "<built-in method select.poll>", "<method 'release' of '_thread.lock' objects>"):
+        assert _qualified_builtin(busy) not in _WAIT_FUNCTIONS, busy
+    print("✓ Only blocking built-ins count as profiled wait time")
+    reset_circuit_breakers()
+
+
+def test_metrics():
+    """Test pipeline metrics and the Prometheus exposition."""
+    print("\n" + "=" * 60)
+    print("Testing Metrics")
+    print("=" * 60)
+    
+    import os
+    import tempfile
+    from main import StorytellingSystem
+    from utils.fake_backend import FakeChatBackend, default_responder
+    from utils.metrics import Histogram, log_linear_buckets
+    from utils.resilience import reset_circuit_breakers
+    
+    buckets = log_linear_buckets(-1, 1)
+    assert buckets[:3] == [0.1, 0.2, 0.3] and buckets[-1] == 10.0 and len(buckets) == 19
+    histogram = Histogram("h", "test", [1.0, 2.0])
+    for value in (0.5, 1.0, 1.5, 5.0):
+        histogram.observe(value)
+    assert histogram.render() == [
+        'h_bucket{le="1"} 2', 'h_bucket{le="2"} 3', 'h_bucket{le="+Inf"} 4', "h_sum 8", "h_count 4"
+    ]
+    
+    def responder(messages, model):
+        return default_responder(messages, model).replace("SCORE: 8/10", "SCORE: 5/10")
+    
+    system = StorytellingSystem(backend=FakeChatBackend(responder=responder), collect_metrics=True)
+    system.create_story("A story about a bunny")
+    metrics = system.metrics
+    assert metrics.iterations.count() == 1
+    assert metrics.stories.values() == {(("refinement_triggered", "true"), ("source", "live")): 1.0}
+    assert metrics.categories.values() == {(("category", "ANIMALS"),): 1.0}
+    assert metrics.scores.count({"dimension": "overall"}) == 1
+    assert metrics.call_seconds.count({"agent": "judge", "model": "gpt-3.5-turbo"}) == 2
+    
+    dimensions = {"engagement level": {"score": 7.0}, "Sparkle factor": {"score": 9.0}, "Vibes": {"score": 6.0}}
+    system.hooks.emit("story_end", refinements=0, from_pool=False, category="ANIMALS", iterations=0,
+                      evaluation={"overall_score": 7.0, "dimensions": dimensions})
+    assert metrics.scores.count({"dimension": "Engagement level"}) == 2
+    assert metrics.scores.count({"dimension": "other"}) == 2
+    assert metrics.scores.count({"dimension": "Vibes"}) == 0
+    
+    path = os.path.join(tempfile.mkdtemp(), "story.prom")
+    metrics.write(path)
+    with open(path) as f:
+        text = f.read()
+    assert "# TYPE story_llm_call_seconds histogram" in text
+    assert 'story_llm_tokens_total{agent="storyteller",direction="out",model="gpt-3.5-turbo"}' in text
+    print(f"✓ {len(text.splitlines())} exposition lines written")
+    reset_circuit_breakers()
+
+
+def test_batch_runner():
+    """Test the multi-process batch runner with a shared cache and rate limit."""
+    print("\n" + "=" * 60)
+    print("Testing Batch Runner")
+    print("=" * 60)
+    
+    import functools
+    import os
+    import tempfile
+    import time
+    from utils.batch_runner import BatchRunner, FileRateLimiter
+    from utils.fake_backend import FakeChatBackend
+    
+    directory = tempfile.mkdtemp()
+    limiter = FileRateLimiter(os.path.join(directory, "limit.json"), rate=50, burst=5)
+    started = time.perf_counter()
+    for _ in range(10):
+        limiter.acquire()
+    assert time.perf_counter() - started >= 0.09
+    
+    runner = BatchRunner(
+        workers=2,
+        cache_path=os.path.join(directory, "cache.sqlite"),
+        requests_per_second=200,
+        backend_factory=functools.partial(FakeChatBackend, latency=0.01)
+    )
+    requests = [f"A story about bunny number {i}" for i in range(6)]
+    results = runner.run(requests, enable_refinement=False)
+    assert [r["request"] for r in results] == requests
+    assert all("error" not in r and r["category"] == "ANIMALS" for r in results)
+    cached = len(runner.cache)
+    assert cached > 0
+    
+    runner.run(requests, enable_refinement=False)
+    assert len(runner.cache) == cached
+    print(f"✓ 6 requests on 2 processes merged in order; rerun served from {cached} cached responses")
+    
+    import utils.batch_runner as batch_runner
+    from main import StorytellingSystem
+    
+    def broken(requests):
+        raise RuntimeError("batch categorization failed")
+    
+    batch_runner._worker_system = StorytellingSystem(backend=FakeChatBackend())
+    batch_runner._worker_system.categorizer.categorize_many = broken
+    try:
+        results = batch_runner._run_shard([(0, "A bunny story"), (1, "A kitten story")], 2, {"enable_refinement": False})
+    finally:
+        batch_runner._worker_system = None
+    assert [index for index, _ in results] == [0, 1]
+    assert all("error" not in result and result["category"] == "ANIMALS" for _, result in results)
+    print("✓ A failed batch categorization falls back to per-request categorization")
+
+
+def test_modify_story():
+    """Test the incremental modification path: one edit call and a focused re-judge."""
+    print("\n" + "=" * 60)
+    print("Testing Incremental Story Modification")
+    print("=" * 60)
+    
+    import json
+    from main import StorytellingSystem
+    from utils.fake_backend import FakeChatBackend, default_responder
+    
+    def responder(messages, model):
+        if "REQUESTED CHANGE:" in messages[-1]["content"]:
+            return json.dumps({"replacements": [{"paragraph": 3, "text": "Pip's sister Lily found the oak tree first."}]})
+        return default_responder(messages, model)
+    
+    backend = FakeChatBackend(responder=responder)
+    system = StorytellingSystem(backend=backend)
+    result = system.create_story("A story about a bunny who gets lost")
+    calls = len(backend.calls)
+    
+    modified = system.modify_story(result, "Give Pip a sister", "A story about a bunny who gets lost")
+    assert len(backend.calls) - calls == 2
+    assert modified["category"] == result["category"]
+    assert modified["story"].endswith("Pip's sister Lily found the oak tree first.")
+    assert modified["edit"] == {"method": "patch", "rejudged": ["Age-appropriateness", "Character development"]}
+    assert set(modified["evaluation"]["dimensions"]) == set(result["evaluation"]["dimensions"])
+    assert "Character development" in backend.calls[-1]["messages"][-1]["content"]
+    assert "Engagement level" not in backend.calls[-1]["messages"][-1]["content"]
+    print(f"✓ Modification took 2 LLM calls (patch edit + judge on {', '.join(modified['edit']['rejudged'])})")
+    
+    previous = {
+        "dimensions": {
+            "Age-Appropriateness": {"score": 2.0, "reasoning": "", "suggestions": ["Remove the wolf"]},
+            "Engagement Level": {"score": 9.0, "reasoning": "", "suggestions": []}
+        },
+        "overall_score": 5.5,
+        "overall_assessment": "The wolf scene is too scary.",
+        "key_improvements": ["Remove the wolf"]
+    }
+    evaluation = system.judge.evaluate_dimensions(modified["story"], ["Age-appropriateness"], previous=previous)
+    assert set(evaluation["dimensions"]) == {"Age-appropriateness", "Engagement level"}
+    assert evaluation["overall_score"] == (8.0 + 9.0) / 2
+    assert "wolf" not in evaluation["overall_assessment"] and "Remove the wolf" not in evaluation["key_improvements"]
+    print("✓ Re-judged dimensions replace differently cased ones and stale summaries are dropped")
+    
+    fallback = StorytellingSystem(backend=FakeChatBackend()).storyteller.edit_story(
+        result["story"], "Make it funnier", "A bunny story", "ANIMALS"
+    )
+    assert fallback[1] == "rewrite"
+    print("✓ Unparseable edit falls back to a rewrite")
+
+
+def test_speculative_generation():
+    """Test speculative generation overlapped with categorization."""
+    print("\n" + "=" * 60)
+    print("Testing Speculative Generation")
+    print("=" * 60)
+    
+    import threading
+    from main import StorytellingSystem
+    from utils.fake_backend import FakeChatBackend, default_responder
+    from utils.speculation import SpeculationCancelled
+    
+    backend = FakeChatBackend(latency=0.02)
+    system = StorytellingSystem(backend=backend, speculative=True)
+    result = system.create_story("A story about a bunny who gets lost", enable_refinement=False)
+    assert result["category"] == "ANIMALS"
+    assert len(backend.calls) == 2
+    stats = system.speculation.summary()
+    assert stats["hits"] == 1 and stats["misses"] == 0 and stats["saved_seconds"] > 0
+    print(f"✓ Agreeing categories keep the speculative story ({stats['saved_seconds'] * 1000:.0f}ms saved)")
+    
+    def responder(messages, model):
+        if "story classifier" in messages[-1]["content"]:
+            return "ADVENTURE - The bunny goes on a journey."
+        return default_responder(messages, model)
+    
+    backend = FakeChatBackend(responder=responder, latency=0.02)
+    system = StorytellingSystem(backend=backend, speculative=True)
+    result = system.create_story("A story about a bunny who gets lost", enable_refinement=False)
+    assert result["category"] == "ADVENTURE"
+    story_prompts = [c["messages"][-1]["content"] for c in backend.calls if "STORY CATEGORY:" in c["messages"][-1]["content"]]
+    assert len(story_prompts) == 2 and "STORY CATEGORY: ADVENTURE" in story_prompts[-1]
+    assert system.speculation.summary()["miss_rate"] == 1.0
+    print("✓ Disagreeing categories cancel the speculation and regenerate")
+    
+    cancel = threading.Event()
+    cancel.set()
+    try:
+        "".join(system.storyteller.call_model_stream("Tell a story", cancel=cancel))
+        assert False, "Expected SpeculationCancelled"
+    except SpeculationCancelled:
+        pass
+    print("✓ Setting the cancel event stops a stream")
+
+
+def test_daemon():
+    """Test the Unix socket daemon and its client."""
+    print("\n" + "=" * 60)
+    print("Testing Daemon and Client")
+    print("=" * 60)
+    
+    import os
+    import tempfile
+    import threading
+    import client
+    from daemon import StoryDaemon
+    from main import StorytellingSystem
+    from utils.fake_backend import FakeChatBackend
+    
+    socket_path = os.path.join(tempfile.mkdtemp(), "story.sock")
+    system = StorytellingSystem(backend=FakeChatBackend(), collect_metrics=True)
+    daemon = StoryDaemon(socket_path, system=system, workers=2)
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+    assert daemon.ready.wait(5)
+    
+    try:
+        assert list(client.send({"command": "ping"}, socket_path))[-1]["pid"] == os.getpid()
+        events = list(client.send({
+            "command": "story",
+            "request": "A story about a bunny",
+            "options": {"enable_refinement": False}
+        }, socket_path))
+        assert [e["stage"] for e in events if e["event"] == "stage"] == ["categorize", "generate"]
+        assert events[-1]["event"] == "result" and events[-1]["result"]["category"] == "ANIMALS"
+        print("✓ Story request streamed stage timings and the result")
+        
+        bad = list(client.send({"command": "story", "request": "x", "options": {"show_details": True}}, socket_path))
+        assert bad == [{"event": "error", "error": bad[0]["error"]}] and "show_details" in bad[0]["error"]
+        metrics = list(client.send({"command": "metrics"}, socket_path))[-1]["text"]
+        assert 'story_stories_total{refinement_triggered="false",source="live"} 1' in metrics
+        print("✓ Unknown options rejected; metrics served from the warm system")
+    finally:
+        daemon.shutdown()
+        thread.join(5)
+    assert not os.path.exists(socket_path)
+    try:
+        list(client.send({"command": "ping"}, socket_path))
+        assert False, "Expected ConnectionError"
+    except ConnectionError:
+        pass
+    print("✓ Socket removed on shutdown; client reports a missing daemon")
+
+
+def test_truncation_continuation():
+    """Test that responses cut off at max_tokens are continued."""
+    print("\n" + "=" * 60)
+    print("Testing Truncation Continuation")
+    print("=" * 60)
+    
+    from main import StorytellingSystem
+    from utils.fake_backend import FAKE_STORY, FakeChatBackend, _evaluation_text
+    
+    backend = FakeChatBackend()
+    system = StorytellingSystem(backend=backend, collect_metrics=True)
+    text = system.judge.call_model("You are an expert evaluator.", max_tokens=80)
+    assert text == _evaluation_text()
+    assert len(backend.calls) >= 2
+    assert backend.calls[-1]["messages"][-2]["role"] == "assistant"
+    truncations = system.metrics.truncations.values()
+    assert truncations == {(("agent", "judge"), ("model", system.judge.model)): len(backend.calls) - 1}
+    print(f"✓ Cut-off judge output was completed with {len(backend.calls) - 1} continuation request(s)")
+    
+    streamed = "".join(system.storyteller.call_model_stream("Tell a story", max_tokens=100))
+    assert streamed == FAKE_STORY
+    print("✓ Streamed story continued after hitting max_tokens")
+    
+    system.judge.max_continuations = 0
+    assert len(system.judge.call_model("You are an expert evaluator.", max_tokens=80)) == 320
+    print("✓ max_continuations=0 returns the cut-off text")
+    
+    from agents.base_agent import StreamAbortedError
+    
+    errors = []
+    system.hooks.subscribe("post_call", lambda event: errors.append(event["error"]))
+    stream = system.storyteller.call_model_stream("Tell a story")
+    next(stream)
+    stream.close()
+    assert isinstance(errors[-1], StreamAbortedError)
+    assert 'outcome="error"' in system.metrics.render()
+    print("✓ Streams closed early are reported as aborted, not successful")
+
+
+def test_fake_backend_load_behaviour():
+    """Test the fake backend's per-token latency and rate limit."""
+    print("\n" + "=" * 60)
+    print("Testing Fake Backend Load Behaviour")
+    print("=" * 60)
+    
+    import time
+    import openai
+    from utils.fake_backend import FakeChatBackend
+    
+    backend = FakeChatBackend(seconds_per_token=0.001, requests_per_minute=2)
+    messages = [{"role": "user", "content": "Tell a story"}]
+    started = time.perf_counter()
+    backend.create(model="gpt-3.5-turbo", messages=messages)
+    assert time.perf_counter() - started >= 0.1
+    backend.create(model="gpt-3.5-turbo", messages=messages, max_tokens=10)
+    try:
+        backend.create(model="gpt-3.5-turbo", messages=messages)
+        assert False, "Expected RateLimitError"
+    except openai.error.RateLimitError:
+        pass
+    print("✓ Long answers take longer; calls over the per-minute limit are rejected")
+
+
+def test_refinement_policy():
+    """Test the learned refinement policy and its early stop in the loop."""
+    print("\n" + "=" * 60)
+    print("Testing Refinement Policy")
+    print("=" * 60)
+    
+    import random
+    from main import StorytellingSystem
+    from utils.fake_backend import FakeChatBackend, default_responder
+    from utils.refinement_policy import RefinementPolicy
+    
+    def responder(messages, model):
+        return default_responder(messages, model).replace("SCORE: 8/10", "SCORE: 5/10")
+    
+    system = StorytellingSystem(backend=FakeChatBackend(responder=responder))
+    result = system.refinement_loop.refine_story("Once upon a time.", "A bunny story", "ANIMALS")
+    history = result["history"]
+    policy = RefinementPolicy()
+    examples = policy.examples("ANIMALS", history)
+    assert len(examples) == 1 and examples[0][1] == 0.0
+    assert len(examples[0][0]) == len(RefinementPolicy.FEATURES)
+    
+    rng = random.Random(0)
+    synthetic = []
+    for _ in range(200):
+        x = [rng.random() for _ in RefinementPolicy.FEATURES]
+        x[0] = 1.0
+        synthetic.append((x, 3.0 * (1.0 - x[6]) - 0.5))
+    policy = RefinementPolicy(alpha=0.01).fit_examples(synthetic)
+    probe = [0.5] * len(RefinementPolicy.FEATURES)
+    probe[0] = 1.0
+    assert abs(policy.predict(probe) - 1.0) < 0.1
+    print(f"✓ Ridge fit recovers a linear gain ({policy.predict(probe):.2f} predicted, 1.00 expected)")
+    
+    backend = FakeChatBackend(responder=responder)
+    system = StorytellingSystem(backend=backend, refinement_policy=RefinementPolicy(), min_expected_gain=0.5)
+    result = system.refinement_loop.refine_story("Once upon a time.", "A bunny story", "ANIMALS")
+    assert result["stopped_by_policy"] and result["refinements"] == 0 and len(backend.calls) == 1
+    print("✓ Loop stops before a refinement predicted to gain too little")
+
+
+def test_parallel_judging():
+    """Test judging each dimension in its own concurrent call."""
+    print("\n" + "=" * 60)
+    print("Testing Parallel Per-Dimension Judging")
+    print("=" * 60)
+    
+    import time
+    from agents.judge import JudgeAgent
+    from main import StorytellingSystem
+    from utils.fake_backend import FakeChatBackend
+    
+    backend = FakeChatBackend(latency=0.1)
+    judge = JudgeAgent(backend=backend)
+    judge.parallel_dimensions = True
+    started = time.perf_counter()
+    evaluation = judge.evaluate_story("Once upon a time, a bunny hopped home.")
+    elapsed = time.perf_counter() - started
+    assert list(evaluation["dimensions"]) == JudgeAgent.EVALUATION_DIMENSIONS
+    assert evaluation["overall_score"] == 8.0
+    assert len(backend.calls) == len(JudgeAgent.EVALUATION_DIMENSIONS)
+    assert all(call["max_tokens"] == 150 for call in backend.calls)
+    assert elapsed < 0.3, f"expected about one call's latency, took {elapsed:.2f}s"
+    print(f"✓ {len(backend.calls)} concurrent dimension calls in {elapsed:.2f}s (one call takes 0.10s)")
+    
+    backend = FakeChatBackend()
+    judge = JudgeAgent(backend=backend)
+    evaluation = judge.evaluate_parallel("Once upon a time.", groups=[
+        ["Age-appropriateness", "Narrative coherence"],
+        ["Character development", "Engagement level", "Educational/moral value"]
+    ])
+    assert len(backend.calls) == 2 and len(evaluation["dimensions"]) == 5
+    print("✓ Dimension groups share one call each")
+    
+    system = StorytellingSystem(backend=FakeChatBackend(), parallel_judging=True)
+    result = system.create_story("A bunny story")
+    assert result["evaluation"]["overall_score"] == 8.0
+    assert list(result["evaluation"]["dimensions"]) == JudgeAgent.EVALUATION_DIMENSIONS
+    print("✓ Pipeline runs with parallel judging")
+
+
+def test_client_pool():
+    """Test spreading calls over several credentials and endpoints."""
+    print("\n" + "=" * 60)
+    print("Testing Client Pool")
+    print("=" * 60)
+    
+    import threading
+    import openai
+    from agents.storyteller import StorytellerAgent
+    from utils.client_pool import ClientPool, Credential, parse_credentials
+    from utils.fake_backend import FakeChatBackend
+    
+    credentials = parse_credentials("sk-one, sk-two@http://127.0.0.1:8001/v1")
+    assert [(c.api_key, c.api_base) for c in credentials] == [("sk-one", None), ("sk-two", "http://127.0.0.1:8001/v1")]
+    print("✓ OPENAI_API_KEYS entries parsed with optional endpoints")
+    
+    first, second = FakeChatBackend(latency=0.1), FakeChatBackend(latency=0.1)
+    pool = ClientPool([Credential("sk-one", backend=first), Credential("sk-two", backend=second)])
+    messages = [{"role": "user", "content": "Hello"}]
+    threads = [threading.Thread(target=pool.create, kwargs={"model": "m", "messages": messages}) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(first.calls) == 2 and len(second.calls) == 2
+    assert all(entry["in_flight"] == 0 for entry in pool.summary())
+    print("✓ Concurrent calls spread evenly over the least-loaded endpoints")
+    
+    limited, spare = FakeChatBackend(requests_per_minute=1), FakeChatBackend()
+    pool = ClientPool([Credential("sk-limited", backend=limited), Credential("sk-spare", backend=spare)])
+    for _ in range(4):
+        pool.create(model="m", messages=messages)
+    summary = pool.summary()
+    assert summary[0]["rate_limited"] == 1 and summary[0]["cooldown_seconds"] > 0
+    assert len(spare.calls) == 3
+    print("✓ Rate-limited credential cools down while calls retry on another")
+    
+    pool = ClientPool([Credential("sk-only", backend=FakeChatBackend(requests_per_minute=1))])
+    pool.create(model="m", messages=messages)
+    try:
+        pool.create(model="m", messages=messages)
+        raise AssertionError("expected RateLimitError")
+    except openai.error.RateLimitError:
+        pass
+    print("✓ RateLimitError raised once every credential is limited")
+    
+    backends = [FakeChatBackend(), FakeChatBackend()]
+    pool = ClientPool([Credential(f"sk-{n}", backend=b) for n, b in enumerate(backends)])
+    storyteller = StorytellerAgent(backend=pool)
+    assert "".join(storyteller.call_model_stream("Tell a story"))
+    assert storyteller.call_model("Tell a story")
+    assert [len(b.calls) for b in backends] == [1, 1]
+    assert all(entry["in_flight"] == 0 for entry in pool.summary())
+    print("✓ Agents stream and call through the pool")
+    
+    import utils.batch_runner as batch_runner
+    import utils.client_pool as client_pool
+    saved = client_pool._default_pool
+    client_pool._default_pool = pool
+    try:
+        batch_runner._init_worker({"backend_factory": None, "rate_limiter": None, "cache": None, "system_kwargs": {}})
+        assert batch_runner._worker_system.storyteller.backend is pool
+    finally:
+        client_pool._default_pool = saved
+        batch_runner._worker_system = None
+    print("✓ Batch workers default to the shared client pool")
+
+
+def test_story_archive():
+    """Test the append-only compressed story archive."""
+    print("\n" + "=" * 60)
+    print("Testing Story Archive")
+    print("=" * 60)
+    
+    import os
+    import shutil
+    import tempfile
+    from utils.story_archive import StoryArchive
+    
+    directory = tempfile.mkdtemp()
+    try:
+        archive = StoryArchive(directory, max_segment_bytes=500)
+        result = {"story": "Once upon a time, a bunny hopped home. " * 20, "category": "ANIMALS"}
+        ids = [archive.append(dict(result, n=n)) for n in range(40)]
+        assert ids == list(range(40)) and len(archive) == 40
+        stats = archive.stats()
+        assert stats["segments"] > 1 and stats["compression_ratio"] > 2
+        assert archive.get(27)["n"] == 27
+        assert [r["n"] for r in archive.scan(35)] == [35, 36, 37, 38, 39]
+        print(f"✓ {stats['records']} records in {stats['segments']} segments, {stats['compression_ratio']:.1f}x compressed")
+        
+        # An interrupted append leaves data without an index entry; it stays invisible
+        with open(archive._segments[-1].data_path, "ab") as f:
+            f.write(b"partial record")
+        assert archive.append(dict(result, n=40)) == 40 and archive.get(40)["n"] == 40
+        print("✓ Random reads by id and streaming scans; torn writes are ignored")
+        
+        archive.max_segment_bytes = 1024 * 1024
+        compaction = archive.compact(codec="lzma")
+        assert compaction["segments_after"] == 1
+        assert archive.get(27)["n"] == 27 and len(archive) == 41
+        archive.append(dict(result, n=41))
+        archive.close()
+        
+        reopened = StoryArchive(directory)
+        assert len(reopened) == 42 and reopened.get(41)["n"] == 41
+        assert [r["n"] for r in reopened.scan()] == list(range(42))
+        reopened.close()
+        print("✓ Compaction merges segments and keeps record ids")
+        
+        crashed = os.path.join(directory, "crashed")
+        archive = StoryArchive(crashed, max_segment_bytes=500)
+        for n in range(20):
+            archive.append(dict(result, n=n))
+        archive.max_segment_bytes = 1024 * 1024
+        
+        def crash(temp):
+            # Die after swapping in the merged data file but before its index
+            name = f"{0:012d}.seg"
+            os.replace(os.path.join(temp, name), os.path.join(crashed, name))
+            raise KeyboardInterrupt
+        
+        archive._finish_merge = crash
+        try:
+            archive.compact()
+            raise AssertionError("expected the simulated crash")
+        except KeyboardInterrupt:
+            pass
+        archive.close()
+        reopened = StoryArchive(crashed)
+        assert len(reopened._segments) == 1 and not os.path.exists(os.path.join(crashed, "compact.tmp"))
+        assert [r["n"] for r in reopened.scan()] == list(range(20))
+        reopened.close()
+        
+        os.makedirs(os.path.join(crashed, "compact.tmp"))
+        with open(os.path.join(crashed, "compact.tmp", f"{0:012d}.seg"), "wb") as f:
+            f.write(b"half-written merge")
+        reopened = StoryArchive(crashed)
+        assert reopened.get(19)["n"] == 19 and os.path.exists(os.path.join(crashed, "compact.tmp"))
+        assert reopened.compact()["segments_after"] == 1 and not os.path.exists(os.path.join(crashed, "compact.tmp"))
+        reopened.close()
+        
+        with open(os.path.join(crashed, f"{0:012d}.seg"), "r+b") as f:
+            f.truncate(100)
+        try:
+            StoryArchive(crashed)
+            raise AssertionError("expected ValueError")
+        except ValueError as e:
+            assert "Index does not match" in str(e)
+        print("✓ Interrupted compactions are finished or discarded on open; mismatched indexes are refused")
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_budget_governor():
+    """Test token budgets and graceful degradation."""
+    print("\n" + "=" * 60)
+    print("Testing Budget Governor")
+    print("=" * 60)
+    
+    import os
+    import pickle
+    import tempfile
+    from main import StorytellingSystem
+    from utils.budget_governor import BudgetExceededError, BudgetGovernor, BudgetLimit
+    from utils.fake_backend import FakeChatBackend
+    
+    path = os.path.join(tempfile.mkdtemp(), "budget.db")
+    limits = [BudgetLimit("global", 10_000_000), BudgetLimit("tenant:*", 10_000), BudgetLimit("tenant:vip", 100_000)]
+    governor = BudgetGovernor(path, limits, refresh_seconds=0.0)
+    governor.record("storyteller", 5000, 2000, tenant="acme")
+    assert governor.spent("tenant:acme") == 7000 and governor.spent("agent:storyteller") == 7000
+    assert governor.level("acme") == "skip_refinement"
+    assert governor.level("vip") == "normal" and governor.level() == "normal"
+    
+    # Another process sharing the file sees the same spend
+    other = pickle.loads(pickle.dumps(governor))
+    other.record("judge", 1000, 500, tenant="acme")
+    assert governor.level("acme") == "scores_only"
+    print(f"✓ Spend shared through the store ({governor.summary('acme')['level']} at 85%)")
+    
+    backend = FakeChatBackend()
+    system = StorytellingSystem(backend=backend, budget_governor=governor, story_pool_size=1)
+    before = governor.spent("tenant:fresh")
+    result = system.create_story("A story about a girl who finds a magic paintbrush", tenant="fresh")
+    assert result["budget_level"] == "normal" and governor.spent("tenant:fresh") > before
+    print(f"✓ Tenant charged {governor.spent('tenant:fresh')} tokens for a full story")
+    
+    calls = len(backend.calls)
+    result = system.create_story("A story about a girl who finds a magic paintbrush", tenant="acme")
+    judge_prompts = [call["messages"][-1]["content"] for call in backend.calls[calls:] if "expert evaluator" in call["messages"][-1]["content"]]
+    assert result["budget_level"] == "scores_only" and result["refinements"] == 0
+    assert len(judge_prompts) == 1 and "SCORES ONLY" in judge_prompts[0]
+    assert result["evaluation"]["overall_score"] == 8.0
+    print("✓ Low budget switches to the scores-only judge without refinement")
+    
+    governor.record("storyteller", 9600, 0, tenant="lean")
+    calls = len(backend.calls)
+    result = system.create_story("A story about a girl who finds a magic paintbrush", tenant="lean")
+    prompts = [call["messages"][-1]["content"] for call in backend.calls[calls:]]
+    assert result["budget_level"] == "pool_only" and not result["from_pool"] and result["evaluation"] is None
+    assert len(prompts) == 1 and "expert evaluator" not in prompts[0]
+    print("✓ Pool miss near the cap costs a single unjudged storyteller call")
+    
+    governor.record("storyteller", 5000, 0, tenant="acme")
+    try:
+        system.create_story("A story about a girl who finds a magic paintbrush", tenant="acme")
+        raise AssertionError("expected BudgetExceededError")
+    except BudgetExceededError:
+        pass
+    system.story_pool.refill()
+    result = system.create_story("A story about a dragon", tenant="acme")
+    assert result["from_pool"] and result["budget_level"] == "exhausted"
+    assert system.story_pool.can_fill()
+    governor.record("storyteller", 9_000_000, 0)
+    assert not system.story_pool.can_fill()
+    system.close()
+    print("✓ Spent budget serves pooled stories only, else raises BudgetExceededError; the filler pauses")
+
+
 def test_agents(api_available: bool):
     """Test the agent implementations."""
     if not api_available:
@@ -198,6 +1451,33 @@ def main():
     # Test story arc retrieval
     test_story_arc_retrieval()
     
+    # Test offline pipeline components
+    test_story_pool()
+    test_story_patches()
+    test_parallel_acts()
+    test_heuristic_judge()
+    test_content_safety()
+    test_resilience()
+    test_model_cascade()
+    test_deadline()
+    test_evaluation_model()
+    test_batch_evaluation()
+    test_batch_categorization()
+    test_cassette()
+    test_hooks_and_profiler()
+    test_metrics()
+    test_batch_runner()
+    test_modify_story()
+    test_speculative_generation()
+    test_daemon()
+    test_truncation_continuation()
+    test_fake_backend_load_behaviour()
+    test_refinement_policy()
+    test_parallel_judging()
+    test_client_pool()
+    test_story_archive()
+    test_budget_governor()
+    
     # Test API connection (requires .env to be set)
     api_connected = test_api_connection()
     
@@ -0,0 +1,335 @@
+"""Multi-process sharded batch runs with a shared disk cache and rate limit."""
+
+import fcntl
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from openai.openai_object import OpenAIObject
+
+from utils.cassette import request_key
+
+
+class DiskCache:
+    """
+    Process-safe response cache in a SQLite file.
+
+    Every process opens its own connection (WAL mode, so readers never
+    block the writer); connections are reopened after a fork.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize the cache.
+
+        Args:
+            path: SQLite database file (created if missing)
+        """
+        self.path = path
+        self._local = threading.local()
+        # Not kept open: SQLite connections must not be carried across a fork
+        conn = sqlite3.connect(path, timeout=30)
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL)"
+            )
+        conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it if needed (or after a fork)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return the cached response for a key, or None."""
+        row = self._connect().execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, response: Dict):
+        """Store a response (the first writer of a key wins)."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO responses (key, response, created) VALUES (?, ?, ?)",
+                (key, json.dumps(response, ensure_ascii=False), time.time())
+            )
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self._local = threading.local()
+
+
+class CachingBackend:
+    """
+    Serves repeated non-streaming requests from a DiskCache.
+
+    Requests are keyed like cassettes (model, messages, max_tokens,
+    temperature). Only completed responses are cached; streams pass through.
+    """
+
+    def __init__(self, inner, cache: DiskCache):
+        """
+        Initialize the caching backend.
+
+        Args:
+            inner: Backend to call on a cache miss
+            cache: Shared response cache
+        """
+        self.inner = inner
+        self.cache = cache
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs):
+        """Mimic ``openai.ChatCompletion.create`` with a cache in front."""
+        if kwargs.get("stream"):
+            return self.inner.create(**kwargs)
+
+        key = request_key(kwargs)
+        cached = self.cache.get(key)
+        with self._lock:
+            self.stats["hits" if cached is not None else "misses"] += 1
+        if cached is not None:
+            return OpenAIObject.construct_from(cached)
+
+        resp = self.inner.create(**kwargs)
+        if resp.choices[0].get("finish_reason") != "length":  # type: ignore
+            self.cache.put(key, resp.to_dict_recursive())
+        return resp
+
+
+class FileRateLimiter:
+    """
+    Token bucket shared by every process on the machine through a lock file.
+
+    The bucket state lives in a small JSON file guarded by ``fcntl.flock``;
+    each acquire holds the lock only to refill and take a token, and sleeps
+    outside it.
+    """
+
+    def __init__(self, path: str, rate: float, burst: Optional[float] = None):
+        """
+        Initialize the rate limiter.
+
+        Args:
+            path: State file shared by all processes
+            rate: Requests per second allowed across all processes
+            burst: Bucket size (default: one second's worth of requests)
+        """
+        self.path = path
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+
+    def acquire(self) -> float:
+        """
+        Take one token, waiting until one is available.
+
+        Returns:
+            Seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            wait = self._try_take()
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def _try_take(self) -> float:
+        """Take a token if one is available; otherwise return the seconds until one is."""
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                now = time.time()
+                state = json.loads(raw) if raw else {"tokens": self.burst, "updated": now}
+                tokens = min(self.burst, state["tokens"] + (now - state["updated"]) * self.rate)
+                if tokens >= 1.0:
+                    tokens -= 1.0
+                    wait = 0.0
+                else:
+                    wait = (1.0 - tokens) / self.rate
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps({"tokens": tokens, "updated": now}))
+                f.flush()
+                return wait
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class RateLimitedBackend:
+    """Takes a token from a FileRateLimiter before every call."""
+
+    def __init__(self, inner, limiter: FileRateLimiter):
+        """
+        Initialize the rate-limited backend.
+
+        Args:
+            inner: Backend to call
+            limiter: Shared rate limiter
+        """
+        self.inner = inner
+        self.limiter = limiter
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs):
+        """Mimic ``openai.ChatCompletion.create`` behind the rate limit."""
+        waited = self.limiter.acquire()
+        with self._lock:
+            self.waited += waited
+        return self.inner.create(**kwargs)
+
+
+# Per-process state set up by _init_worker
+_worker_system = None
+
+
+def _init_worker(config: Dict):
+    """Build this process's StorytellingSystem with the shared cache and limiter."""
+    global _worker_system
+    from main import StorytellingSystem
+    from utils.client_pool import default_pool
+
+    backend = config["backend_factory"]() if config["backend_factory"] else default_pool()
+    if config["rate_limiter"] is not None:
+        backend = RateLimitedBackend(backend, config["rate_limiter"])
+    if config["cache"] is not None:
+        backend = CachingBackend(backend, config["cache"])
+    _worker_system = StorytellingSystem(backend=backend, **config["system_kwargs"])
+
+
+def _run_shard(shard: List[Tuple[int, str]], threads: int, story_kwargs: Dict) -> List[Tuple[int, Dict]]:
+    """Create the stories of one shard in a worker process."""
+    system = _worker_system
+    requests = [request for _, request in shard]
+    try:
+        categories = system.categorizer.categorize_many(requests)
+    except Exception:
+        # Let each story categorize itself (and fail on its own) instead of losing the shard
+        categories = [None] * len(requests)
+
+    def run(item):
+        (index, request), category = item
+        try:
+            result = system.create_story(request, category=category, **story_kwargs)
+        except Exception as e:
+            result = {"error": f"{type(e).__name__}: {e}"}
+        result["request"] = request
+        return index, result
+
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        return list(executor.map(run, zip(shard, categories)))
+
+
+class BatchRunner:
+    """
+    Creates stories for a large list of requests on a pool of processes.
+
+    Requests are dealt round-robin into a few shards per process (so a slow
+    shard does not leave other processes idle at the end), each process
+    runs its own StorytellingSystem (categorizing each shard in batches),
+    and results are merged back into input order. All processes share a SQLite
+    response cache, so reruns and duplicate requests cost no API calls, and
+    a file-locked token bucket that caps requests per second globally.
+    """
+
+    SHARDS_PER_WORKER = 4
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        threads_per_worker: int = 1,
+        cache_path: Optional[str] = None,
+        requests_per_second: Optional[float] = None,
+        rate_limit_path: Optional[str] = None,
+        backend_factory: Optional[Callable] = None,
+        system_kwargs: Optional[Dict] = None
+    ):
+        """
+        Initialize the batch runner.
+
+        Args:
+            workers: Processes to run (default: CPU count)
+            threads_per_worker: Stories generated concurrently in each process
+            cache_path: SQLite response cache shared by all processes (None disables caching)
+            requests_per_second: Global LLM request rate across all processes (None for no limit)
+            rate_limit_path: Rate limiter state file (default: a new temporary file)
+            backend_factory: Picklable callable returning each process's backend
+                (default: the environment's credential pool, see
+                ``utils.client_pool.default_pool``)
+            system_kwargs: Keyword arguments for each process's StorytellingSystem
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.threads_per_worker = threads_per_worker
+        self.cache = DiskCache(cache_path) if cache_path else None
+        self.rate_limiter = None
+        if requests_per_second:
+            if rate_limit_path is None:
+                rate_limit_path = os.path.join(tempfile.mkdtemp(prefix="story-batch-"), "rate_limit.json")
+            self.rate_limiter = FileRateLimiter(rate_limit_path, requests_per_second)
+        self.backend_factory = backend_factory
+        self.system_kwargs = system_kwargs or {}
+
+    def run(self, user_requests: List[str], **story_kwargs) -> List[Dict]:
+        """
+        Create a story for every request.
+
+        Args:
+            user_requests: The story requests
+            **story_kwargs: Passed on to create_story (e.g. enable_refinement)
+
+        Returns:
+            One result per request, in input order; each has a "request" key,
+            and failed requests have an "error" key instead of a story
+        """
+        indexed = list(enumerate(user_requests))
+        num_shards = min(len(indexed), self.workers * self.SHARDS_PER_WORKER)
+        shards = [indexed[i::num_shards] for i in range(num_shards)]
+        if not shards:
+            return []
+
+        config = {
+            "backend_factory": self.backend_factory,
+            "cache": self.cache,
+            "rate_limiter": self.rate_limiter,
+            "system_kwargs": self.system_kwargs
+        }
+        results: List[Optional[Dict]] = [None] * len(user_requests)
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(shards)), initializer=_init_worker, initargs=(config,)) as pool:
+            futures = [pool.submit(_run_shard, shard, self.threads_per_worker, story_kwargs) for shard in shards]
+            for future in futures:
+                for index, result in future.result():
+                    results[index] = result
+        return results  # type: ignore
+
+
+def write_results(results: List[Dict], path: str):
+    """
+    Write batch results as JSON lines, in order.
+
+    Args:
+        results: Results from BatchRunner.run
+        path: Output file
+    """
+    with open(path, "w") as f:
+        for result in results:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
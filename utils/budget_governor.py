@@ -0,0 +1,261 @@
+"""Token budgets per agent, per tenant and globally, shared across processes."""
+
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+from utils.hooks import HookRegistry
+
+# Tenant the current request is spent on; worker threads inherit it through copied contexts
+current_tenant: "contextvars.ContextVar[Optional[str]]" = contextvars.ContextVar("budget_tenant", default=None)
+
+# Ordered from full service to refusing work
+DEGRADATION_LEVELS = ("normal", "skip_refinement", "scores_only", "pool_only", "exhausted")
+
+
+class BudgetExceededError(Exception):
+    """Raised when a request cannot be served within the token budget."""
+
+
+@dataclass(frozen=True)
+class BudgetLimit:
+    """
+    Tokens (in plus out) a scope may spend in a sliding window.
+
+    Scopes are "global", "agent:<name>" (e.g. "agent:storyteller"),
+    "tenant:<id>", or "tenant:*" for every tenant without its own limit.
+    """
+
+    scope: str
+    tokens: int
+    window_seconds: float = 86400.0
+
+
+class BudgetGovernor:
+    """
+    Tracks token spend in a SQLite file and decides how far to degrade service.
+
+    Every LLM call is recorded (through the post_call hook) with its agent,
+    the tenant of the request that made it and its prompt and completion
+    tokens. Processes and threads sharing the same file share the budget.
+    Utilization is the highest spent/limit ratio among the limits that
+    apply to a request (global, every agent limit, and the tenant's), and
+    maps to a degradation level:
+
+        below thresholds[0]  normal: full pipeline
+        below thresholds[1]  skip_refinement: judge once, never refine
+        below thresholds[2]  scores_only: short scores-only judge, never refine
+        below 1.0            pool_only: serve warm-pool stories when possible,
+                             otherwise one storyteller call with local
+                             categorization and no judge
+        1.0 and above        exhausted: warm-pool stories only, else
+                             BudgetExceededError
+
+    Usage:
+        governor = BudgetGovernor("budget.db", [BudgetLimit("global", 2_000_000),
+                                                BudgetLimit("tenant:*", 100_000)])
+        system = StorytellingSystem(budget_governor=governor)
+        system.create_story(request, tenant="acme")
+    """
+
+    def __init__(
+        self,
+        path: str,
+        limits: Iterable[BudgetLimit],
+        thresholds: Tuple[float, float, float] = (0.7, 0.85, 0.95),
+        refresh_seconds: float = 1.0
+    ):
+        """
+        Initialize the governor.
+
+        Args:
+            path: SQLite database file shared by every process (created if missing)
+            limits: Token limits to enforce
+            thresholds: Utilization at which to skip refinement, switch to the
+                scores-only judge, and serve pooled stories only
+            refresh_seconds: How long spend totals read from the store are
+                reused before querying it again
+
+        Raises:
+            ValueError: If the thresholds are not increasing and below 1
+        """
+        if not 0 < thresholds[0] < thresholds[1] < thresholds[2] < 1:
+            raise ValueError(f"Thresholds must increase from 0 to 1, got {thresholds}")
+        self.path = path
+        self.limits = list(limits)
+        self.thresholds = thresholds
+        self.refresh_seconds = refresh_seconds
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._totals: Dict[float, Dict[Tuple[str, str], int]] = {}
+        self._read_at = float("-inf")
+        self._records = 0
+        # Not kept open: SQLite connections must not be carried across a fork
+        conn = sqlite3.connect(path, timeout=30)
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage "
+                "(ts REAL NOT NULL, agent TEXT NOT NULL, tenant TEXT NOT NULL, "
+                "prompt_tokens INTEGER NOT NULL, completion_tokens INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS usage_ts ON usage (ts)")
+        conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it if needed (or after a fork)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def attach(self, hooks: HookRegistry):
+        """Record the usage of every LLM call emitted on a hook registry."""
+        hooks.subscribe("post_call", self._on_post_call)
+
+    def _on_post_call(self, event: Dict):
+        """Record a finished call's usage."""
+        usage = event["usage"]
+        if usage:
+            self.record(event["agent"], usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+
+    def record(self, agent: str, prompt_tokens: int, completion_tokens: int, tenant: Optional[str] = None):
+        """
+        Record the tokens of one call.
+
+        Args:
+            agent: Agent that made the call
+            prompt_tokens: Tokens sent
+            completion_tokens: Tokens received
+            tenant: Tenant charged (default: the current request's tenant)
+        """
+        tenant = tenant if tenant is not None else current_tenant.get()
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO usage (ts, agent, tenant, prompt_tokens, completion_tokens) VALUES (?, ?, ?, ?, ?)",
+                (now, agent, tenant or "", prompt_tokens, completion_tokens)
+            )
+        with self._lock:
+            # Count our own spend at once instead of waiting for the next refresh
+            for totals in self._totals.values():
+                key = (agent, tenant or "")
+                totals[key] = totals.get(key, 0) + prompt_tokens + completion_tokens
+            self._records += 1
+            prune = self._records % 1000 == 0
+        if prune:
+            self.prune()
+
+    def spent(self, scope: str, window_seconds: float = 86400.0) -> int:
+        """
+        Return the tokens a scope spent in the last ``window_seconds``.
+
+        Args:
+            scope: "global", "agent:<name>" or "tenant:<id>"
+            window_seconds: Sliding window length
+
+        Raises:
+            ValueError: If the scope is unknown
+        """
+        totals = self._window_totals(window_seconds)
+        kind, _, name = scope.partition(":")
+        if kind == "global":
+            return sum(totals.values())
+        if kind == "agent":
+            return sum(tokens for (agent, _), tokens in totals.items() if agent == name)
+        if kind == "tenant":
+            return sum(tokens for (_, tenant), tokens in totals.items() if tenant == name)
+        raise ValueError(f"Unknown budget scope: {scope}")
+
+    def utilization(self, tenant: Optional[str] = None) -> Dict[str, float]:
+        """
+        Return spent/limit for every limit that applies to a tenant's requests.
+
+        Args:
+            tenant: The requesting tenant (None: global and agent limits only)
+
+        Returns:
+            Dictionary of "<scope>/<window seconds>" -> utilization
+        """
+        tenant_scopes = {limit.scope for limit in self.limits if limit.scope.startswith("tenant:")}
+        result = {}
+        for limit in self.limits:
+            scope = limit.scope
+            if scope.startswith("tenant:"):
+                if tenant is None or scope not in (f"tenant:{tenant}", "tenant:*"):
+                    continue
+                if scope == "tenant:*":
+                    if f"tenant:{tenant}" in tenant_scopes:
+                        continue
+                    scope = f"tenant:{tenant}"
+            result[f"{scope}/{limit.window_seconds:g}"] = self.spent(scope, limit.window_seconds) / limit.tokens
+        return result
+
+    def level(self, tenant: Optional[str] = None) -> str:
+        """
+        Return the degradation level for a tenant's next request.
+
+        Args:
+            tenant: The requesting tenant
+
+        Returns:
+            One of DEGRADATION_LEVELS
+        """
+        used = max(self.utilization(tenant).values(), default=0.0)
+        for threshold, level in zip(self.thresholds + (1.0,), DEGRADATION_LEVELS):
+            if used < threshold:
+                return level
+        return "exhausted"
+
+    def summary(self, tenant: Optional[str] = None) -> Dict:
+        """Return the utilization per limit and the resulting level."""
+        return {"level": self.level(tenant), "utilization": self.utilization(tenant)}
+
+    def prune(self) -> int:
+        """
+        Delete usage older than the longest window.
+
+        Returns:
+            Number of rows deleted
+        """
+        longest = max((limit.window_seconds for limit in self.limits), default=0.0)
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM usage WHERE ts < ?", (time.time() - longest,)).rowcount
+
+    def __getstate__(self):
+        return {
+            "path": self.path,
+            "limits": self.limits,
+            "thresholds": self.thresholds,
+            "refresh_seconds": self.refresh_seconds
+        }
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _window_totals(self, window_seconds: float) -> Dict[Tuple[str, str], int]:
+        """Return tokens per (agent, tenant) in a window, re-reading the store at most every refresh_seconds."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._read_at < self.refresh_seconds and window_seconds in self._totals:
+                return dict(self._totals[window_seconds])
+        windows = {limit.window_seconds for limit in self.limits} | {window_seconds}
+        since = time.time()
+        totals: Dict[float, Dict[Tuple[str, str], int]] = {}
+        conn = self._connect()
+        for window in windows:
+            rows = conn.execute(
+                "SELECT agent, tenant, SUM(prompt_tokens + completion_tokens) FROM usage "
+                "WHERE ts >= ? GROUP BY agent, tenant",
+                (since - window,)
+            ).fetchall()
+            totals[window] = {(agent, tenant): tokens for agent, tenant, tokens in rows}
+        with self._lock:
+            self._totals, self._read_at = totals, now
+            return dict(totals[window_seconds])
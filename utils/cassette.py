@@ -0,0 +1,205 @@
+"""Record and replay LLM traffic through gzip-compressed cassette files."""
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Union
+
+import openai
+from openai.openai_object import OpenAIObject
+
+# Request fields that determine the response; timeouts and API keys are not part of the key
+KEY_FIELDS = ("model", "messages", "max_tokens", "temperature", "stream")
+
+
+class CassetteMissError(LookupError):
+    """Raised when a replayed request was never recorded."""
+
+
+def request_key(request: Dict) -> str:
+    """
+    Compute the cassette key of a chat request.
+
+    Args:
+        request: Keyword arguments of a ``create`` call
+
+    Returns:
+        Hex digest identifying the request
+    """
+    fields = {field: request.get(field) for field in KEY_FIELDS}
+    fields["stream"] = bool(fields["stream"])
+    payload = json.dumps(fields, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def read_cassette(path: str) -> Iterator[Dict]:
+    """
+    Iterate over the records of a cassette file.
+
+    Args:
+        path: Path to a cassette written by RecordingBackend
+
+    Yields:
+        Record dictionaries in recording order
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class RecordingBackend:
+    """
+    Wraps a ChatCompletion-compatible backend and records every call.
+
+    Each call is appended as one JSON line to a gzip-compressed cassette:
+    the request, its key, the response (or every streaming chunk with the
+    delay before it), the total latency, and upstream errors so they can be
+    raised again on replay.
+    """
+
+    def __init__(self, inner, path: str):
+        """
+        Initialize the recorder.
+
+        Args:
+            inner: Backend to record (e.g. ``openai.ChatCompletion``)
+            path: Cassette file to append to
+        """
+        self.inner = inner
+        self.path = path
+        self.recorded = 0
+        self._file = gzip.open(path, "at", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs):
+        """Forward a call to the inner backend and record it."""
+        request = {field: kwargs.get(field) for field in KEY_FIELDS}
+        record = {"key": request_key(kwargs), "request": request, "started_at": time.time()}
+        started = time.perf_counter()
+
+        try:
+            resp = self.inner.create(**kwargs)
+        except openai.error.OpenAIError as e:
+            record["latency"] = time.perf_counter() - started
+            record["error"] = {"type": type(e).__name__, "message": str(e)}
+            self._write(record)
+            raise
+
+        if kwargs.get("stream"):
+            return self._record_stream(resp, record, started)
+
+        record["latency"] = time.perf_counter() - started
+        record["response"] = resp.to_dict_recursive()
+        self._write(record)
+        return resp
+
+    def _record_stream(self, stream, record: Dict, started: float):
+        """Yield chunks from a stream while recording them with their timing."""
+        chunks = record["chunks"] = []
+        record["complete"] = False
+        last = started
+        try:
+            for chunk in stream:
+                now = time.perf_counter()
+                chunks.append({"delay": now - last, "data": chunk.to_dict_recursive()})
+                last = now
+                yield chunk
+            record["complete"] = True
+        finally:
+            record["latency"] = time.perf_counter() - started
+            self._write(record)
+            if hasattr(stream, "close"):
+                stream.close()
+
+    def _write(self, record: Dict):
+        """Append a record to the cassette."""
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self.recorded += 1
+
+    def close(self):
+        """Close the cassette file."""
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ReplayBackend:
+    """
+    Serves recorded calls back without network access.
+
+    Requests are matched by key; identical requests are answered with their
+    recordings in order (the last one repeats once they run out). Latency
+    and streaming chunk delays are reproduced, divided by ``speed``.
+    """
+
+    def __init__(self, paths: Union[str, Iterable[str]], speed: float = 1.0):
+        """
+        Initialize the replay backend.
+
+        Args:
+            paths: One cassette path or several
+            speed: Playback speed (1.0 = original timing, 10.0 = ten times
+                faster, 0 = no delays at all)
+        """
+        self.speed = speed
+        self.calls: List[Dict] = []
+        self._records: Dict[str, Deque[Dict]] = defaultdict(deque)
+        self._lock = threading.Lock()
+
+        for path in [paths] if isinstance(paths, str) else paths:
+            for record in read_cassette(path):
+                self._records[record["key"]].append(record)
+
+    def __len__(self) -> int:
+        return sum(len(records) for records in self._records.values())
+
+    def records(self) -> Iterator[Dict]:
+        """Iterate over every loaded record."""
+        for records in self._records.values():
+            yield from records
+
+    def create(self, **kwargs):
+        """Mimic ``openai.ChatCompletion.create`` from the cassette."""
+        key = request_key(kwargs)
+        with self._lock:
+            records = self._records.get(key)
+            if not records:
+                raise CassetteMissError(f"No recording for {kwargs.get('model')} request {key}")
+            record = records.popleft() if len(records) > 1 else records[0]
+            self.calls.append({"model": kwargs.get("model"), "messages": kwargs.get("messages"), "key": key})
+
+        if "chunks" in record:
+            return self._replay_stream(record, kwargs.get("request_timeout"))
+
+        self._wait(record["latency"], kwargs.get("request_timeout"))
+        if "error" in record:
+            error_class = getattr(openai.error, record["error"]["type"], openai.error.APIError)
+            raise error_class(record["error"]["message"])
+        return OpenAIObject.construct_from(record["response"])
+
+    def _replay_stream(self, record: Dict, timeout: Optional[float]):
+        """Yield the recorded chunks with their original spacing."""
+        for chunk in record["chunks"]:
+            self._wait(chunk["delay"], timeout)
+            yield OpenAIObject.construct_from(chunk["data"])
+
+    def _wait(self, seconds: float, timeout: Optional[float] = None):
+        """Sleep for a recorded delay scaled by the playback speed."""
+        delay = seconds / self.speed if self.speed else 0.0
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise openai.error.Timeout("Replay: request timed out")
+        if delay:
+            time.sleep(delay)
@@ -0,0 +1,246 @@
+"""Spread LLM calls over several API credentials and endpoints."""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional
+
+import openai
+
+
+class Credential:
+    """One API key and endpoint, with its own rate-limit state."""
+
+    def __init__(
+        self,
+        api_key: str,
+        api_base: Optional[str] = None,
+        requests_per_minute: Optional[int] = None,
+        backend=None,
+        name: Optional[str] = None
+    ):
+        """
+        Initialize the credential.
+
+        Args:
+            api_key: API key sent with every call made on this credential
+            api_base: Endpoint base URL (default: the OpenAI API)
+            requests_per_minute: Known limit of the key; the pool stops
+                choosing it once that many calls were made in the last minute
+            backend: ChatCompletion-compatible backend for this credential
+                only, e.g. a local stand-in endpoint (default: the pool's)
+            name: Label used in summaries (default: the last characters of the key)
+        """
+        self.api_key = api_key
+        self.api_base = api_base
+        self.requests_per_minute = requests_per_minute
+        self.backend = backend
+        self.name = name or f"key-...{api_key[-4:]}"
+        self.in_flight = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.cooldown_until = 0.0
+        self._window: Deque[float] = deque()
+
+    def recent_requests(self, now: float) -> int:
+        """Return the calls started in the 60 seconds before ``now``."""
+        while self._window and now - self._window[0] >= 60.0:
+            self._window.popleft()
+        return len(self._window)
+
+    def available(self, now: float) -> bool:
+        """Return whether the credential is neither cooling down nor at its known limit."""
+        if now < self.cooldown_until:
+            return False
+        return self.requests_per_minute is None or self.recent_requests(now) < self.requests_per_minute
+
+    def summary(self, now: float) -> Dict:
+        """Return the credential's counters (never the key itself)."""
+        return {
+            "name": self.name,
+            "api_base": self.api_base,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "requests_last_minute": self.recent_requests(now),
+            "rate_limited": self.rate_limited,
+            "cooldown_seconds": max(0.0, self.cooldown_until - now)
+        }
+
+
+def parse_credentials(value: str) -> List[Credential]:
+    """
+    Parse a credential list such as the ``OPENAI_API_KEYS`` variable.
+
+    Entries are separated by commas or whitespace; each is ``KEY`` or
+    ``KEY@BASE_URL`` to send that key to another endpoint.
+
+    Args:
+        value: The credential list
+
+    Returns:
+        One Credential per entry
+    """
+    credentials = []
+    for entry in value.replace(",", " ").split():
+        api_key, _, api_base = entry.partition("@")
+        credentials.append(Credential(api_key, api_base or None))
+    return credentials
+
+
+class ClientPool:
+    """
+    ChatCompletion-compatible backend that spreads calls over several credentials.
+
+    Every call goes to the least-loaded credential (fewest calls in flight,
+    then fewest calls in the last minute) that is not cooling down after a
+    rate limit. The key and endpoint are passed per call instead of being
+    written to the process-global ``openai.api_key``, so agents and threads
+    can use different credentials at the same time. A call that is rate
+    limited puts its credential into a cooldown and is retried once on each
+    remaining credential.
+
+    Usage:
+        pool = ClientPool([Credential("sk-a"), Credential("sk-b", "https://proxy.example/v1")])
+        agent = StorytellerAgent(backend=pool)
+    """
+
+    def __init__(self, credentials: Iterable[Credential], backend=None, cooldown: float = 20.0):
+        """
+        Initialize the pool.
+
+        Args:
+            credentials: Credentials to spread calls over
+            backend: Object with an ``openai.ChatCompletion``-compatible
+                ``create`` method (default: the OpenAI API)
+            cooldown: Seconds a rate-limited credential is skipped when the
+                error carries no Retry-After header
+
+        Raises:
+            ValueError: If no credentials are given
+        """
+        self.credentials = list(credentials)
+        if not self.credentials:
+            raise ValueError("A client pool needs at least one credential")
+        self.backend = backend or openai.ChatCompletion
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "ClientPool":
+        """
+        Build a pool from the environment.
+
+        ``OPENAI_API_KEYS`` lists several credentials (see parse_credentials);
+        otherwise the single ``OPENAI_API_KEY`` is used, with ``OPENAI_API_BASE``
+        if set.
+
+        Args:
+            **kwargs: Passed to the constructor
+
+        Raises:
+            ValueError: If neither variable is set
+        """
+        credentials = parse_credentials(os.getenv("OPENAI_API_KEYS", ""))
+        if not credentials and os.getenv("OPENAI_API_KEY"):
+            credentials = [Credential(os.environ["OPENAI_API_KEY"], os.getenv("OPENAI_API_BASE"))]
+        if not credentials:
+            raise ValueError(
+                "OPENAI_API_KEY not found in environment variables. "
+                "Please set it in your .env file."
+            )
+        return cls(credentials, **kwargs)
+
+    def create(self, **kwargs):
+        """
+        Mimic ``openai.ChatCompletion.create`` on the least-loaded credential.
+
+        Raises:
+            openai.error.RateLimitError: If every credential is rate limited
+        """
+        tried = set()
+        while True:
+            credential = self._acquire(tried)
+            tried.add(id(credential))
+            params = dict(kwargs, api_key=credential.api_key)
+            if credential.api_base:
+                params["api_base"] = credential.api_base
+            try:
+                response = (credential.backend or self.backend).create(**params)
+            except openai.error.RateLimitError as e:
+                self._release(credential, rate_limited=e)
+                if len(tried) == len(self.credentials):
+                    raise
+                continue
+            except Exception:
+                self._release(credential)
+                raise
+            if kwargs.get("stream"):
+                return self._stream(credential, response)
+            self._release(credential)
+            return response
+
+    def summary(self) -> List[Dict]:
+        """Return per-credential load and rate-limit counters."""
+        now = time.monotonic()
+        with self._lock:
+            return [credential.summary(now) for credential in self.credentials]
+
+    def _acquire(self, tried: set) -> Credential:
+        """Pick the least-loaded available credential not tried yet for this call."""
+        with self._lock:
+            now = time.monotonic()
+            candidates = [c for c in self.credentials if id(c) not in tried and c.available(now)]
+            if not candidates:
+                raise openai.error.RateLimitError(
+                    f"All {len(self.credentials)} credentials are rate limited"
+                )
+            credential = min(candidates, key=lambda c: (c.in_flight, c.recent_requests(now)))
+            credential.in_flight += 1
+            credential.requests += 1
+            credential._window.append(now)
+            return credential
+
+    def _release(self, credential: Credential, rate_limited: Optional[Exception] = None):
+        """Finish a call on a credential, starting its cooldown if it was rate limited."""
+        with self._lock:
+            credential.in_flight -= 1
+            if rate_limited is not None:
+                credential.rate_limited += 1
+                credential.cooldown_until = time.monotonic() + self._retry_after(rate_limited)
+
+    def _retry_after(self, error: Exception) -> float:
+        """Return the error's Retry-After seconds, or the default cooldown."""
+        headers = getattr(error, "headers", None) or {}
+        try:
+            return float(headers.get("retry-after") or headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            return self.cooldown
+
+    def _stream(self, credential: Credential, chunks):
+        """Yield a streamed response, keeping the call in flight until it ends."""
+        try:
+            yield from chunks
+        finally:
+            self._release(credential)
+
+
+_default_pool: Optional[ClientPool] = None
+_default_pool_lock = threading.Lock()
+
+
+def default_pool() -> ClientPool:
+    """
+    Return the process-wide pool built from the environment.
+
+    Every agent created without a backend shares it, so rate-limit state
+    is tracked per credential rather than per agent.
+
+    Raises:
+        ValueError: If no API key is configured
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ClientPool.from_env()
+        return _default_pool
@@ -0,0 +1,200 @@
+"""Streaming content-safety filter for the "themes to avoid" guidelines."""
+
+import json
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+from utils.story_arcs import AGE_GUIDELINES
+
+_SCARY, _VIOLENCE, _COMPLEX, _STEREOTYPES, _MATURE = AGE_GUIDELINES["themes"]["avoid"]
+
+# Unsafe-term lexicon keyed by severity, then by the AGE_GUIDELINES theme the
+# terms fall under. "hard" terms abort generation immediately; "soft" terms are
+# only reported, since words like "monster" are fine in a friendly story.
+DEFAULT_LEXICON = {
+    "hard": {
+        _VIOLENCE: [
+            "kill", "killed", "kills", "killing", "murder", "murdered", "blood", "bloody",
+            "gun", "guns", "shoot", "shot dead", "stab", "stabbed", "knife fight",
+            "torture", "tortured", "gore", "behead", "strangle"
+        ],
+        _SCARY: ["corpse", "dead body", "skeleton hand", "eaten alive", "ripped apart"],
+        _COMPLEX: ["suicide", "self-harm", "abuse", "abused"],
+        _MATURE: ["beer", "wine", "vodka", "drunk", "cigarette", "drugs", "sexy", "naked"]
+    },
+    "soft": {
+        _SCARY: ["scary", "terrifying", "horrifying", "nightmare", "haunted", "monster", "ghost"],
+        _VIOLENCE: ["fight", "punch", "weapon", "sword", "hurt"],
+        _COMPLEX: ["died", "death", "funeral", "divorce"],
+        _STEREOTYPES: ["stupid", "dumb", "ugly"]
+    }
+}
+
+
+class Violation(NamedTuple):
+    """A single unsafe-term match."""
+
+    term: str
+    theme: str
+    severity: str
+    position: int
+
+
+class UnsafeContentError(Exception):
+    """Raised when a story still contains unsafe content after all retries."""
+
+    def __init__(self, violation: Violation):
+        self.violation = violation
+        super().__init__(
+            f"Story contains unsafe term '{violation.term}' ({violation.theme})"
+        )
+
+
+class ContentSafetyFilter:
+    """
+    Matches a configurable unsafe-term lexicon with one compiled regex.
+
+    All terms are combined into a single alternation (longest first) with
+    word boundaries, so scanning costs one regex pass regardless of lexicon
+    size. Use stream() to check text incrementally as it is generated.
+    """
+
+    def __init__(self, lexicon: Optional[Dict[str, Dict[str, List[str]]]] = None):
+        """
+        Initialize the filter.
+
+        Args:
+            lexicon: {"hard": {theme: [terms]}, "soft": {theme: [terms]}}
+                (default: DEFAULT_LEXICON)
+        """
+        self.lexicon = lexicon or DEFAULT_LEXICON
+        self._terms: Dict[str, tuple] = {}
+        for severity, themes in self.lexicon.items():
+            for theme, terms in themes.items():
+                for term in terms:
+                    # A term listed as hard anywhere stays hard
+                    if self._terms.get(term.lower(), ("", ""))[1] != "hard":
+                        self._terms[term.lower()] = (theme, severity)
+
+        alternation = "|".join(
+            re.escape(term).replace(r"\ ", r"\s+")
+            for term in sorted(self._terms, key=len, reverse=True)
+        )
+        self._pattern = re.compile(rf"\b(?:{alternation})\b", re.IGNORECASE)
+        self.max_term_length = max((len(term) for term in self._terms), default=0)
+        self.stats = {"scanned": 0, "aborted": 0}
+
+    @classmethod
+    def from_file(cls, path: str) -> "ContentSafetyFilter":
+        """
+        Build a filter from a JSON lexicon file.
+
+        Args:
+            path: Path to a JSON file in the DEFAULT_LEXICON format
+
+        Returns:
+            ContentSafetyFilter instance
+        """
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def scan(self, text: str) -> List[Violation]:
+        """
+        Find every unsafe term in a complete text.
+
+        Args:
+            text: Text to scan
+
+        Returns:
+            List of violations in order of appearance
+        """
+        self.stats["scanned"] += 1
+        return [self._violation(match, 0) for match in self._pattern.finditer(text)]
+
+    def first_hard_violation(self, text: str) -> Optional[Violation]:
+        """Return the first hard violation in a complete text, if any."""
+        for violation in self.scan(text):
+            if violation.severity == "hard":
+                return violation
+        return None
+
+    def stream(self) -> "StreamScanner":
+        """Create an incremental scanner for one generation."""
+        self.stats["scanned"] += 1
+        return StreamScanner(self)
+
+    def _violation(self, match: "re.Match", offset: int) -> Violation:
+        """Build a Violation from a regex match."""
+        term = re.sub(r"\s+", " ", match.group(0).lower())
+        theme, severity = self._terms[term]
+        return Violation(term, theme, severity, offset + match.start())
+
+
+class StreamScanner:
+    """
+    Incrementally scans streamed chunks for unsafe terms.
+
+    Only a short tail of already-seen text is kept, so terms split across
+    chunk boundaries are still caught. A match touching the end of the
+    buffer is held back until more text arrives, so "kill" is not reported
+    for a word that turns out to be "killdeer". Likewise a match at the very
+    start of a trimmed buffer is ignored, since the character before it is
+    gone and "gun" in "begun" would otherwise look like a whole word.
+    """
+
+    def __init__(self, safety_filter: ContentSafetyFilter):
+        self._filter = safety_filter
+        self._buffer = ""
+        self._offset = 0
+        self._reported = set()
+        self.soft_violations: List[Violation] = []
+
+    def feed(self, chunk: str) -> Optional[Violation]:
+        """
+        Add a chunk of generated text.
+
+        Args:
+            chunk: Newly generated text
+
+        Returns:
+            The first hard violation found, or None
+        """
+        self._buffer += chunk
+        violation = self._check(final=False)
+
+        # Keep enough tail to complete a term split across chunks, plus the
+        # character before it so word boundaries are still judged correctly
+        keep = self._filter.max_term_length + 1
+        if len(self._buffer) > keep:
+            self._offset += len(self._buffer) - keep
+            self._buffer = self._buffer[-keep:]
+
+        return violation
+
+    def finish(self) -> Optional[Violation]:
+        """
+        Check the remaining buffered text once the stream has ended.
+
+        Returns:
+            The first hard violation found, or None
+        """
+        return self._check(final=True)
+
+    def _check(self, final: bool) -> Optional[Violation]:
+        """Scan the buffer, reporting each match once."""
+        for match in self._filter._pattern.finditer(self._buffer):
+            if not final and match.end() == len(self._buffer):
+                continue
+            if match.start() == 0 and self._offset > 0:
+                # The preceding character was trimmed away; any real match
+                # here was already seen while it was still in the buffer
+                continue
+            violation = self._filter._violation(match, self._offset)
+            if violation.position in self._reported:
+                continue
+            self._reported.add(violation.position)
+            if violation.severity == "hard":
+                self._filter.stats["aborted"] += 1
+                return violation
+            self.soft_violations.append(violation)
+        return None
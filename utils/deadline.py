@@ -0,0 +1,76 @@
+"""End-to-end deadlines that propagate through pipeline stages and LLM calls."""
+
+import time
+from typing import Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when there is no time left for a stage or LLM call."""
+
+
+class Deadline:
+    """An absolute point in time by which a request must finish."""
+
+    def __init__(self, seconds: float):
+        """
+        Initialize a deadline.
+
+        Args:
+            seconds: Time budget from now, in seconds
+        """
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def from_budget_ms(cls, budget_ms: float) -> "Deadline":
+        """Create a deadline from a budget in milliseconds."""
+        return cls(budget_ms / 1000.0)
+
+    def remaining(self) -> float:
+        """Return the seconds left (never negative)."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """Return True if no time is left."""
+        return self.remaining() <= 0.0
+
+    def allows(self, estimate: Optional[float]) -> bool:
+        """
+        Check whether a step expected to take ``estimate`` seconds fits.
+
+        Args:
+            estimate: Expected duration in seconds (None means unknown)
+
+        Returns:
+            True if the step is expected to finish before the deadline
+        """
+        if estimate is None:
+            return not self.expired()
+        return self.remaining() >= estimate
+
+    def check(self, what: str = "call"):
+        """
+        Raise if the deadline has passed.
+
+        Args:
+            what: Description of the step, used in the error message
+
+        Raises:
+            DeadlineExceeded: If no time is left
+        """
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline exceeded before {what}")
+
+    def portion(self, fraction: float) -> "Deadline":
+        """
+        Create a tighter deadline covering a fraction of the remaining time.
+
+        Useful for cheap stages (e.g. categorization) that should not eat
+        into the budget of the stages after them.
+
+        Args:
+            fraction: Share of the remaining time (0.0-1.0)
+
+        Returns:
+            A new Deadline that expires no later than this one
+        """
+        return Deadline(self.remaining() * fraction)
@@ -0,0 +1,380 @@
+"""Compact slotted data model for evaluations and refinement history."""
+
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from agents.judge import JudgeAgent
+
+_MAGIC_EVALUATION = b"EV"
+_MAGIC_STEP = b"RS"
+_VERSION = 1
+_FLAG_RAW = 0x01
+_FLAG_STORY = 0x02
+_FLAG_EVALUATION = 0x04
+_FLAG_COMPRESSED = 0x80
+_NO_SCORE = -1
+_CUSTOM_DIMENSION = 0xFF
+
+_SOURCES = ["llm", "heuristic"]
+_DIMENSION_CODES = {name: i for i, name in enumerate(JudgeAgent.EVALUATION_DIMENSIONS)}
+
+
+@dataclass
+class DimensionScore:
+    """Score, reasoning and suggestions for one evaluation dimension."""
+
+    __slots__ = ("name", "score", "reasoning", "suggestions")
+    name: str
+    score: Optional[float]
+    reasoning: str
+    suggestions: Tuple[str, ...]
+
+
+@dataclass
+class Evaluation:
+    """A judge evaluation, equivalent to the dictionary JudgeAgent returns."""
+
+    __slots__ = ("dimensions", "overall_score", "overall_assessment", "key_improvements", "raw_response", "source")
+    dimensions: Tuple[DimensionScore, ...]
+    overall_score: float
+    overall_assessment: str
+    key_improvements: Tuple[str, ...]
+    raw_response: Optional[str]
+    source: str
+
+    @classmethod
+    def from_dict(cls, data: Dict, keep_raw: bool = True) -> "Evaluation":
+        """
+        Build an Evaluation from a JudgeAgent evaluation dictionary.
+
+        Args:
+            data: Evaluation dictionary
+            keep_raw: Whether to keep the judge's raw response text
+
+        Returns:
+            Evaluation instance
+        """
+        return cls(
+            dimensions=tuple(
+                DimensionScore(
+                    name=name,
+                    score=dim["score"],
+                    reasoning=dim.get("reasoning", ""),
+                    suggestions=tuple(dim.get("suggestions", ()))
+                )
+                for name, dim in data["dimensions"].items()
+            ),
+            overall_score=data["overall_score"],
+            overall_assessment=data.get("overall_assessment", ""),
+            key_improvements=tuple(data.get("key_improvements", ())),
+            raw_response=data.get("raw_response") if keep_raw else None,
+            source=data.get("source", "llm")
+        )
+
+    def to_dict(self) -> Dict:
+        """Convert back to the JudgeAgent evaluation dictionary shape."""
+        data = {
+            "dimensions": {
+                dim.name: {
+                    "score": dim.score,
+                    "reasoning": dim.reasoning,
+                    "suggestions": list(dim.suggestions)
+                }
+                for dim in self.dimensions
+            },
+            "overall_score": self.overall_score,
+            "overall_assessment": self.overall_assessment,
+            "key_improvements": list(self.key_improvements),
+            "raw_response": self.raw_response or ""
+        }
+        if self.source != "llm":
+            data["source"] = self.source
+        return data
+
+    def scores_only(self) -> "Evaluation":
+        """Return a copy keeping only dimension names and scores."""
+        return Evaluation(
+            dimensions=tuple(DimensionScore(d.name, d.score, "", ()) for d in self.dimensions),
+            overall_score=self.overall_score,
+            overall_assessment="",
+            key_improvements=(),
+            raw_response=None,
+            source=self.source
+        )
+
+    def to_bytes(self, compress: bool = False) -> bytes:
+        """
+        Serialize to a compact binary record.
+
+        Scores are stored as tenths in an int16, known dimension names as a
+        one-byte code, and strings as varint-length-prefixed UTF-8.
+
+        Args:
+            compress: zlib-compress the body (worth it when texts are kept)
+
+        Returns:
+            Serialized bytes
+        """
+        out = bytearray()
+        _write_score(out, self.overall_score)
+        out.append(_SOURCES.index(self.source) if self.source in _SOURCES else 0)
+        out.append(len(self.dimensions))
+        for dim in self.dimensions:
+            code = _DIMENSION_CODES.get(dim.name, _CUSTOM_DIMENSION)
+            out.append(code)
+            if code == _CUSTOM_DIMENSION:
+                _write_str(out, dim.name)
+            _write_score(out, dim.score)
+            _write_str(out, dim.reasoning)
+            _write_strs(out, dim.suggestions)
+        _write_str(out, self.overall_assessment)
+        _write_strs(out, self.key_improvements)
+
+        flags = 0
+        if self.raw_response is not None:
+            flags |= _FLAG_RAW
+            _write_str(out, self.raw_response)
+
+        return _frame(_MAGIC_EVALUATION, flags, bytes(out), compress)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Evaluation":
+        """
+        Deserialize a record written by to_bytes.
+
+        Args:
+            data: Serialized bytes
+
+        Returns:
+            Evaluation instance
+
+        Raises:
+            ValueError: If the data is not a serialized Evaluation
+        """
+        flags, body = _unframe(_MAGIC_EVALUATION, data)
+        reader = _Reader(body)
+        overall_score = reader.score()
+        source = _SOURCES[reader.byte()]
+        dimensions = []
+        for _ in range(reader.byte()):
+            code = reader.byte()
+            name = reader.str() if code == _CUSTOM_DIMENSION else JudgeAgent.EVALUATION_DIMENSIONS[code]
+            dimensions.append(DimensionScore(name, reader.score(), reader.str(), reader.strs()))
+        overall_assessment = reader.str()
+        key_improvements = reader.strs()
+        raw_response = reader.str() if flags & _FLAG_RAW else None
+        return cls(tuple(dimensions), overall_score, overall_assessment, key_improvements, raw_response, source)
+
+
+@dataclass
+class RefinementStep:
+    """One judge/refine iteration of the refinement loop."""
+
+    __slots__ = ("iteration", "overall_score", "dimension_scores", "evaluation", "story", "refinement_method", "refinement_seconds")
+    iteration: int
+    overall_score: float
+    dimension_scores: Tuple[Tuple[str, Optional[float]], ...]
+    evaluation: Optional[Evaluation]
+    story: Optional[str]
+    refinement_method: Optional[str]
+    refinement_seconds: Optional[float]
+
+    @classmethod
+    def from_evaluation(cls, iteration: int, evaluation: Dict, story: str, retention: str = "full") -> "RefinementStep":
+        """
+        Build a step from a judge evaluation, keeping only what the retention mode allows.
+
+        Args:
+            iteration: Iteration number (1-based)
+            evaluation: JudgeAgent evaluation dictionary
+            story: The story text that was evaluated
+            retention: "full" (texts and raw judge output), "texts" (story and
+                judge feedback, no raw output) or "scores" (scores only)
+
+        Returns:
+            RefinementStep instance
+        """
+        compact = Evaluation.from_dict(evaluation, keep_raw=retention == "full")
+        if retention == "scores":
+            compact = compact.scores_only()
+        return cls(
+            iteration=iteration,
+            overall_score=compact.overall_score,
+            dimension_scores=tuple((d.name, d.score) for d in compact.dimensions),
+            evaluation=compact,
+            story=None if retention == "scores" else story,
+            refinement_method=None,
+            refinement_seconds=None
+        )
+
+    def to_dict(self) -> Dict:
+        """Convert to the legacy all_evaluations entry shape."""
+        entry = {
+            "iteration": self.iteration,
+            "evaluation": self.evaluation.to_dict() if self.evaluation else None,
+            "story": self.story
+        }
+        if self.refinement_method:
+            entry["refinement"] = {"method": self.refinement_method, "seconds": self.refinement_seconds}
+        return entry
+
+    def to_bytes(self, compress: bool = False) -> bytes:
+        """
+        Serialize to a compact binary record.
+
+        Args:
+            compress: zlib-compress the body (worth it when texts are kept)
+
+        Returns:
+            Serialized bytes
+        """
+        out = bytearray()
+        _write_varint(out, self.iteration)
+        _write_score(out, self.overall_score)
+        out.append(len(self.dimension_scores))
+        for name, score in self.dimension_scores:
+            code = _DIMENSION_CODES.get(name, _CUSTOM_DIMENSION)
+            out.append(code)
+            if code == _CUSTOM_DIMENSION:
+                _write_str(out, name)
+            _write_score(out, score)
+        _write_str(out, self.refinement_method or "")
+        out += struct.pack("<f", self.refinement_seconds or 0.0)
+
+        flags = 0
+        if self.story is not None:
+            flags |= _FLAG_STORY
+            _write_str(out, self.story)
+        if self.evaluation is not None:
+            flags |= _FLAG_EVALUATION
+            _write_bytes(out, self.evaluation.to_bytes())
+
+        return _frame(_MAGIC_STEP, flags, bytes(out), compress)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "RefinementStep":
+        """
+        Deserialize a record written by to_bytes.
+
+        Args:
+            data: Serialized bytes
+
+        Returns:
+            RefinementStep instance
+
+        Raises:
+            ValueError: If the data is not a serialized RefinementStep
+        """
+        flags, body = _unframe(_MAGIC_STEP, data)
+        reader = _Reader(body)
+        iteration = reader.varint()
+        overall_score = reader.score()
+        dimension_scores = []
+        for _ in range(reader.byte()):
+            code = reader.byte()
+            name = reader.str() if code == _CUSTOM_DIMENSION else JudgeAgent.EVALUATION_DIMENSIONS[code]
+            dimension_scores.append((name, reader.score()))
+        method = reader.str() or None
+        seconds = reader.float()
+        if method is None:
+            seconds = None
+        story = reader.str() if flags & _FLAG_STORY else None
+        evaluation = Evaluation.from_bytes(reader.bytes()) if flags & _FLAG_EVALUATION else None
+        return cls(iteration, overall_score, tuple(dimension_scores), evaluation, story, method, seconds)
+
+
+def _frame(magic: bytes, flags: int, body: bytes, compress: bool) -> bytes:
+    """Prefix a body with magic, version and flags, optionally compressing it."""
+    if compress:
+        flags |= _FLAG_COMPRESSED
+        body = zlib.compress(body)
+    return magic + bytes([_VERSION, flags]) + body
+
+
+def _unframe(magic: bytes, data: bytes) -> Tuple[int, bytes]:
+    """Validate the header of a record and return (flags, body)."""
+    if data[:2] != magic or len(data) < 4:
+        raise ValueError(f"Not a serialized record of type {magic!r}")
+    if data[2] != _VERSION:
+        raise ValueError(f"Unsupported record version: {data[2]}")
+    flags, body = data[3], data[4:]
+    if flags & _FLAG_COMPRESSED:
+        body = zlib.decompress(body)
+    return flags, body
+
+
+def _write_varint(out: bytearray, value: int):
+    """Append an unsigned LEB128 varint."""
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _write_bytes(out: bytearray, value: bytes):
+    """Append length-prefixed bytes."""
+    _write_varint(out, len(value))
+    out += value
+
+
+def _write_str(out: bytearray, value: str):
+    """Append a length-prefixed UTF-8 string."""
+    _write_bytes(out, value.encode("utf-8"))
+
+
+def _write_strs(out: bytearray, values: Tuple[str, ...]):
+    """Append a count-prefixed list of strings."""
+    _write_varint(out, len(values))
+    for value in values:
+        _write_str(out, value)
+
+
+def _write_score(out: bytearray, score: Optional[float]):
+    """Append a score as tenths in an int16 (-1 for no score)."""
+    out += struct.pack("<h", _NO_SCORE if score is None else round(score * 10))
+
+
+class _Reader:
+    """Sequential reader for the binary record format."""
+
+    def __init__(self, data: bytes):
+        self._data = memoryview(data)
+        self._pos = 0
+
+    def byte(self) -> int:
+        value = self._data[self._pos]
+        self._pos += 1
+        return value
+
+    def varint(self) -> int:
+        shift = value = 0
+        while True:
+            b = self.byte()
+            value |= (b & 0x7F) << shift
+            if b < 0x80:
+                return value
+            shift += 7
+
+    def bytes(self) -> bytes:
+        length = self.varint()
+        value = bytes(self._data[self._pos:self._pos + length])
+        self._pos += length
+        return value
+
+    def str(self) -> str:
+        return self.bytes().decode("utf-8")
+
+    def strs(self) -> Tuple[str, ...]:
+        return tuple(self.str() for _ in range(self.varint()))
+
+    def score(self) -> Optional[float]:
+        (value,) = struct.unpack_from("<h", self._data, self._pos)
+        self._pos += 2
+        return None if value == _NO_SCORE else value / 10
+
+    def float(self) -> float:
+        (value,) = struct.unpack_from("<f", self._data, self._pos)
+        self._pos += 4
+        return value
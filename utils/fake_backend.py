@@ -0,0 +1,215 @@
+"""Local stand-in for the OpenAI chat completion endpoint."""
+
+import re
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Union
+
+import openai
+from openai.openai_object import OpenAIObject
+
+FAKE_STORY = (
+    "Once upon a time, there was a little bunny named Pip who lived at the edge "
+    "of a sunny meadow. Pip loved hopping through the tall grass and saying hello "
+    "to every flower.\n\n"
+    "One day, Pip could not find the way home. The grass was taller than ever, and "
+    "Pip felt a little worried. Pip tried hopping left and then right, but every "
+    "path looked the same.\n\n"
+    "Then Pip remembered what Grandma said: look for the old oak tree. Pip climbed "
+    "a small hill, saw the tree, and hopped all the way home. Pip learned that "
+    "staying calm helps you find your way, and fell asleep smiling."
+)
+
+EVALUATION_DIMENSIONS = [
+    "Age-appropriateness", "Narrative coherence", "Character development",
+    "Engagement level", "Educational/moral value"
+]
+
+
+def default_responder(messages: List[Dict], model: str) -> str:
+    """
+    Produce a plausible canned response for each kind of agent prompt.
+
+    Args:
+        messages: The chat messages sent to the model
+        model: The requested model name
+
+    Returns:
+        Response text in the format the matching agent parser expects
+    """
+    if len(messages) >= 3 and messages[-2]["role"] == "assistant":
+        # Continuation of a cut-off answer: return the rest of the full answer
+        full = default_responder(messages[:-2], model)
+        partial = messages[-2]["content"]
+        return full[len(partial):] if full.startswith(partial) else full
+    prompt = messages[-1]["content"]
+    if "STORY REQUESTS:" in prompt:
+        section = prompt.split("STORY REQUESTS:")[1].split("\n\n")[0]
+        count = len(re.findall(r"^\d+\. ", section, re.MULTILINE))
+        return "\n".join(f"{n}. ANIMALS - The request features an animal." for n in range(1, count + 1))
+    if "story classifier" in prompt:
+        return "ANIMALS - The request features an animal as the main character."
+    if "STORIES TO EVALUATE" in prompt:
+        count = len(re.findall(r"^=== STORY \d+ ===$", prompt, re.MULTILINE))
+        return "\n\n".join(f"=== STORY {n} ===\n{_evaluation_text()}" for n in range(1, count + 1))
+    if "SCORES ONLY" in prompt:
+        return "\n".join(line for line in _evaluation_text(overall=False).splitlines()
+                         if line.startswith(("DIMENSION:", "SCORE:")))
+    if "expert evaluator" in prompt:
+        section = prompt.split("following dimensions:\n")[-1].split("\n\n")[0]
+        requested = re.findall(r"^\d+\. (.+?) \(1-10\)", section, re.MULTILINE)
+        if 0 < len(requested) < len(EVALUATION_DIMENSIONS):
+            # Focused call for some dimensions only: answer just those
+            return _evaluation_text(requested, overall=False)
+        return _evaluation_text()
+    return FAKE_STORY
+
+
+def _evaluation_text(dimensions: Optional[List[str]] = None, overall: bool = True) -> str:
+    """Return a canned judge evaluation scoring each dimension (default: all) 8/10."""
+    lines = []
+    for name in dimensions or EVALUATION_DIMENSIONS:
+        lines += [
+            f"DIMENSION: {name}",
+            "SCORE: 8/10",
+            "REASONING: Clear and gentle.",
+            "SUGGESTIONS: No major improvements needed",
+            ""
+        ]
+    if overall:
+        lines += ["OVERALL_ASSESSMENT", "A calm, well-structured bedtime story."]
+    return "\n".join(lines)
+
+
+class FakeChatBackend:
+    """
+    Drop-in replacement for ``openai.ChatCompletion`` that never touches the network.
+
+    Pass an instance as the ``backend`` of any agent. Responses are real
+    ``OpenAIObject`` instances shaped like the API's, including streaming
+    chunks, so agent code cannot tell the difference. Latency, per-call
+    slowdowns and unhealthy models can be injected to exercise timeouts,
+    hedging and circuit breakers.
+    """
+
+    def __init__(
+        self,
+        responder: Optional[Callable[[List[Dict], str], str]] = None,
+        latency: Union[float, Callable[[], float]] = 0.0,
+        delays: Optional[Iterable[float]] = None,
+        unhealthy_models: Optional[Iterable[str]] = None,
+        chunk_size: int = 16,
+        seconds_per_token: float = 0.0,
+        requests_per_minute: Optional[int] = None
+    ):
+        """
+        Initialize the fake backend.
+
+        Args:
+            responder: Function (messages, model) -> response text
+                (default: canned responses per agent prompt)
+            latency: Seconds per call, or a function returning seconds
+            delays: Extra seconds added to successive calls (e.g. [3.0] makes
+                only the first call slow)
+            unhealthy_models: Models that always fail with ServiceUnavailableError
+            chunk_size: Characters per chunk when streaming
+            seconds_per_token: Extra seconds per completion token, so long
+                answers take longer than short ones
+            requests_per_minute: Calls allowed in any 60-second window; calls
+                over the limit fail at once with RateLimitError, like the API
+        """
+        self.responder = responder or default_responder
+        self.latency = latency
+        self._delays = list(delays or [])
+        self.unhealthy_models = set(unhealthy_models or [])
+        self.chunk_size = chunk_size
+        self.seconds_per_token = seconds_per_token
+        self.requests_per_minute = requests_per_minute
+        self._window: Deque[float] = deque()
+        self.calls: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def create(
+        self,
+        model: str,
+        messages: List[Dict],
+        stream: bool = False,
+        max_tokens: int = 3000,
+        temperature: float = 0.1,
+        **kwargs
+    ):
+        """Mimic ``openai.ChatCompletion.create``."""
+        with self._lock:
+            extra_delay = self._delays.pop(0) if self._delays else 0.0
+            self.calls.append({"model": model, "messages": messages, "max_tokens": max_tokens})
+            if self.requests_per_minute is not None:
+                now = time.monotonic()
+                while self._window and now - self._window[0] >= 60.0:
+                    self._window.popleft()
+                if len(self._window) >= self.requests_per_minute:
+                    raise openai.error.RateLimitError("Fake backend: rate limit reached")
+                self._window.append(now)
+
+        latency = self.latency() if callable(self.latency) else self.latency
+        latency += extra_delay
+        timeout = kwargs.get("request_timeout")
+        if model in self.unhealthy_models or (timeout is not None and latency > timeout):
+            # Fails (or times out) before producing any output
+            self._wait(latency, timeout)
+            raise openai.error.ServiceUnavailableError(f"Fake backend: {model} is unavailable")
+
+        content = self.responder(messages, model)
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        completion_tokens = len(content) // 4
+
+        # Roughly 4 characters per token; cut off like the API does
+        finish_reason = "stop"
+        if completion_tokens > max_tokens:
+            content = content[:max_tokens * 4]
+            completion_tokens = max_tokens
+            finish_reason = "length"
+        self._wait(latency + completion_tokens * self.seconds_per_token, timeout)
+
+        if stream:
+            return self._stream(model, content, finish_reason)
+
+        return OpenAIObject.construct_from({
+            "object": "chat.completion",
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": finish_reason
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        })
+
+    def _wait(self, latency: float, timeout: Optional[float]):
+        """Sleep for a call's latency, timing out like the API when it exceeds the request timeout."""
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise openai.error.Timeout("Fake backend: request timed out")
+        time.sleep(latency)
+
+    def _stream(self, model: str, content: str, finish_reason: str):
+        """Yield the response as streaming chunks."""
+        for start in range(0, len(content), self.chunk_size):
+            yield OpenAIObject.construct_from({
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": content[start:start + self.chunk_size]},
+                    "finish_reason": None
+                }]
+            })
+        yield OpenAIObject.construct_from({
+            "object": "chat.completion.chunk",
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]
+        })
@@ -0,0 +1,258 @@
+"""Fast local pre-judge that estimates story quality without an LLM call."""
+
+import re
+from typing import Dict, List
+
+from agents.judge import JudgeAgent
+from utils.story_arcs import StoryArc
+
+
+class HeuristicJudge:
+    """
+    Scores the mechanically checkable parts of the judge's rubric locally.
+
+    Story length, sentence length, vocabulary difficulty and the presence of
+    a beginning, middle and ending can all be estimated from the text. The
+    result is a verdict: "fail" when a story clearly misses the guidelines
+    (refine without asking the LLM judge), "pass" when it clearly meets them
+    (the LLM judge may be skipped), and "uncertain" otherwise.
+    """
+
+    # From AGE_GUIDELINES: 500-1000 words, most sentences under 15-20 words
+    TARGET_WORDS = (500, 1000)
+    MAX_SENTENCE_WORDS = 20
+    LONG_SENTENCE_WORDS = 25
+    DIFFICULT_WORD_LETTERS = 10
+    DIFFICULT_WORD_SYLLABLES = 4
+
+    FAIL_SCORE = 4.0
+    PASS_SCORE = 9.0
+
+    _WORD = re.compile(r"[A-Za-z']+")
+    _SENTENCE = re.compile(r"[^.!?]+[.!?]*")
+    _VOWEL_GROUP = re.compile(r"[aeiouy]+")
+    _PARAGRAPH = re.compile(r"\n\s*\n")
+
+    # Cue phrases that typically mark each part of a three-act bedtime story
+    _ARC_MARKERS = {
+        "Beginning": re.compile(
+            r"\b(once upon a time|there (was|lived)|lived|named|every (day|morning|night)|loved)\b",
+            re.IGNORECASE
+        ),
+        "Middle": re.compile(
+            r"\b(but|suddenly|one day|problem|worried|couldn't|could not|tried|lost|needed|oh no)\b",
+            re.IGNORECASE
+        ),
+        "Ending": re.compile(
+            r"\b(finally|at last|learned|happily|from that day|the end|smiled|together|proud|goodnight)\b",
+            re.IGNORECASE
+        )
+    }
+
+    def score(self, story: str) -> Dict:
+        """
+        Score a single story.
+
+        Args:
+            story: The story text
+
+        Returns:
+            Dictionary with per-check scores and measurements, a local overall
+            score, a verdict ("fail", "pass" or "uncertain") and feedback lines
+        """
+        words = self._WORD.findall(story)
+        sentences = [s for s in self._SENTENCE.findall(story) if self._WORD.search(s)]
+        sentence_lengths = [len(self._WORD.findall(s)) for s in sentences]
+
+        checks = {
+            "length": self._check_length(len(words)),
+            "sentence_length": self._check_sentences(sentences, sentence_lengths),
+            "vocabulary": self._check_vocabulary(words),
+            "arc": self._check_arc(story, words)
+        }
+
+        scores = [check["score"] for check in checks.values()]
+        local_score = sum(scores) / len(scores)
+
+        if min(scores) <= self.FAIL_SCORE:
+            verdict = "fail"
+        elif min(scores) >= self.PASS_SCORE:
+            verdict = "pass"
+        else:
+            verdict = "uncertain"
+
+        feedback = [check["feedback"] for check in checks.values() if check["feedback"]]
+
+        return {
+            "checks": checks,
+            "local_score": local_score,
+            "verdict": verdict,
+            "feedback": feedback
+        }
+
+    def score_many(self, stories: List[str]) -> List[Dict]:
+        """
+        Score a batch of stories.
+
+        Each story costs a few regex passes over its own text, so there is
+        nothing to share between stories and the batch is scored in turn.
+
+        Args:
+            stories: List of story texts
+
+        Returns:
+            List of score dictionaries in the same order
+        """
+        return [self.score(story) for story in stories]
+
+    def to_evaluation(self, result: Dict) -> Dict:
+        """
+        Convert a local score into the JudgeAgent evaluation shape.
+
+        Length, sentence length and vocabulary feed "Age-appropriateness";
+        arc presence feeds "Narrative coherence". The other dimensions cannot
+        be judged locally and are present with a score of None. In particular
+        nothing here checks content safety (scary, violent or mature themes),
+        so an evaluation built from a "pass" verdict says nothing about it.
+        Every dimension is marked ``"source": "heuristic"``.
+
+        Args:
+            result: A dictionary returned by score()
+
+        Returns:
+            Evaluation dictionary usable by JudgeAgent.should_refine and
+            JudgeAgent.get_refinement_instructions
+        """
+        checks = result["checks"]
+        age_checks = [checks["length"], checks["sentence_length"], checks["vocabulary"]]
+
+        estimated = {
+            "Age-appropriateness": {
+                "score": round(min(check["score"] for check in age_checks), 1),
+                "reasoning": "Estimated locally from story length, sentence length and vocabulary.",
+                "suggestions": [check["feedback"] for check in age_checks if check["feedback"]]
+            },
+            "Narrative coherence": {
+                "score": round(checks["arc"]["score"], 1),
+                "reasoning": "Estimated locally from beginning, middle and ending cues.",
+                "suggestions": [checks["arc"]["feedback"]] if checks["arc"]["feedback"] else []
+            }
+        }
+        dimensions = {
+            name: dict(
+                estimated.get(name) or {"score": None, "reasoning": "Not judged locally.", "suggestions": []},
+                source="heuristic"
+            )
+            for name in JudgeAgent.EVALUATION_DIMENSIONS
+        }
+
+        return {
+            "dimensions": dimensions,
+            "overall_score": result["local_score"],
+            "overall_assessment": f"Local pre-judge verdict: {result['verdict']}.",
+            "key_improvements": list(result["feedback"]),
+            "raw_response": "",
+            "source": "heuristic"
+        }
+
+    def _check_length(self, word_count: int) -> Dict:
+        """Score the story length against the 500-1000 word target."""
+        low, high = self.TARGET_WORDS
+        if low <= word_count <= high:
+            return {"score": 10.0, "word_count": word_count, "feedback": ""}
+
+        if word_count < low:
+            score = 10.0 * word_count / low
+            feedback = (
+                f"The story is {word_count} words; the target is {low}-{high}. "
+                f"Add about {low - word_count} words, for example by developing the middle."
+            )
+        else:
+            score = max(0.0, 10.0 - 10.0 * (word_count - high) / high)
+            feedback = (
+                f"The story is {word_count} words; the target is {low}-{high}. "
+                f"Cut about {word_count - high} words."
+            )
+        return {"score": score, "word_count": word_count, "feedback": feedback}
+
+    def _check_sentences(self, sentences: List[str], lengths: List[int]) -> Dict:
+        """Score sentence length against the 15-20 word guideline."""
+        if not lengths:
+            return {"score": 0.0, "mean_words": 0.0, "long_sentences": 0,
+                    "feedback": "The story has no complete sentences."}
+
+        mean = sum(lengths) / len(lengths)
+        long_sentences = [s.strip() for s, n in zip(sentences, lengths) if n > self.LONG_SENTENCE_WORDS]
+        long_share = len(long_sentences) / len(lengths)
+
+        score = 10.0
+        score -= max(0.0, mean - self.MAX_SENTENCE_WORDS) * 1.0
+        score -= max(0.0, long_share - 0.1) * 20.0
+        score = max(0.0, min(10.0, score))
+
+        feedback = ""
+        if score < self.PASS_SCORE:
+            example = long_sentences[0][:80] if long_sentences else ""
+            feedback = (
+                f"Sentences average {mean:.1f} words and {len(long_sentences)} exceed "
+                f"{self.LONG_SENTENCE_WORDS} words; keep most under {self.MAX_SENTENCE_WORDS}."
+            )
+            if example:
+                feedback += f' Split long sentences such as "{example}..."'
+
+        return {"score": score, "mean_words": mean, "long_sentences": len(long_sentences),
+                "feedback": feedback}
+
+    def _check_vocabulary(self, words: List[str]) -> Dict:
+        """Score vocabulary difficulty by the share of long or polysyllabic words."""
+        if not words:
+            return {"score": 0.0, "difficult_share": 0.0, "feedback": "The story has no words."}
+
+        difficult = [
+            w for w in words
+            if len(w) >= self.DIFFICULT_WORD_LETTERS
+            or len(self._VOWEL_GROUP.findall(w.lower())) >= self.DIFFICULT_WORD_SYLLABLES
+        ]
+        share = len(difficult) / len(words)
+
+        # 5% or fewer difficult words is fine; 20% or more is clearly too hard
+        score = max(0.0, min(10.0, 10.0 - (share - 0.05) * 10.0 / 0.15))
+
+        feedback = ""
+        if score < self.PASS_SCORE:
+            examples = ", ".join(sorted(set(w.lower() for w in difficult))[:5])
+            feedback = (
+                f"{share:.0%} of words are long or hard to read (e.g. {examples}); "
+                "use simpler words or explain new ones in context."
+            )
+
+        return {"score": score, "difficult_share": share, "feedback": feedback}
+
+    def _check_arc(self, story: str, words: List[str]) -> Dict:
+        """Check for beginning, middle and ending cues in the matching story regions."""
+        parts = StoryArc.get_part_budgets("three_act", target_words=len(words))
+        present = []
+        missing = []
+        position = 0
+
+        for part in parts:
+            region = " ".join(words[position:position + part["word_budget"]])
+            position += part["word_budget"]
+            if self._ARC_MARKERS[part["name"]].search(region):
+                present.append(part["name"])
+            else:
+                missing.append(part["name"])
+
+        paragraphs = len([p for p in self._PARAGRAPH.split(story) if p.strip()])
+        score = 10.0 * len(present) / len(parts)
+        if paragraphs < 3:
+            score = min(score, 5.0)
+
+        feedback = ""
+        if missing:
+            feedback = f"The story lacks a clear {', '.join(missing).lower()}; follow the three-act structure."
+        elif paragraphs < 3:
+            feedback = f"The story has only {paragraphs} paragraph(s); give the beginning, middle and ending their own paragraphs."
+
+        return {"score": score, "parts_present": present, "paragraphs": paragraphs,
+                "feedback": feedback}
@@ -0,0 +1,76 @@
+"""Hook points around LLM calls and pipeline stages."""
+
+import threading
+from typing import Callable, Dict, List
+
+# pre_call:    agent, model, messages, max_tokens, stream
+# post_call:   agent, model, seconds, stream, response (None on error or when
+#              streaming), error (None on success; StreamAbortedError when
+#              a stream's consumer stopped reading early), usage (estimated for
+#              streams, with "estimated": True), truncated (the response
+#              was cut off at max_tokens)
+# stage_start: stage, user_request
+# stage_end:   stage, user_request, seconds, error
+# story_end:   user_request, category, evaluation, iterations, refinements,
+#              refined, from_pool, partial
+HOOK_EVENTS = ("pre_call", "post_call", "stage_start", "stage_end", "story_end")
+
+Hook = Callable[[Dict], None]
+
+
+class HookRegistry:
+    """
+    Subscribers for LLM call and pipeline stage events.
+
+    Each hook is called synchronously with one dictionary holding the
+    event name under "event" plus the fields listed in HOOK_EVENTS. Hooks
+    run on the thread that makes the call (worker threads included), so
+    they should be quick and thread-safe. Emitting an event nobody
+    subscribed to costs one dictionary lookup.
+    """
+
+    def __init__(self):
+        """Initialize a registry with no subscribers."""
+        self._hooks: Dict[str, List[Hook]] = {event: [] for event in HOOK_EVENTS}
+        self._lock = threading.Lock()
+
+    def subscribe(self, event: str, hook: Hook) -> Hook:
+        """
+        Subscribe a hook to an event.
+
+        Args:
+            event: One of HOOK_EVENTS
+            hook: Function called with the event dictionary
+
+        Returns:
+            The hook (pass it to unsubscribe to remove it)
+
+        Raises:
+            ValueError: If the event is unknown
+        """
+        if event not in self._hooks:
+            raise ValueError(f"Unknown hook event: {event}. Use one of {', '.join(HOOK_EVENTS)}.")
+        with self._lock:
+            # Copy on write so emit can iterate without the lock
+            self._hooks[event] = self._hooks[event] + [hook]
+        return hook
+
+    def unsubscribe(self, event: str, hook: Hook):
+        """Remove a hook from an event (no-op if it is not subscribed)."""
+        with self._lock:
+            self._hooks[event] = [h for h in self._hooks[event] if h is not hook]
+
+    def emit(self, event: str, **fields):
+        """
+        Call every hook subscribed to an event.
+
+        Args:
+            event: One of HOOK_EVENTS
+            **fields: Event fields
+        """
+        hooks = self._hooks[event]
+        if not hooks:
+            return
+        payload = dict(fields, event=event)
+        for hook in hooks:
+            hook(payload)
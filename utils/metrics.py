@@ -0,0 +1,295 @@
+"""In-process counters and histograms with Prometheus text exposition."""
+
+import bisect
+import os
+import tempfile
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from agents.judge import JudgeAgent
+from utils.hooks import HookRegistry
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def log_linear_buckets(low_exponent: int, high_exponent: int, steps: Sequence[int] = range(1, 10)) -> List[float]:
+    """
+    Build log-linear histogram bounds: linear steps within each power of ten.
+
+    For example, (-3, 1) with the default steps gives 0.001, 0.002, ...,
+    0.009, 0.01, 0.02, ..., 9, 10 — a fixed relative error per bucket over
+    four orders of magnitude.
+
+    Args:
+        low_exponent: Power of ten of the smallest bound
+        high_exponent: Power of ten of the largest bound
+        steps: Multipliers within each decade
+
+    Returns:
+        Sorted bucket upper bounds
+    """
+    bounds = [
+        round(step * 10.0 ** exponent, 12)
+        for exponent in range(low_exponent, high_exponent)
+        for step in steps
+    ]
+    return bounds + [10.0 ** high_exponent]
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    """Turn a label dictionary into a hashable, sorted key."""
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    """Render labels in Prometheus syntax."""
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (
+        f'{k}="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    """Render a sample value (integers without a decimal point)."""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    """
+    Base class for metrics.
+
+    Every update is one dictionary operation under the metric's own lock,
+    so recording a sample is cheap and never waits on other metrics.
+    """
+
+    TYPE = ""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: Dict[LabelKey, object] = {}
+        self._lock = threading.Lock()
+
+
+class Counter(_Metric):
+    """A monotonically increasing count per label set."""
+
+    TYPE = "counter"
+
+    def inc(self, amount: float = 1.0, labels: Optional[Dict[str, str]] = None):
+        """
+        Increase the counter.
+
+        Args:
+            amount: Non-negative amount to add
+            labels: Label values for this sample
+        """
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount  # type: ignore
+
+    def values(self) -> Dict[LabelKey, float]:
+        """Return the value per label set."""
+        with self._lock:
+            return dict(self._values)  # type: ignore
+
+    def render(self) -> List[str]:
+        """Render the samples in Prometheus text format."""
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in sorted(self.values().items())]
+
+
+class Histogram(_Metric):
+    """Bucketed observations per label set."""
+
+    TYPE = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float]):
+        """
+        Initialize the histogram.
+
+        Args:
+            name: Metric name
+            help_text: Description shown in the exposition
+            buckets: Sorted bucket upper bounds (+Inf is added implicitly)
+        """
+        super().__init__(name, help_text)
+        self.buckets = list(buckets)
+
+    def observe(self, value: float, labels: Optional[Dict[str, str]] = None):
+        """
+        Record an observation.
+
+        Args:
+            value: Observed value
+            labels: Label values for this sample
+        """
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # [bucket counts..., +Inf count, sum]
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[index] += 1  # type: ignore
+            entry[-1] += value  # type: ignore
+
+    def values(self) -> Dict[LabelKey, List[float]]:
+        """Return per-bucket counts (non-cumulative) plus the sum, per label set."""
+        with self._lock:
+            return {key: list(entry) for key, entry in self._values.items()}  # type: ignore
+
+    def count(self, labels: Optional[Dict[str, str]] = None) -> int:
+        """Return the number of observations for a label set."""
+        entry = self.values().get(_label_key(labels))
+        return int(sum(entry[:-1])) if entry else 0
+
+    def render(self) -> List[str]:
+        """Render the samples in Prometheus text format."""
+        lines = []
+        for key, entry in sorted(self.values().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {cumulative}")
+            cumulative += entry[len(self.buckets)]
+            lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(entry[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """A named collection of metrics rendered together."""
+
+    def __init__(self):
+        """Initialize an empty registry."""
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        """Get or create a counter."""
+        return self._register(name, lambda: Counter(name, help_text))  # type: ignore
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float]) -> Histogram:
+        """Get or create a histogram."""
+        return self._register(name, lambda: Histogram(name, help_text, buckets))  # type: ignore
+
+    def _register(self, name: str, factory) -> _Metric:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = factory()
+            return self._metrics[name]
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            Exposition text (version 0.0.4)
+        """
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.TYPE}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """
+        Atomically write the exposition to a file (e.g. for node_exporter's textfile collector).
+
+        Args:
+            path: Destination file
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".metrics-")
+        with os.fdopen(fd, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+class PipelineMetrics:
+    """
+    Standard storytelling metrics, fed by the system's hooks.
+
+    Covers LLM call latency, tokens and truncations per agent and model, stage latency,
+    refinement iterations and trigger rate, judge scores per dimension and
+    the categorizer's category mix.
+    """
+
+    def __init__(self, hooks: HookRegistry, registry: Optional[MetricsRegistry] = None):
+        """
+        Create the metrics and subscribe to the hooks.
+
+        Args:
+            hooks: Hook registry of the system to observe
+            registry: Registry to add the metrics to (default: a new one)
+        """
+        self.registry = registry or MetricsRegistry()
+        latency_buckets = log_linear_buckets(-2, 2)
+        self.call_seconds = self.registry.histogram(
+            "story_llm_call_seconds", "LLM call latency by agent and model", latency_buckets)
+        self.calls = self.registry.counter(
+            "story_llm_calls_total", "LLM calls by agent, model and outcome")
+        self.tokens = self.registry.counter(
+            "story_llm_tokens_total", "LLM tokens by agent, model and direction (in/out)")
+        self.truncations = self.registry.counter(
+            "story_llm_truncations_total", "LLM responses cut off at max_tokens, by agent and model")
+        self.stage_seconds = self.registry.histogram(
+            "story_stage_seconds", "Pipeline stage latency", latency_buckets)
+        self.stories = self.registry.counter(
+            "story_stories_total", "Stories served, by whether the judge triggered refinement and source")
+        self.iterations = self.registry.histogram(
+            "story_refinement_iterations", "Judge/refine iterations per story", [0, 1, 2, 3, 4, 5])
+        self.scores = self.registry.histogram(
+            "story_judge_score", "Judge scores by dimension (overall included)", [float(n) for n in range(1, 11)])
+        self.categories = self.registry.counter(
+            "story_category_total", "Stories by category")
+
+        hooks.subscribe("post_call", self._on_call)
+        hooks.subscribe("stage_end", self._on_stage)
+        hooks.subscribe("story_end", self._on_story)
+
+    def render(self) -> str:
+        """Render the metrics in Prometheus text format."""
+        return self.registry.render()
+
+    def write(self, path: str):
+        """Atomically write the metrics to a file."""
+        self.registry.write(path)
+
+    def _on_call(self, event: Dict):
+        labels = {"agent": event["agent"], "model": event["model"]}
+        self.call_seconds.observe(event["seconds"], labels)
+        self.calls.inc(labels=dict(labels, outcome="error" if event["error"] else "ok"))
+        if event["truncated"]:
+            self.truncations.inc(labels=labels)
+        usage = event["usage"]
+        if usage:
+            self.tokens.inc(usage.get("prompt_tokens", 0), dict(labels, direction="in"))
+            self.tokens.inc(usage.get("completion_tokens", 0), dict(labels, direction="out"))
+
+    def _on_stage(self, event: Dict):
+        self.stage_seconds.observe(event["seconds"], {"stage": event["stage"]})
+
+    def _on_story(self, event: Dict):
+        self.stories.inc(labels={
+            "refinement_triggered": str(event["refinements"] > 0).lower(),
+            "source": "pool" if event["from_pool"] else "live"
+        })
+        self.categories.inc(labels={"category": event["category"]})
+        if event["from_pool"]:
+            return
+        self.iterations.observe(event["iterations"])
+        evaluation = event["evaluation"]
+        if evaluation:
+            self.scores.observe(evaluation["overall_score"], {"dimension": "overall"})
+            for name, dim in evaluation["dimensions"].items():
+                if dim["score"] is not None:
+                    # Names come from the model; keep the label set bounded
+                    label = JudgeAgent.canonical_dimension(name) or "other"
+                    self.scores.observe(dim["score"], {"dimension": label})
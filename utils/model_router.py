@@ -0,0 +1,94 @@
+"""Model cascade routing records and cost estimates."""
+
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional
+
+# Approximate list prices in USD per 1K tokens: (input, output)
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.0015, 0.002),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4o": (0.005, 0.015),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4": (0.03, 0.06)
+}
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """
+    Estimate the cost of a call.
+
+    Args:
+        model: Model name
+        prompt_tokens: Tokens sent
+        completion_tokens: Tokens generated
+
+    Returns:
+        Estimated cost in USD, or None if the model's price is unknown
+    """
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1000
+
+
+class RoutingRecorder:
+    """
+    Collects one decision per cascaded call.
+
+    A decision records which models were tried, why the cascade escalated,
+    and the latency and estimated cost of the whole cascade. The baseline
+    cost is what the first attempt's tokens would have cost on the last
+    (strongest) model of the cascade, i.e. the cost of not cascading.
+
+    Totals per agent are kept as running sums, and only the most recent
+    decisions are kept in full, so a long-lived process stays bounded.
+    """
+
+    def __init__(self, recent: int = 1000):
+        """
+        Initialize an empty recorder.
+
+        Args:
+            recent: Number of most recent decisions kept in ``decisions``
+        """
+        self.decisions: Deque[Dict] = deque(maxlen=recent)
+        self._totals: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def record(self, decision: Dict):
+        """Record one routing decision."""
+        with self._lock:
+            self.decisions.append(decision)
+            agent = self._totals.setdefault(decision["agent"], {
+                "calls": 0,
+                "escalations": 0,
+                "latency": 0.0,
+                "cost": 0.0,
+                "baseline_cost": 0.0,
+                "reasons": {}
+            })
+            agent["calls"] += 1
+            agent["latency"] += decision["latency"]
+            agent["cost"] += decision["cost"] or 0.0
+            agent["baseline_cost"] += decision["baseline_cost"] or 0.0
+            if decision["escalated"]:
+                agent["escalations"] += 1
+                agent["reasons"][decision["reason"]] = agent["reasons"].get(decision["reason"], 0) + 1
+
+    def summary(self) -> Dict[str, Dict]:
+        """
+        Summarize all recorded decisions per agent.
+
+        Returns:
+            Dictionary keyed by agent name with call count, escalation rate,
+            mean latency and estimated cost versus the no-cascade baseline
+        """
+        with self._lock:
+            totals = {name: dict(agent, reasons=dict(agent["reasons"])) for name, agent in self._totals.items()}
+
+        for agent in totals.values():
+            agent["escalation_rate"] = agent["escalations"] / agent["calls"]
+            agent["mean_latency"] = agent.pop("latency") / agent["calls"]
+
+        return totals
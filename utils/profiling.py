@@ -0,0 +1,186 @@
+"""Profile pipeline runs, separating local CPU work from waiting on the network."""
+
+import cProfile
+import io
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+from utils.hooks import HookRegistry
+
+# Built-ins that block on I/O, sleeps or other threads; time spent in them is waiting
+_WAIT_FUNCTIONS = frozenset({
+    "time.sleep", "select.select", "select.poll.poll", "select.epoll.poll",
+    "_thread.lock.acquire", "_thread.RLock.acquire",
+    "_socket.getaddrinfo", "_socket.socket.connect", "_socket.socket.connect_ex",
+    "_socket.socket.recv", "_socket.socket.recv_into", "_socket.socket.sendall",
+    "_ssl._SSLSocket.read", "_ssl._SSLSocket.write", "_ssl._SSLSocket.do_handshake",
+    "posix.waitpid"
+})
+
+_BUILTIN_METHOD = re.compile(r"<method '(\w+)' of '([\w.]+)' objects>")
+_BUILTIN_FUNCTION = re.compile(r"<built-in method ([\w.]+)>")
+
+
+def _qualified_builtin(name: str) -> Optional[str]:
+    """
+    Turn a cProfile built-in entry into a dotted name.
+
+    Args:
+        name: Function name as cProfile records it, e.g.
+            ``<method 'recv_into' of '_socket.socket' objects>``
+
+    Returns:
+        Qualified name such as ``_socket.socket.recv_into``, or None if
+        the entry is not a built-in
+    """
+    match = _BUILTIN_METHOD.fullmatch(name)
+    if match:
+        return f"{match.group(2)}.{match.group(1)}"
+    match = _BUILTIN_FUNCTION.fullmatch(name)
+    return match.group(1) if match else None
+
+
+class PipelineProfiler:
+    """
+    Wraps a run in cProfile and tracemalloc and reports where the time went.
+
+    LLM call and stage durations come from the hook registry, so network
+    time is measured directly rather than inferred. cProfile only sees the
+    thread that started the profiler; work on worker threads (parallel acts,
+    hedged requests, concurrent batches) shows up as time waiting on them.
+
+    Usage:
+        with PipelineProfiler(system.hooks) as profiler:
+            system.create_story("...")
+        print(profiler.report())
+    """
+
+    def __init__(self, hooks: HookRegistry, top: int = 15):
+        """
+        Initialize the profiler.
+
+        Args:
+            hooks: Hook registry of the system being profiled
+            top: Number of hot spots and allocation sites to report
+        """
+        self.hooks = hooks
+        self.top = top
+        self.calls: Dict[str, Dict] = {}
+        self.stages: Dict[str, Dict] = {}
+        self._profile: Optional[cProfile.Profile] = None
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._started = (0.0, 0.0)
+        self._wall = 0.0
+        self._cpu = 0.0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        """Subscribe to hooks and start cProfile and tracemalloc."""
+        self.hooks.subscribe("post_call", self._on_call)
+        self.hooks.subscribe("stage_end", self._on_stage)
+        tracemalloc.start()
+        self._started = (time.perf_counter(), time.process_time())
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self):
+        """Stop profiling and take the allocation snapshot."""
+        self._profile.disable()
+        self._wall = time.perf_counter() - self._started[0]
+        self._cpu = time.process_time() - self._started[1]
+        self._snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        self.hooks.unsubscribe("post_call", self._on_call)
+        self.hooks.unsubscribe("stage_end", self._on_stage)
+
+    def _on_call(self, event: Dict):
+        """Accumulate LLM call time per agent and model."""
+        key = f"{event['agent']}/{event['model']}"
+        with self._lock:
+            entry = self.calls.setdefault(key, {"calls": 0, "seconds": 0.0})
+            entry["calls"] += 1
+            entry["seconds"] += event["seconds"]
+
+    def _on_stage(self, event: Dict):
+        """Accumulate time per pipeline stage."""
+        with self._lock:
+            entry = self.stages.setdefault(event["stage"], {"runs": 0, "seconds": 0.0})
+            entry["runs"] += 1
+            entry["seconds"] += event["seconds"]
+
+    def summary(self) -> Dict:
+        """
+        Summarize the profiled run.
+
+        Returns:
+            Dictionary with wall, CPU and network time, per-stage and
+            per-model totals, local hot spots and allocation sites
+        """
+        stats = pstats.Stats(self._profile)
+        hot_spots: List[Dict] = []
+        wait_seconds = 0.0
+        for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():  # type: ignore
+            if filename == "~" and _qualified_builtin(name) in _WAIT_FUNCTIONS:
+                wait_seconds += own
+                continue
+            hot_spots.append({
+                "function": f"{filename}:{line}({name})",
+                "calls": calls,
+                "own_seconds": own,
+                "cumulative_seconds": cumulative
+            })
+        hot_spots.sort(key=lambda spot: spot["own_seconds"], reverse=True)
+
+        allocations = [
+            {"site": str(stat.traceback), "bytes": stat.size, "count": stat.count}
+            for stat in self._snapshot.statistics("lineno")[:self.top]
+        ]
+
+        return {
+            "wall_seconds": self._wall,
+            "cpu_seconds": self._cpu,
+            "network_seconds": sum(entry["seconds"] for entry in self.calls.values()),
+            "profiled_wait_seconds": wait_seconds,
+            "stages": self.stages,
+            "calls": self.calls,
+            "hot_spots": hot_spots[:self.top],
+            "allocations": allocations
+        }
+
+    def report(self) -> str:
+        """Format the summary as a human-readable report."""
+        summary = self.summary()
+        out = io.StringIO()
+        out.write("Profile\n")
+        out.write(f"  Wall time:     {summary['wall_seconds']:.3f}s\n")
+        out.write(f"  Local CPU:     {summary['cpu_seconds']:.3f}s (prompt building, parsing, filters)\n")
+        out.write(f"  LLM calls:     {summary['network_seconds']:.3f}s (summed over calls)\n")
+
+        out.write("\nStages\n")
+        for stage, entry in summary["stages"].items():
+            out.write(f"  {stage:<12} {entry['seconds']:.3f}s over {entry['runs']} run(s)\n")
+
+        out.write("\nLLM calls\n")
+        for key, entry in sorted(summary["calls"].items()):
+            out.write(f"  {key:<32} {entry['seconds']:.3f}s over {entry['calls']} call(s)\n")
+
+        out.write("\nLocal hot spots (own time, excluding waits)\n")
+        for spot in summary["hot_spots"]:
+            out.write(f"  {spot['own_seconds']:.4f}s  {spot['calls']:>6}x  {spot['function']}\n")
+
+        out.write("\nTop allocation sites\n")
+        for site in summary["allocations"]:
+            out.write(f"  {site['bytes'] / 1024:8.1f} KiB  {site['count']:>6}x  {site['site']}\n")
+
+        return out.getvalue()
@@ -1,20 +1,37 @@
 """Refinement loop that connects storyteller and judge for iterative improvement."""
 
-from typing import Dict, Optional
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
 from agents.storyteller import StorytellerAgent
 from agents.judge import JudgeAgent
 from prompts.prompt_templates import PromptTemplate
+from utils.deadline import Deadline, DeadlineExceeded
+from utils.evaluation_model import RefinementStep
+from utils.heuristic_judge import HeuristicJudge
+from utils.refinement_policy import RefinementPolicy
+from utils.resilience import LatencyTracker
 from utils.story_arcs import get_age_guidelines
+from utils.story_patches import PatchError, apply_patches, number_paragraphs, parse_patch_response
 
 
 class RefinementLoop:
     """Manages the iterative refinement process between storyteller and judge."""
     
+    HISTORY_MODES = ("full", "texts", "scores")
+    
     def __init__(
         self,
         storyteller: Optional[StorytellerAgent] = None,
         judge: Optional[JudgeAgent] = None,
-        max_iterations: int = 2
+        max_iterations: int = 2,
+        refinement_mode: str = "rewrite",
+        prejudge: Optional[HeuristicJudge] = None,
+        skip_judge_on_pass: bool = False,
+        history: str = "full",
+        max_history: Optional[int] = None,
+        policy: Optional[RefinementPolicy] = None,
+        min_expected_gain: float = 0.5
     ):
         """
         Initialize the refinement loop.
@@ -23,76 +40,299 @@ class RefinementLoop:
             storyteller: Storyteller agent instance (creates new if None)
             judge: Judge agent instance (creates new if None)
             max_iterations: Maximum number of refinement iterations
+            refinement_mode: "rewrite" to regenerate the whole story, or "patch"
+                to request paragraph-level replacements (falls back to a rewrite
+                if the patch cannot be applied)
+            prejudge: Local heuristic judge run before the LLM judge; stories
+                that clearly fail go straight to refinement with local feedback
+            skip_judge_on_pass: Also skip the LLM judge for stories the
+                prejudge clearly passes. The prejudge only checks length,
+                sentence length, vocabulary and arc, so those stories are
+                never judged for content safety or the other dimensions
+                (their scores are None)
+            history: What each refinement step keeps: "full" (story texts and
+                the judge's raw response), "texts" (story texts and judge
+                feedback) or "scores" (scores only)
+            max_history: Keep only the most recent steps (None keeps all)
+            policy: Trained policy predicting the score gain of another
+                refinement; refinement stops when the prediction is too low
+            min_expected_gain: Smallest predicted gain worth a refinement
         """
+        if refinement_mode not in ("rewrite", "patch"):
+            raise ValueError(f"Unknown refinement mode: {refinement_mode}. Use 'rewrite' or 'patch'.")
+        if history not in self.HISTORY_MODES:
+            raise ValueError(f"Unknown history mode: {history}. Use 'full', 'texts' or 'scores'.")
         self.storyteller = storyteller or StorytellerAgent()
         self.judge = judge or JudgeAgent()
         self.max_iterations = max_iterations
+        self.refinement_mode = refinement_mode
+        self.prejudge = prejudge
+        self.skip_judge_on_pass = skip_judge_on_pass
+        self.history = history
+        self.max_history = max_history
+        self.policy = policy
+        self.min_expected_gain = min_expected_gain
+        # Recent step durations, used to decide whether a step fits a deadline
+        self.step_latency = {"judge": LatencyTracker(), "refine": LatencyTracker()}
     
     def refine_story(
         self,
         original_story: str,
         user_request: str,
         category: str,
-        threshold: float = 7.0
+        threshold: float = 7.0,
+        deadline: Optional[Deadline] = None
     ) -> Dict:
         """
         Refine a story iteratively based on judge feedback.
         
+        With a deadline, judging or refinement is skipped when it is not
+        expected to finish in time, and the best story evaluated so far is
+        returned with "partial" set.
+        
         Args:
             original_story: The initial story
             user_request: Original user request
             category: Story category
             threshold: Minimum score threshold to stop refinement
+            deadline: End-to-end deadline for the whole request
             
         Returns:
-            Dictionary with final story, evaluation, and iteration info
+            Dictionary with final story, evaluation, and iteration info.
+            "history" holds RefinementStep records as configured by the
+            history mode (``step.to_dict()`` gives the stored dictionary
+            shape); "stopped_by_policy" is True when the policy skipped a
+            refinement the judge asked for
         """
         current_story = original_story
         iteration = 0
-        all_evaluations = []
+        history: Deque[RefinementStep] = deque(maxlen=self.max_history)
+        evaluation = None
+        best: Optional[Tuple[str, Dict]] = None
+        refinements = 0
+        partial = False
+        stopped_by_policy = False
         
         while iteration < self.max_iterations:
+            if deadline and not self._fits(deadline, "judge"):
+                partial = True
+                break
             iteration += 1
             
             # Evaluate the current story
-            evaluation = self.judge.evaluate_story(current_story)
-            all_evaluations.append({
-                "iteration": iteration,
-                "evaluation": evaluation,
-                "story": current_story
-            })
+            started = time.perf_counter()
+            try:
+                evaluation = self._evaluate(current_story, deadline)
+            except DeadlineExceeded:
+                partial = True
+                break
+            self.step_latency["judge"].record(time.perf_counter() - started)
+            step = RefinementStep.from_evaluation(iteration, evaluation, current_story, self.history)
+            history.append(step)
+            if best is None or evaluation["overall_score"] > best[1]["overall_score"]:
+                best = (current_story, evaluation)
             
             # Check if we should continue refining
             if not self.judge.should_refine(evaluation, threshold):
                 break
             
+            # Skip a refinement that is not expected to move the score
+            if self.policy and self.policy.expected_gain(
+                evaluation, current_story, category, iteration
+            ) < self.min_expected_gain:
+                stopped_by_policy = True
+                break
+            
+            # A refined story is only useful if there is time to judge it too
+            if deadline and not self._fits(deadline, "refine", "judge"):
+                partial = True
+                break
+            
             # Get refinement instructions
             refinement_instructions = self.judge.get_refinement_instructions(evaluation)
             
             # Generate improved story
-            improved_story = self._generate_refined_story(
-                current_story=current_story,
-                user_request=user_request,
-                category=category,
-                refinement_instructions=refinement_instructions
-            )
+            started = time.perf_counter()
+            try:
+                improved_story, method = self._refine(
+                    current_story=current_story,
+                    user_request=user_request,
+                    category=category,
+                    refinement_instructions=refinement_instructions,
+                    deadline=deadline
+                )
+            except DeadlineExceeded:
+                partial = True
+                break
+            elapsed = time.perf_counter() - started
+            self.step_latency["refine"].record(elapsed)
+            step.refinement_method = method
+            step.refinement_seconds = elapsed
+            refinements += 1
             
             current_story = improved_story
         
+        final_story = current_story
+        final_evaluation = evaluation
+        if partial and best:
+            # Anytime result: the best story that was actually judged
+            final_story, final_evaluation = best
+        if final_evaluation and self.history != "full":
+            final_evaluation = dict(final_evaluation, raw_response="")
+        
         return {
-            "final_story": current_story,
-            "final_evaluation": all_evaluations[-1]["evaluation"],
+            "final_story": final_story,
+            "final_evaluation": final_evaluation,
             "iterations": iteration,
-            "all_evaluations": all_evaluations,
-            "improved": iteration > 1
+            "refinements": refinements,
+            "history": list(history),
+            "improved": final_story != original_story,
+            "partial": partial,
+            "stopped_by_policy": stopped_by_policy
         }
     
+    def _fits(self, deadline: Deadline, *steps: str) -> bool:
+        """
+        Check whether the given steps are expected to finish before the deadline.
+        
+        Args:
+            deadline: The request deadline
+            steps: Step names ("judge", "refine") to run back to back
+            
+        Returns:
+            True if the steps fit (or there is no history yet and time is left)
+        """
+        estimates = [self.step_latency[step].percentile(90) for step in steps]
+        if any(estimate is None for estimate in estimates):
+            return not deadline.expired()
+        return deadline.allows(sum(estimates))
+    
+    def _evaluate(self, story: str, deadline: Optional[Deadline] = None) -> Dict:
+        """
+        Evaluate a story, consulting the local prejudge first if configured.
+        
+        Args:
+            story: The story text to evaluate
+            deadline: End-to-end deadline for the LLM judge call
+            
+        Returns:
+            Evaluation dictionary (from the prejudge when it is decisive,
+            otherwise from the LLM judge)
+        """
+        if self.prejudge:
+            local = self.prejudge.score(story)
+            if local["verdict"] == "fail":
+                return self.prejudge.to_evaluation(local)
+            if local["verdict"] == "pass" and self.skip_judge_on_pass:
+                return self.prejudge.to_evaluation(local)
+        
+        return self.judge.evaluate_story(story, deadline=deadline)
+    
+    def _refine(
+        self,
+        current_story: str,
+        user_request: str,
+        category: str,
+        refinement_instructions: str,
+        deadline: Optional[Deadline] = None
+    ) -> Tuple[str, str]:
+        """
+        Refine a story using the configured refinement mode.
+        
+        Args:
+            current_story: The current story version
+            user_request: Original user request
+            category: Story category
+            refinement_instructions: Instructions for improvement
+            deadline: End-to-end deadline for the LLM calls
+            
+        Returns:
+            Tuple of (improved story, method used: "patch", "rewrite" or "patch_fallback")
+        """
+        if self.refinement_mode == "patch":
+            try:
+                patched = self._generate_patched_story(
+                    current_story=current_story,
+                    user_request=user_request,
+                    category=category,
+                    refinement_instructions=refinement_instructions,
+                    deadline=deadline
+                )
+                return patched, "patch"
+            except PatchError:
+                method = "patch_fallback"
+        else:
+            method = "rewrite"
+        
+        improved_story = self._generate_refined_story(
+            current_story=current_story,
+            user_request=user_request,
+            category=category,
+            refinement_instructions=refinement_instructions,
+            deadline=deadline
+        )
+        return improved_story, method
+    
+    def _generate_patched_story(
+        self,
+        current_story: str,
+        user_request: str,
+        category: str,
+        refinement_instructions: str,
+        deadline: Optional[Deadline] = None
+    ) -> str:
+        """
+        Improve a story by asking only for replacements of flagged paragraphs.
+        
+        Args:
+            current_story: The current story version
+            user_request: Original user request
+            category: Story category
+            refinement_instructions: Instructions for improvement
+            deadline: End-to-end deadline for the LLM call
+            
+        Returns:
+            Improved story text
+            
+        Raises:
+            PatchError: If the model's patch cannot be parsed or applied
+        """
+        prompt = (
+            "You are a talented children's storyteller improving a bedtime story "
+            "based on expert feedback.\n\n"
+            f"{get_age_guidelines()}\n\n"
+            "ORIGINAL STORY REQUEST:\n"
+            f"{user_request}\n\n"
+            "CURRENT STORY (paragraphs are numbered):\n"
+            f"{number_paragraphs(current_story)}\n\n"
+            "FEEDBACK FOR IMPROVEMENT:\n"
+            f"{refinement_instructions}\n\n"
+            f"STORY CATEGORY: {category}\n\n"
+            "Do NOT rewrite the whole story. Replace only the paragraphs that need to "
+            "change to address the feedback, keeping everything else as it is.\n"
+            "Respond with ONLY a JSON object in this format:\n"
+            '{"replacements": [{"paragraph": <number>, "text": "<new paragraph text>"}]}'
+        )
+        
+        response = self.storyteller.call_model(
+            prompt=prompt,
+            max_tokens=800,
+            temperature=0.7,
+            deadline=deadline
+        )
+        
+        patches = parse_patch_response(response)
+        if not patches:
+            raise PatchError("Patch response contained no replacements")
+        return apply_patches(current_story, patches)
+    
     def _generate_refined_story(
         self,
         current_story: str,
         user_request: str,
         category: str,
-        refinement_instructions: str
+        refinement_instructions: str,
+        deadline: Optional[Deadline] = None
     ) -> str:
         """
         Generate a refined version of the story based on feedback.
@@ -102,6 +342,7 @@ class RefinementLoop:
             user_request: Original user request
             category: Story category
             refinement_instructions: Instructions for improvement
+            deadline: End-to-end deadline for the LLM call
             
         Returns:
             Improved story text
@@ -125,7 +366,8 @@ class RefinementLoop:
         improved_story = self.storyteller.call_model(
             prompt=prompt,
             max_tokens=2000,
-            temperature=0.7  # Slightly lower temperature for refinement
+            temperature=0.7,  # Slightly lower temperature for refinement
+            deadline=deadline
         )
         
         return improved_story.strip()
@@ -0,0 +1,232 @@
+"""Learned policy that predicts whether another refinement iteration is worth it."""
+
+import json
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from agents.categorizer import CategorizerAgent
+from agents.judge import JudgeAgent
+from utils.evaluation_model import RefinementStep
+from utils.heuristic_judge import HeuristicJudge
+
+# Local story checks used as features (see HeuristicJudge.score)
+STORY_CHECKS = ("length", "sentence_length", "vocabulary", "arc")
+
+Example = Tuple[List[float], float]
+
+
+def _solve(matrix: List[List[float]], vector: List[float]) -> List[float]:
+    """Solve a small dense linear system by Gaussian elimination with partial pivoting."""
+    n = len(vector)
+    rows = [row[:] + [value] for row, value in zip(matrix, vector)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(rows[r][col]))
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        if abs(rows[col][col]) < 1e-12:
+            continue
+        for r in range(col + 1, n):
+            factor = rows[r][col] / rows[col][col]
+            if factor:
+                for c in range(col, n + 1):
+                    rows[r][c] -= factor * rows[col][c]
+    solution = [0.0] * n
+    for row in range(n - 1, -1, -1):
+        if abs(rows[row][row]) < 1e-12:
+            continue
+        total = rows[row][n] - sum(rows[row][c] * solution[c] for c in range(row + 1, n))
+        solution[row] = total / rows[row][row]
+    return solution
+
+
+class RefinementPolicy:
+    """
+    Ridge regression of the score gain one more refinement iteration brings.
+
+    Features are the judge's dimension scores, the overall and lowest
+    scores, the iteration number, the category and the local heuristic
+    checks of the story text. The policy is trained offline on stored
+    refinement histories: every judged step that was followed by
+    a refinement is one example, with the change in overall score at the
+    next judge pass as the target.
+
+    Usage:
+        runs = [(category, loop.refine_story(story, request, category)) for story, request, category in samples]
+        policy = RefinementPolicy().fit((category, result["history"]) for category, result in runs)
+        policy.save("refinement_policy.json")
+        loop = RefinementLoop(policy=RefinementPolicy.load("refinement_policy.json"), min_expected_gain=0.5)
+    """
+
+    FEATURES = (
+        ["bias"]
+        + [f"score:{name}" for name in JudgeAgent.EVALUATION_DIMENSIONS]
+        + ["overall", "lowest", "iteration"]
+        + [f"story:{check}" for check in STORY_CHECKS]
+        + [f"category:{category}" for category in CategorizerAgent.CATEGORIES]
+    )
+
+    def __init__(self, weights: Optional[Sequence[float]] = None, alpha: float = 1.0):
+        """
+        Initialize the policy.
+
+        Args:
+            weights: Trained weights, one per FEATURES entry (None: untrained,
+                predicts zero gain)
+            alpha: Ridge penalty on every weight except the bias
+        """
+        if weights is not None and len(weights) != len(self.FEATURES):
+            raise ValueError(f"Expected {len(self.FEATURES)} weights, got {len(weights)}")
+        self.weights = list(weights) if weights is not None else [0.0] * len(self.FEATURES)
+        self.alpha = alpha
+        self.trained_examples = 0
+        self._heuristics = HeuristicJudge()
+
+    def features(self, evaluation: Dict, story: Optional[str], category: str, iteration: int) -> List[float]:
+        """
+        Build the feature vector for one judged story.
+
+        Args:
+            evaluation: Evaluation dictionary from the judge
+            story: The judged story text (None if not stored; story features
+                are then neutral)
+            category: Story category
+            iteration: Judge pass number (1 for the initial story)
+
+        Returns:
+            Feature values in FEATURES order, scaled to roughly 0-1
+        """
+        overall = evaluation.get("overall_score") or 0.0
+        dimensions = evaluation.get("dimensions", {})
+        scores = []
+        for name in JudgeAgent.EVALUATION_DIMENSIONS:
+            score = (dimensions.get(name) or {}).get("score")
+            scores.append((score if score is not None else overall) / 10.0)
+
+        if story:
+            checks = self._heuristics.score(story)["checks"]
+            story_features = [checks[check]["score"] / 10.0 for check in STORY_CHECKS]
+        else:
+            story_features = [0.5] * len(STORY_CHECKS)
+
+        return (
+            [1.0]
+            + scores
+            + [overall / 10.0, min(scores), float(iteration)]
+            + story_features
+            + [1.0 if category == name else 0.0 for name in CategorizerAgent.CATEGORIES]
+        )
+
+    def examples(self, category: str, history: List[Dict]) -> List[Example]:
+        """
+        Extract training examples from one stored refinement history.
+
+        Args:
+            category: The story's category
+            history: RefinementStep records, or their stored to_dict() entries
+
+        Returns:
+            (features, observed gain) for every judged step followed by a
+            refinement and another judge pass
+        """
+        history = [step.to_dict() if isinstance(step, RefinementStep) else step for step in history]
+        out = []
+        for step, following in zip(history, history[1:]):
+            if not step.get("refinement") or not step.get("evaluation") or not following.get("evaluation"):
+                continue
+            gain = following["evaluation"]["overall_score"] - step["evaluation"]["overall_score"]
+            out.append((self.features(step["evaluation"], step.get("story"), category, step["iteration"]), gain))
+        return out
+
+    def fit(self, histories: Iterable[Tuple[str, List[Dict]]]) -> "RefinementPolicy":
+        """
+        Train the policy on stored histories.
+
+        Args:
+            histories: (category, history) pairs, as accepted by examples()
+
+        Returns:
+            The policy itself
+
+        Raises:
+            ValueError: If the histories contain no refinement examples
+        """
+        examples = [example for category, history in histories for example in self.examples(category, history)]
+        return self.fit_examples(examples)
+
+    def fit_examples(self, examples: List[Example]) -> "RefinementPolicy":
+        """
+        Train the policy on (features, gain) examples.
+
+        Args:
+            examples: Training examples, e.g. from examples()
+
+        Returns:
+            The policy itself
+
+        Raises:
+            ValueError: If there are no examples
+        """
+        if not examples:
+            raise ValueError("No refinement examples to train on")
+        n = len(self.FEATURES)
+        gram = [[0.0] * n for _ in range(n)]
+        target = [0.0] * n
+        for x, y in examples:
+            for i in range(n):
+                if x[i]:
+                    target[i] += x[i] * y
+                    row = gram[i]
+                    for j in range(n):
+                        row[j] += x[i] * x[j]
+        for i in range(1, n):
+            gram[i][i] += self.alpha
+        self.weights = _solve(gram, target)
+        self.trained_examples = len(examples)
+        return self
+
+    def expected_gain(self, evaluation: Dict, story: Optional[str], category: str, iteration: int) -> float:
+        """
+        Predict the change in overall score from one more refinement.
+
+        Args:
+            evaluation: The current story's evaluation
+            story: The current story text
+            category: Story category
+            iteration: Judge pass number of the current evaluation
+
+        Returns:
+            Expected gain in overall score (points out of 10)
+        """
+        return self.predict(self.features(evaluation, story, category, iteration))
+
+    def predict(self, features: List[float]) -> float:
+        """Predict the gain for a feature vector built by features()."""
+        return sum(w * x for w, x in zip(self.weights, features))
+
+    def to_dict(self) -> Dict:
+        """Return the policy as a JSON-serializable dictionary."""
+        return {
+            "features": self.FEATURES,
+            "weights": self.weights,
+            "alpha": self.alpha,
+            "trained_examples": self.trained_examples
+        }
+
+    def save(self, path: str):
+        """Write the trained policy to a JSON file."""
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "RefinementPolicy":
+        """
+        Load a policy saved with save().
+
+        Raises:
+            ValueError: If the file was trained on a different feature set
+        """
+        with open(path) as f:
+            data = json.load(f)
+        if data["features"] != cls.FEATURES:
+            raise ValueError("Policy was trained on different features; retrain it")
+        policy = cls(data["weights"], data["alpha"])
+        policy.trained_examples = data.get("trained_examples", 0)
+        return policy
@@ -0,0 +1,252 @@
+"""Tail-latency hedging and per-model circuit breakers for LLM calls."""
+
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Callable, Deque, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a call is refused because the model's circuit is open."""
+
+
+class LatencyTracker:
+    """Keeps a sliding window of recent call latencies."""
+
+    def __init__(self, window: int = 200):
+        """
+        Initialize the tracker.
+
+        Args:
+            window: Number of recent samples to keep
+        """
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        """Record one call latency."""
+        with self._lock:
+            self._samples.append(seconds)
+
+    def count(self) -> int:
+        """Return the number of samples in the window."""
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        Return the p-th percentile latency of the window.
+
+        Args:
+            p: Percentile between 0 and 100
+
+        Returns:
+            Latency in seconds, or None if there are no samples
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+        return samples[index]
+
+
+class HedgingPolicy:
+    """
+    Decides when to fire a duplicate request for a slow call.
+
+    The hedge delay is the configured percentile of recent latencies for the
+    same model, so only the slowest few percent of calls are duplicated.
+    No hedging happens until ``min_samples`` latencies have been observed.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        min_samples: int = 20,
+        min_delay: float = 0.05,
+        window: int = 200
+    ):
+        """
+        Initialize the hedging policy.
+
+        Args:
+            percentile: Latency percentile after which a hedge is sent
+            min_samples: Samples needed before hedging starts
+            min_delay: Lower bound on the hedge delay in seconds
+            window: Number of recent latencies remembered per model
+        """
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.window = window
+        self._trackers: Dict[str, LatencyTracker] = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "hedged": 0, "hedge_wins": 0}
+
+    def tracker(self, model: str) -> LatencyTracker:
+        """Return the latency tracker for a model."""
+        with self._lock:
+            if model not in self._trackers:
+                self._trackers[model] = LatencyTracker(self.window)
+            return self._trackers[model]
+
+    def count(self, stat: str):
+        """Increment one of the stats counters (safe from concurrent calls)."""
+        with self._lock:
+            self.stats[stat] += 1
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """
+        Return how long to wait before hedging a call to a model.
+
+        Args:
+            model: Model name
+
+        Returns:
+            Delay in seconds, or None if there is not enough history yet
+        """
+        tracker = self.tracker(model)
+        if tracker.count() < self.min_samples:
+            return None
+        return max(self.min_delay, tracker.percentile(self.percentile))
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open circuit breaker.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls fail fast. Once ``reset_timeout`` has passed a single trial call is
+    let through; success closes the circuit, failure re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Initialize the circuit breaker.
+
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds to wait before allowing a trial call
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Return True if a call may proceed now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        """Record a successful call."""
+        with self._lock:
+            self._failures = 0
+            self.state = self.CLOSED
+            self._trial_in_flight = False
+
+    def release(self):
+        """Give back a trial slot for a call that ended without a verdict (e.g. cancelled)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        """Record a failed call."""
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+# Shared pool for hedged calls; the losing request of a hedge cannot be
+# aborted mid-flight and simply finishes in the background.
+_hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+
+
+def get_circuit_breaker(model: str) -> CircuitBreaker:
+    """
+    Return the process-wide circuit breaker for a model.
+
+    Args:
+        model: Model name
+
+    Returns:
+        CircuitBreaker shared by every agent calling that model
+    """
+    with _breakers_lock:
+        if model not in _breakers:
+            _breakers[model] = CircuitBreaker()
+        return _breakers[model]
+
+
+def reset_circuit_breakers():
+    """Forget all circuit breaker state (mainly for tests)."""
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def hedged_call(fn: Callable[[], T], delay: Optional[float], policy: Optional[HedgingPolicy] = None) -> T:
+    """
+    Run ``fn`` and, if it has not finished after ``delay``, run it again.
+
+    Args:
+        fn: Zero-argument function performing the request
+        delay: Seconds to wait before hedging (None disables hedging)
+        policy: Policy whose stats are updated
+
+    Returns:
+        The result of whichever attempt succeeds first
+
+    Raises:
+        Exception: The error of the last attempt if every attempt fails
+    """
+    if delay is None:
+        return fn()
+
+    # Attempts run with the caller's context variables (e.g. the budget tenant)
+    primary = _hedge_executor.submit(contextvars.copy_context().run, fn)
+    try:
+        return primary.result(timeout=delay)
+    except FutureTimeoutError:
+        pass
+
+    hedge = _hedge_executor.submit(contextvars.copy_context().run, fn)
+    if policy:
+        policy.count("hedged")
+
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if policy and future is hedge:
+                    policy.count("hedge_wins")
+                return future.result()
+            error = future.exception()
+    raise error
@@ -0,0 +1,63 @@
+"""Bookkeeping for speculative work started before its inputs are confirmed."""
+
+import threading
+from typing import Dict
+
+
+class SpeculationCancelled(Exception):
+    """Raised inside speculative work when its guess turned out wrong."""
+
+
+class SpeculationStats:
+    """
+    Thread-safe hit/miss counts and latency saved (or wasted) by speculation.
+
+    A hit saves the time the confirming step took, since the speculative
+    work was already running; a miss wastes the speculative work done
+    before it was cancelled and saves nothing.
+    """
+
+    def __init__(self):
+        """Initialize empty statistics."""
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.wasted_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, hit: bool, seconds: float):
+        """
+        Record one speculation.
+
+        Args:
+            hit: Whether the guess was confirmed
+            seconds: Latency saved on a hit, or speculative work discarded on a miss
+        """
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.saved_seconds += seconds
+            else:
+                self.misses += 1
+                self.wasted_seconds += seconds
+
+    def summary(self) -> Dict:
+        """
+        Summarize the speculations so far.
+
+        Returns:
+            Dictionary with counts, miss rate, and total and mean seconds
+            saved per hit and wasted per miss
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "speculations": total,
+                "hits": self.hits,
+                "misses": self.misses,
+                "miss_rate": self.misses / total if total else 0.0,
+                "saved_seconds": self.saved_seconds,
+                "mean_saved_seconds": self.saved_seconds / self.hits if self.hits else 0.0,
+                "wasted_seconds": self.wasted_seconds,
+                "mean_wasted_seconds": self.wasted_seconds / self.misses if self.misses else 0.0
+            }
@@ -0,0 +1,462 @@
+"""Append-only compressed archive of create_story results with a random-access index."""
+
+import json
+import lzma
+import mmap
+import os
+import shutil
+import struct
+import threading
+import zlib
+from bisect import bisect_right
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+_SEGMENT_MAGIC = b"SARC"
+_INDEX_MAGIC = b"SIDX"
+_VERSION = 1
+# Magic, version, codec, first record id
+_HEADER = struct.Struct("<4sBBQ")
+# Offset in the segment, stored (compressed) length, raw length
+_ENTRY = struct.Struct("<QII")
+
+CODECS = {"zlib": 1, "lzma": 2}
+_CODEC_NAMES = {code: name for name, code in CODECS.items()}
+
+# compact() builds merged segments here; the plan file commits a merge
+_COMPACT_DIR = "compact.tmp"
+_COMPACT_PLAN = "plan.json"
+
+
+def _compress(codec: str, data: bytes, level: int) -> bytes:
+    """Compress one record with the named codec."""
+    if codec == "zlib":
+        return zlib.compress(data, level)
+    # The .lzma container has a 13-byte header instead of .xz's stream and block framing
+    return lzma.compress(data, format=lzma.FORMAT_ALONE, preset=level)
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    """Decompress one record stored with the named codec."""
+    if codec == "zlib":
+        return zlib.decompress(data)
+    return lzma.decompress(data)
+
+
+def _fsync_directory(path: str):
+    """Make renames and deletions in a directory durable."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Segment:
+    """
+    One segment: a data file of compressed records and its offset index.
+
+    ``<first_id>.seg`` holds a header and the records back to back;
+    ``<first_id>.idx`` holds a header and one fixed-size entry (offset,
+    stored length, raw length) per record. Records are written before their
+    index entry, so a record whose write was interrupted is never visible.
+    """
+
+    def __init__(self, directory: str, first_id: int):
+        self.directory = directory
+        self.first_id = first_id
+        self.data_path = os.path.join(directory, f"{first_id:012d}.seg")
+        self.index_path = os.path.join(directory, f"{first_id:012d}.idx")
+        self.codec = "zlib"
+        self._data: Optional[mmap.mmap] = None
+        self._index: Optional[mmap.mmap] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, directory: str, first_id: int, codec: str) -> "Segment":
+        """Create the empty files of a new segment."""
+        segment = cls(directory, first_id)
+        segment.codec = codec
+        header = _HEADER.pack(_SEGMENT_MAGIC, _VERSION, CODECS[codec], first_id)
+        with open(segment.data_path, "xb") as f:
+            f.write(header)
+        with open(segment.index_path, "xb") as f:
+            f.write(_HEADER.pack(_INDEX_MAGIC, _VERSION, CODECS[codec], first_id))
+        return segment
+
+    @classmethod
+    def open(cls, directory: str, first_id: int) -> "Segment":
+        """
+        Open an existing segment.
+
+        Raises:
+            ValueError: If the files are not a segment of this format, or
+                the index does not belong to the data file
+        """
+        segment = cls(directory, first_id)
+        with open(segment.data_path, "rb") as f:
+            magic, version, codec, stored_id = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _SEGMENT_MAGIC or version != _VERSION or codec not in _CODEC_NAMES or stored_id != first_id:
+            raise ValueError(f"Not a version {_VERSION} archive segment: {segment.data_path}")
+        segment.codec = _CODEC_NAMES[codec]
+
+        # Records are written before their entries, so every entry must point inside the data
+        with open(segment.index_path, "rb") as f:
+            header = _HEADER.unpack(f.read(_HEADER.size))
+            count = len(segment)
+            last = None
+            if count:
+                f.seek(_HEADER.size + (count - 1) * _ENTRY.size)
+                last = _ENTRY.unpack(f.read(_ENTRY.size))
+        if header != (_INDEX_MAGIC, _VERSION, codec, first_id) or (last and last[0] + last[1] > segment.data_size()):
+            raise ValueError(f"Index does not match its segment: {segment.index_path}")
+        return segment
+
+    def __len__(self) -> int:
+        return (os.path.getsize(self.index_path) - _HEADER.size) // _ENTRY.size
+
+    def data_size(self) -> int:
+        """Return the size of the data file in bytes."""
+        return os.path.getsize(self.data_path)
+
+    def entry(self, position: int) -> Tuple[int, int, int]:
+        """Return (offset, stored length, raw length) of a record by its position in the segment."""
+        index = self._mapped("_index", self.index_path, _HEADER.size + (position + 1) * _ENTRY.size)
+        return _ENTRY.unpack_from(index, _HEADER.size + position * _ENTRY.size)
+
+    def read(self, position: int) -> bytes:
+        """Return the decompressed record at a position, read through mmap."""
+        offset, length, _ = self.entry(position)
+        data = self._mapped("_data", self.data_path, offset + length)
+        return _decompress(self.codec, data[offset:offset + length])
+
+    def scan(self) -> Iterator[bytes]:
+        """Yield every record in order with sequential buffered reads."""
+        count = len(self)
+        with open(self.index_path, "rb") as index, open(self.data_path, "rb") as data:
+            index.seek(_HEADER.size)
+            for _ in range(count):
+                offset, length, _ = _ENTRY.unpack(index.read(_ENTRY.size))
+                data.seek(offset)
+                yield _decompress(self.codec, data.read(length))
+
+    def close(self):
+        """Release the memory maps."""
+        with self._lock:
+            for name in ("_data", "_index"):
+                mapped = getattr(self, name)
+                if mapped is not None:
+                    mapped.close()
+                    setattr(self, name, None)
+
+    def _mapped(self, name: str, path: str, needed: int) -> mmap.mmap:
+        """Return a read-only map of a file, remapping it if the file grew past the old map."""
+        with self._lock:
+            mapped = getattr(self, name)
+            if mapped is None or len(mapped) < needed:
+                if mapped is not None:
+                    mapped.close()
+                with open(path, "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                setattr(self, name, mapped)
+            return mapped
+
+
+class StoryArchive:
+    """
+    Append-only archive of story results for cold storage.
+
+    Results are stored as individually compressed JSON records in segment
+    files that roll over at ``max_segment_bytes``. Every record has a
+    stable integer id (its position in the whole archive), is read back at
+    random through the segment's offset index and a memory map, and the
+    whole archive can be streamed for analytics without loading it into
+    memory. compact() merges small segments, optionally recompressing them
+    with another codec; record ids do not change.
+
+    One process appends at a time; any number of readers may open the
+    directory concurrently.
+
+    Usage:
+        archive = StoryArchive("archive/")
+        record_id = archive.append(system.create_story(request))
+        result = archive.get(record_id)
+        for result in archive.scan():
+            ...
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        codec: str = "zlib",
+        level: int = 6,
+        max_segment_bytes: int = 64 * 1024 * 1024,
+        fsync: bool = False
+    ):
+        """
+        Initialize the archive.
+
+        Args:
+            directory: Directory holding the segment files (created if missing)
+            codec: Compression for new segments, "zlib" or "lzma"
+            level: Compression level (zlib 0-9, lzma preset 0-9)
+            max_segment_bytes: Start a new segment once the current one is this large
+            fsync: Flush every append to disk before returning
+
+        Raises:
+            ValueError: If the codec is unknown
+        """
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec: {codec}. Use {', '.join(CODECS)}.")
+        self.directory = directory
+        self.codec = codec
+        self.level = level
+        self.max_segment_bytes = max_segment_bytes
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._segments: List[Segment] = []
+        self._first_ids: List[int] = []
+        self._writer: Optional[Tuple[BinaryIO, BinaryIO]] = None
+        self.refresh()
+
+    def refresh(self):
+        """Pick up segments written or compacted by another process."""
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+            self._recover()
+            first_ids = sorted(
+                int(name[:-4]) for name in os.listdir(self.directory)
+                if name.endswith(".seg") and name[:-4].isdigit()
+            )
+            self._segments = [Segment.open(self.directory, first_id) for first_id in first_ids]
+            self._first_ids = first_ids
+
+    def __len__(self) -> int:
+        if not self._segments:
+            return 0
+        last = self._segments[-1]
+        return last.first_id + len(last)
+
+    def append(self, result: Dict) -> int:
+        """
+        Append one result.
+
+        Args:
+            result: A create_story result (any JSON-serializable dictionary)
+
+        Returns:
+            The record id to read it back with get()
+        """
+        raw = json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        with self._lock:
+            data, index = self._current_writer()
+            # Past anything a torn earlier write left behind
+            offset = data.seek(0, os.SEEK_END)
+            stored = _compress(self._segments[-1].codec, raw, self.level)
+            data.write(stored)
+            data.flush()
+            if self.fsync:
+                os.fsync(data.fileno())
+            index.write(_ENTRY.pack(offset, len(stored), len(raw)))
+            index.flush()
+            if self.fsync:
+                os.fsync(index.fileno())
+            segment = self._segments[-1]
+            return segment.first_id + (index.tell() - _HEADER.size) // _ENTRY.size - 1
+
+    def get(self, record_id: int) -> Dict:
+        """
+        Read one result by id.
+
+        Raises:
+            KeyError: If no record has that id
+        """
+        if record_id < 0 or record_id >= len(self):
+            raise KeyError(record_id)
+        segment = self._segments[bisect_right(self._first_ids, record_id) - 1]
+        return json.loads(segment.read(record_id - segment.first_id))
+
+    def scan(self, start: int = 0) -> Iterator[Dict]:
+        """
+        Stream results in id order without loading the archive into memory.
+
+        Args:
+            start: First record id to yield
+        """
+        for segment in list(self._segments):
+            if segment.first_id + len(segment) <= start:
+                continue
+            for position, raw in enumerate(segment.scan()):
+                if segment.first_id + position >= start:
+                    yield json.loads(raw)
+
+    def stats(self) -> Dict:
+        """Return record, segment and compression statistics."""
+        raw = stored = records = 0
+        for segment in self._segments:
+            for position in range(len(segment)):
+                _, length, raw_length = segment.entry(position)
+                stored += length
+                raw += raw_length
+                records += 1
+        return {
+            "records": records,
+            "segments": len(self._segments),
+            "raw_bytes": raw,
+            "stored_bytes": stored,
+            "file_bytes": sum(s.data_size() + os.path.getsize(s.index_path) for s in self._segments),
+            "compression_ratio": raw / stored if stored else 0.0
+        }
+
+    def compact(self, codec: Optional[str] = None, level: Optional[int] = None) -> Dict:
+        """
+        Merge consecutive segments into as few as fit ``max_segment_bytes``.
+
+        Run it while no other process is appending. Segments are rewritten
+        to temporary files and swapped in with a rename, so readers that
+        refresh() afterwards see the merged segments with the same ids. A
+        merge interrupted by a crash is finished (once its files were
+        complete) or discarded (before that) the next time the archive is
+        opened or compacted.
+
+        Args:
+            codec: Recompress with this codec (default: the codec of the
+                first segment in each merged group)
+            level: Compression level for the recompressed records
+
+        Returns:
+            Dictionary with segments and stored bytes before and after
+
+        Raises:
+            ValueError: If the codec is unknown
+        """
+        if codec is not None and codec not in CODECS:
+            raise ValueError(f"Unknown codec: {codec}. Use {', '.join(CODECS)}.")
+        level = self.level if level is None else level
+        before = self.stats()
+        with self._lock:
+            self._close_writer()
+            self._recover(discard=True)
+            groups: List[List[Segment]] = []
+            size = 0
+            for segment in self._segments:
+                if not groups or size + segment.data_size() > self.max_segment_bytes:
+                    groups.append([])
+                    size = 0
+                groups[-1].append(segment)
+                size += segment.data_size()
+            for group in groups:
+                target = codec or group[0].codec
+                if len(group) > 1 or group[0].codec != target:
+                    self._merge(group, target, level)
+        self.refresh()
+        after = self.stats()
+        return {
+            "segments_before": before["segments"],
+            "segments_after": after["segments"],
+            "stored_bytes_before": before["stored_bytes"],
+            "stored_bytes_after": after["stored_bytes"]
+        }
+
+    def close(self):
+        """Close the append files and memory maps."""
+        with self._lock:
+            self._close_writer()
+            for segment in self._segments:
+                segment.close()
+
+    def _merge(self, group: List[Segment], codec: str, level: int):
+        """
+        Rewrite a group of consecutive segments as one segment named after the first.
+
+        The merged files are written and synced in a temporary directory,
+        then a plan naming them and the segments they replace is committed
+        with an atomic rename. Only then are the live files swapped; every
+        step after the commit can be redone by _recover().
+        """
+        first_id = group[0].first_id
+        temp = os.path.join(self.directory, _COMPACT_DIR)
+        os.makedirs(temp, exist_ok=True)
+        merged = Segment.create(temp, first_id, codec)
+        with open(merged.data_path, "ab") as data, open(merged.index_path, "ab") as index:
+            for segment in group:
+                for raw in segment.scan():
+                    stored = _compress(codec, raw, level)
+                    index.write(_ENTRY.pack(data.tell(), len(stored), len(raw)))
+                    data.write(stored)
+            data.flush()
+            index.flush()
+            os.fsync(data.fileno())
+            os.fsync(index.fileno())
+
+        plan = os.path.join(temp, _COMPACT_PLAN)
+        with open(plan + ".tmp", "w") as f:
+            json.dump({"first_id": first_id, "removed": [segment.first_id for segment in group[1:]]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(plan + ".tmp", plan)
+        _fsync_directory(temp)
+
+        for segment in group:
+            segment.close()
+        self._finish_merge(temp)
+
+    def _finish_merge(self, temp: str):
+        """Carry out a committed merge plan; safe to repeat after a crash part way through."""
+        with open(os.path.join(temp, _COMPACT_PLAN)) as f:
+            plan = json.load(f)
+        name = f"{plan['first_id']:012d}"
+        for suffix in (".seg", ".idx"):
+            try:
+                os.replace(os.path.join(temp, name + suffix), os.path.join(self.directory, name + suffix))
+            except FileNotFoundError:
+                pass  # Moved before the interruption
+        for first_id in plan["removed"]:
+            for suffix in (".idx", ".seg"):
+                try:
+                    os.unlink(os.path.join(self.directory, f"{first_id:012d}{suffix}"))
+                except FileNotFoundError:
+                    pass
+        _fsync_directory(self.directory)
+        shutil.rmtree(temp, ignore_errors=True)
+
+    def _recover(self, discard: bool = False):
+        """
+        Deal with a merge a crashed compact() left behind (caller holds the lock).
+
+        Args:
+            discard: Also delete an uncommitted merge (only safe when no
+                other process may be compacting)
+        """
+        temp = os.path.join(self.directory, _COMPACT_DIR)
+        if os.path.exists(os.path.join(temp, _COMPACT_PLAN)):
+            try:
+                self._finish_merge(temp)
+            except FileNotFoundError:
+                pass  # The compacting process finished it meanwhile
+        elif discard and os.path.isdir(temp):
+            shutil.rmtree(temp)
+
+    def _current_writer(self):
+        """Return the open (data, index) files of the segment to append to, rolling over if full."""
+        if self._writer is not None and self._segments[-1].data_size() >= self.max_segment_bytes:
+            self._close_writer()
+        if self._writer is None:
+            if not self._segments or self._segments[-1].data_size() >= self.max_segment_bytes:
+                first_id = len(self)
+                self._segments.append(Segment.create(self.directory, first_id, self.codec))
+                self._first_ids.append(first_id)
+            segment = self._segments[-1]
+            index = open(segment.index_path, "ab")
+            # Drop a torn index entry so new entries stay aligned
+            index.truncate(_HEADER.size + len(segment) * _ENTRY.size)
+            self._writer = (open(segment.data_path, "ab"), index)
+        return self._writer
+
+    def _close_writer(self):
+        """Close the append files of the current segment."""
+        if self._writer is not None:
+            for f in self._writer:
+                f.close()
+            self._writer = None
@@ -113,6 +113,50 @@ class StoryArc:
             guidance += "\n"
         
         return guidance
+    
+    @staticmethod
+    def get_part_budgets(arc_type: str = "three_act", target_words: int = 750) -> List[Dict]:
+        """
+        Split a story's word budget across the parts of an arc.
+        
+        Args:
+            arc_type: Either "three_act" or "five_part"
+            target_words: Total target length of the story in words
+            
+        Returns:
+            List of part dictionaries (in story order) with the template fields
+            plus "key" and "word_budget"
+        """
+        template = StoryArc.get_arc_template(arc_type)
+        
+        parts = []
+        for key, value in template.items():
+            part = dict(value)
+            part["key"] = key
+            part["word_budget"] = round(target_words * value["percentage"] / 100)
+            parts.append(part)
+        
+        return parts
+    
+    @staticmethod
+    def format_part_guidance(part: Dict) -> str:
+        """
+        Format the guidance for a single arc part as a prompt-friendly string.
+        
+        Args:
+            part: A part dictionary from get_part_budgets
+            
+        Returns:
+            Formatted string with the part's goal, elements and word budget
+        """
+        guidance = f"{part['name']} (about {part['word_budget']} words):\n"
+        guidance += f"{part['description']}\n"
+        if 'elements' in part:
+            guidance += "Key elements to include:\n"
+            for element in part['elements']:
+                guidance += f"- {element}\n"
+        
+        return guidance
 
 
 # Age-appropriate guidelines
@@ -0,0 +1,122 @@
+"""Paragraph-level patches for editing stories without full rewrites."""
+
+import json
+import re
+from typing import Dict, List
+
+
+class PatchError(ValueError):
+    """Raised when a patch response cannot be parsed or applied."""
+
+
+def split_paragraphs(story: str) -> List[str]:
+    """
+    Split a story into paragraphs.
+
+    Args:
+        story: The story text
+
+    Returns:
+        List of non-empty paragraphs
+    """
+    return [p.strip() for p in re.split(r"\n\s*\n", story.strip()) if p.strip()]
+
+
+def join_paragraphs(paragraphs: List[str]) -> str:
+    """Join paragraphs back into story text."""
+    return "\n\n".join(paragraphs)
+
+
+def number_paragraphs(story: str) -> str:
+    """
+    Label each paragraph with its number for an edit prompt.
+
+    Args:
+        story: The story text
+
+    Returns:
+        Story text with "[P1]", "[P2]", ... prefixes
+    """
+    return "\n\n".join(
+        f"[P{i}] {paragraph}" for i, paragraph in enumerate(split_paragraphs(story), 1)
+    )
+
+
+def parse_patch_response(response: str) -> List[Dict]:
+    """
+    Parse a model response into paragraph replacements.
+
+    The expected format is a JSON object such as
+    {"replacements": [{"paragraph": 2, "text": "New paragraph..."}]}.
+    The JSON may be wrapped in a Markdown code fence.
+
+    Args:
+        response: Raw response from the LLM
+
+    Returns:
+        List of {"paragraph": int, "text": str} dictionaries
+
+    Raises:
+        PatchError: If the response is not a well-formed patch
+    """
+    match = re.search(r"\{.*\}", response, re.DOTALL)
+    if not match:
+        raise PatchError("No JSON object found in patch response")
+
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError as e:
+        raise PatchError(f"Invalid patch JSON: {e}") from e
+
+    replacements = data.get("replacements") if isinstance(data, dict) else None
+    if not isinstance(replacements, list):
+        raise PatchError("Patch response has no 'replacements' list")
+
+    patches = []
+    for item in replacements:
+        if not isinstance(item, dict):
+            raise PatchError(f"Malformed replacement: {item!r}")
+        try:
+            index = int(item["paragraph"])
+        except (KeyError, TypeError, ValueError):
+            raise PatchError(f"Replacement without a paragraph number: {item!r}")
+        text = item.get("text")
+        if not isinstance(text, str) or not text.strip():
+            raise PatchError(f"Replacement for paragraph {index} has no text")
+        patches.append({"paragraph": index, "text": text.strip()})
+
+    return patches
+
+
+def apply_patches(story: str, patches: List[Dict]) -> str:
+    """
+    Apply paragraph replacements to a story.
+
+    Replacement text may itself contain several paragraphs, which lets the
+    model split or extend a paragraph.
+
+    Args:
+        story: The story text
+        patches: Replacements from parse_patch_response (1-based paragraph numbers)
+
+    Returns:
+        The patched story text
+
+    Raises:
+        PatchError: If a patch targets a missing paragraph or the same paragraph twice
+    """
+    paragraphs = split_paragraphs(story)
+    seen = set()
+
+    for patch in patches:
+        index = patch["paragraph"]
+        if index < 1 or index > len(paragraphs):
+            raise PatchError(
+                f"Paragraph {index} out of range (story has {len(paragraphs)} paragraphs)"
+            )
+        if index in seen:
+            raise PatchError(f"Paragraph {index} replaced more than once")
+        seen.add(index)
+        paragraphs[index - 1] = patch["text"]
+
+    return join_paragraphs(paragraphs)
@@ -0,0 +1,365 @@
+"""Warm pool of pre-generated, pre-judged stories for generic requests."""
+
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from agents.categorizer import CategorizerAgent
+
+
+class StoryPool:
+    """
+    Keeps a small stock of finished stories per (category, arc type).
+
+    Generic requests such as "a story about a dragon" do not benefit much
+    from live generation, so at peak hours they can be served from stock
+    in milliseconds. Each slot is refilled in the background while no live
+    requests are in flight, and entries older than ``max_age_seconds`` are
+    discarded so the pool does not serve the same stale stories forever.
+    Which subject a slot is stocked with follows the subjects requests
+    actually ask for, so popular subjects are the ones kept in stock.
+    """
+
+    # Only the arc create_story serves from the pool is stocked
+    ARC_TYPES = ["three_act"]
+
+    # Subjects that make a request "category-generic". Pooled stories are
+    # generated from these seeds, and a request is only served from the pool
+    # when it asks for one of them and nothing more specific.
+    GENERIC_SUBJECTS = {
+        "ADVENTURE": ["adventure", "journey", "quest", "treasure hunt", "explorer", "pirate"],
+        "FRIENDSHIP": ["friendship", "best friends", "new friend", "friends"],
+        "MAGIC/FANTASY": ["dragon", "wizard", "fairy", "unicorn", "magic", "princess"],
+        "ANIMALS": ["bunny", "cat", "dog", "bear", "elephant", "tiger", "puppy", "kitten", "animals"],
+        "PROBLEM-SOLVING": ["puzzle", "inventor", "robot", "problem"],
+        "EVERYDAY": ["first day of school", "family", "bedtime", "school"],
+        "MIXED": []
+    }
+
+    # How each subject reads after "A story about"; others get "a"/"an"
+    SEED_PHRASES = {
+        "adventure": "an adventure",
+        "treasure hunt": "a treasure hunt",
+        "friendship": "friendship",
+        "best friends": "two best friends",
+        "friends": "friends",
+        "unicorn": "a unicorn",
+        "magic": "magic",
+        "animals": "animals",
+        "first day of school": "the first day of school",
+        "family": "a family",
+        "bedtime": "bedtime",
+        "school": "school",
+        "problem": "a problem to solve"
+    }
+
+    _GENERIC_PATTERN = re.compile(
+        r"^(?:please\s+)?(?:tell\s+me\s+|i\s+want\s+|give\s+me\s+|write\s+)?"
+        r"(?:(?:a|an|one)\s+)?(?:bedtime\s+|short\s+|nice\s+)?story\s+"
+        r"(?:about|with|of)\s+(?:(?:a|an|the|some)\s+)?(?P<subject>[a-z ]+?)$"
+    )
+    _ADJECTIVE_PATTERN = re.compile(
+        r"^(?:please\s+)?(?:tell\s+me\s+|i\s+want\s+|give\s+me\s+|write\s+)?"
+        r"(?:(?:a|an|one)\s+)?(?P<subject>[a-z ]+?)\s+(?:bedtime\s+)?story$"
+    )
+
+    def __init__(
+        self,
+        storyteller,
+        judge,
+        stories_per_slot: int = 3,
+        max_age_seconds: float = 6 * 60 * 60,
+        threshold: float = 7.0,
+        arc_types: Optional[List[str]] = None,
+        idle_seconds: float = 5.0,
+        can_fill: Optional[Callable[[], bool]] = None,
+        max_rejections: int = 3,
+        park_seconds: float = 60 * 60
+    ):
+        """
+        Initialize the story pool.
+
+        Args:
+            storyteller: Storyteller agent used to generate pooled stories
+            judge: Judge agent used to pre-judge pooled stories
+            stories_per_slot: Number of stories to keep per (category, arc type)
+            max_age_seconds: Age after which a pooled story is discarded
+            threshold: Minimum judge score for a story to enter the pool
+            arc_types: Arc types to stock (default: all known arc types)
+            idle_seconds: Quiet time required before the background filler runs
+            can_fill: Checked before each background story; returning False
+                pauses the filler (e.g. while the token budget is low)
+            max_rejections: Consecutive judge rejections after which a slot
+                is parked instead of regenerated
+            park_seconds: How long a parked slot is left unfilled
+        """
+        self.storyteller = storyteller
+        self.judge = judge
+        self.stories_per_slot = stories_per_slot
+        self.max_age_seconds = max_age_seconds
+        self.threshold = threshold
+        self.arc_types = arc_types or list(self.ARC_TYPES)
+        self.idle_seconds = idle_seconds
+        self.can_fill = can_fill
+        self.max_rejections = max_rejections
+        self.park_seconds = park_seconds
+
+        self._slots: Dict[Tuple[str, str], Deque[Dict]] = {}
+        for category in CategorizerAgent.CATEGORIES:
+            if not self.GENERIC_SUBJECTS.get(category):
+                continue
+            for arc_type in self.arc_types:
+                self._slots[(category, arc_type)] = deque()
+
+        self._seed_cursor: Dict[Tuple[str, str], int] = {}
+        self._demand: Dict[str, Counter] = {category: Counter() for category in self.GENERIC_SUBJECTS}
+        self._rejections: Dict[Tuple[str, str], int] = {}
+        self._parked_until: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._last_activity = 0.0
+        self._stop_event = threading.Event()
+        self._filler: Optional[threading.Thread] = None
+        self.stats = {"hits": 0, "misses": 0, "generated": 0, "rejected": 0, "expired": 0, "parked": 0}
+
+    def match_request(self, user_request: str) -> Optional[Tuple[str, str]]:
+        """
+        Check whether a request is category-generic.
+
+        Args:
+            user_request: The user's story request
+
+        Returns:
+            Tuple of (category, subject) if the request only asks for a generic
+            subject, otherwise None
+        """
+        text = re.sub(r"[^a-z ]", " ", user_request.lower())
+        text = re.sub(r"\s+", " ", text).strip()
+
+        match = self._GENERIC_PATTERN.match(text) or self._ADJECTIVE_PATTERN.match(text)
+        if not match:
+            return None
+
+        subject = match.group("subject").strip()
+        for category, subjects in self.GENERIC_SUBJECTS.items():
+            if subject in subjects:
+                return category, subject
+        return None
+
+    def take(self, category: str, arc_type: str = "three_act", subject: Optional[str] = None) -> Optional[Dict]:
+        """
+        Remove and return a fresh pooled story.
+
+        Args:
+            category: The story category
+            arc_type: The story arc type
+            subject: Generic subject the story must be about (any if None)
+
+        Returns:
+            Pool entry dictionary, or None if no fresh matching story is stocked
+        """
+        with self._lock:
+            slot = self._slots.get((category, arc_type))
+            if slot is None:
+                self.stats["misses"] += 1
+                return None
+
+            if subject is not None:
+                self._demand[category][subject] += 1
+            self._evict_stale(slot)
+            for entry in slot:
+                if subject is None or entry["subject"] == subject:
+                    slot.remove(entry)
+                    self.stats["hits"] += 1
+                    return entry
+
+            self.stats["misses"] += 1
+            return None
+
+    def refill(self, max_stories: Optional[int] = None) -> int:
+        """
+        Top up every slot to ``stories_per_slot`` fresh stories.
+
+        Args:
+            max_stories: Stop after generating this many stories (no limit if None)
+
+        Returns:
+            Number of stories generated (accepted or rejected)
+        """
+        generated = 0
+        for key in self._slots_needing_stock():
+            # Bound attempts so a slot whose stories keep failing the judge
+            # cannot monopolise the filler
+            attempts = 2 * self._deficit(key)
+            while attempts > 0 and self._deficit(key) > 0 and key not in self._parked_until:
+                if max_stories is not None and generated >= max_stories:
+                    return generated
+                if self._stop_event.is_set():
+                    return generated
+                self._fill_one(key)
+                generated += 1
+                attempts -= 1
+        return generated
+
+    def freshness(self) -> Dict[str, Dict]:
+        """
+        Report stock level and age per slot.
+
+        Returns:
+            Dictionary keyed by "CATEGORY/arc_type" with count and oldest age in seconds
+        """
+        now = time.time()
+        report = {}
+        with self._lock:
+            for (category, arc_type), slot in self._slots.items():
+                ages = [now - entry["created_at"] for entry in slot]
+                report[f"{category}/{arc_type}"] = {
+                    "count": len(slot),
+                    "oldest_age": max(ages) if ages else None
+                }
+        return report
+
+    @contextmanager
+    def busy(self):
+        """Mark a live request as in flight so the filler stays out of the way."""
+        with self._lock:
+            self._in_flight += 1
+            self._last_activity = time.time()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._last_activity = time.time()
+
+    def is_idle(self) -> bool:
+        """Return True if no live request is running and none ran recently."""
+        with self._lock:
+            return (
+                self._in_flight == 0
+                and time.time() - self._last_activity >= self.idle_seconds
+            )
+
+    def start(self, poll_interval: float = 1.0):
+        """
+        Start the background filler thread.
+
+        Args:
+            poll_interval: Seconds between idle checks
+        """
+        if self._filler and self._filler.is_alive():
+            return
+        self._stop_event.clear()
+        with self._lock:
+            # Let the caller finish starting up before the filler competes for the API
+            self._last_activity = time.time()
+        self._filler = threading.Thread(
+            target=self._fill_when_idle,
+            args=(poll_interval,),
+            name="story-pool-filler",
+            daemon=True
+        )
+        self._filler.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the background filler thread."""
+        self._stop_event.set()
+        if self._filler:
+            self._filler.join(timeout)
+
+    def _fill_when_idle(self, poll_interval: float):
+        """Background loop: generate one story at a time while idle."""
+        while not self._stop_event.wait(poll_interval):
+            while self.is_idle() and not self._stop_event.is_set():
+                if self.can_fill and not self.can_fill():
+                    break
+                if not self.refill(max_stories=1):
+                    break
+
+    @classmethod
+    def seed_request(cls, subject: str) -> str:
+        """Return the request pooled stories about a subject are generated from."""
+        phrase = cls.SEED_PHRASES.get(subject)
+        if phrase is None:
+            phrase = f"{'an' if subject[0] in 'aeiou' else 'a'} {subject}"
+        return f"A story about {phrase}"
+
+    def _slots_needing_stock(self) -> List[Tuple[str, str]]:
+        """Return unparked slot keys ordered from emptiest to fullest."""
+        now = time.time()
+        with self._lock:
+            for slot in self._slots.values():
+                self._evict_stale(slot)
+            for key in [key for key, until in self._parked_until.items() if until <= now]:
+                del self._parked_until[key]
+            keys = [key for key in self._slots if key not in self._parked_until]
+            return sorted(keys, key=lambda key: len(self._slots[key]))
+
+    def _deficit(self, key: Tuple[str, str]) -> int:
+        """Return how many stories a slot is missing."""
+        with self._lock:
+            return self.stories_per_slot - len(self._slots[key])
+
+    def _fill_one(self, key: Tuple[str, str]):
+        """Generate, judge and (if good enough) stock one story for a slot."""
+        category, arc_type = key
+        subject = self._next_subject(key)
+        seed_request = self.seed_request(subject)
+        story = self.storyteller.generate_story(
+            user_request=seed_request,
+            category=category,
+            use_story_arc=True,
+            arc_type=arc_type
+        )
+        evaluation = self.judge.evaluate_story(story)
+
+        with self._lock:
+            self.stats["generated"] += 1
+            if self.judge.should_refine(evaluation, self.threshold):
+                self.stats["rejected"] += 1
+                # A slot whose stories keep failing would otherwise be retried on every idle poll
+                self._rejections[key] = self._rejections.get(key, 0) + 1
+                if self._rejections[key] >= self.max_rejections:
+                    self._parked_until[key] = time.time() + self.park_seconds
+                    self._rejections[key] = 0
+                    self.stats["parked"] += 1
+                return
+            self._rejections[key] = 0
+            self._slots[key].append({
+                "story": story,
+                "evaluation": evaluation,
+                "category": category,
+                "arc_type": arc_type,
+                "subject": subject,
+                "seed_request": seed_request,
+                "created_at": time.time()
+            })
+
+    def _next_subject(self, key: Tuple[str, str]) -> str:
+        """
+        Pick the subject to stock next in a slot.
+
+        Stock follows demand: the subject whose request count is highest
+        relative to the stories already stocked for it wins. Subjects nobody
+        asked for yet are seeded in rotation.
+        """
+        category = key[0]
+        subjects = self.GENERIC_SUBJECTS[category]
+        cursor = self._seed_cursor.get(key, 0)
+        self._seed_cursor[key] = cursor + 1
+        with self._lock:
+            demand = self._demand[category]
+            stocked = Counter(entry["subject"] for entry in self._slots[key])
+        if not demand:
+            return subjects[cursor % len(subjects)]
+        return max(subjects, key=lambda subject: demand[subject] / (stocked[subject] + 1))
+
+    def _evict_stale(self, slot: Deque[Dict]):
+        """Drop entries older than ``max_age_seconds`` (caller holds the lock)."""
+        cutoff = time.time() - self.max_age_seconds
+        while slot and slot[0]["created_at"] < cutoff:
+            slot.popleft()
+            self.stats["expired"] += 1